@@ -1,28 +1,60 @@
 import django_filters
-from django.db.models import Q
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter, SearchFilter
+from portfolio import geo
+from portfolio.amenities import with_amenities
 from portfolio.models import Property
+from portfolio.search import search_backend
 from booking.models import Booking
+from booking.occupancy import occupied_property_ids
+from booking.services import blocking_q, overlap_q
 
 class PropertyFilter(django_filters.FilterSet):
     min_price = django_filters.NumberFilter(field_name="price_per_day", lookup_expr='gte')
     max_price = django_filters.NumberFilter(field_name="price_per_day", lookup_expr='lte')
-    city = django_filters.CharFilter(lookup_expr='icontains')
-    name = django_filters.CharFilter(lookup_expr='icontains')
+    city = django_filters.CharFilter(method='filter_text')
+    guests = django_filters.NumberFilter(field_name="capacity", lookup_expr='gte')
+    name = django_filters.CharFilter(method='filter_text')
     amenities = django_filters.CharFilter(method='filter_amenities')
     available_from = django_filters.DateTimeFilter(method='filter_availability')
     available_to = django_filters.DateTimeFilter(method='filter_availability')
+    near = django_filters.CharFilter(method='filter_near')
+    radius_km = django_filters.NumberFilter(method='filter_radius')
     
     class Meta:
         model = Property
         fields = ['property_type', 'city', 'is_verified_by_platform', 'capacity']
         
+    def filter_text(self, queryset, name, value):
+        # Normalized prefix match through the search index, like the search box (portfolio/search.py)
+        return search_backend().filter(queryset, value, name)
+
     def filter_amenities(self, queryset, name, value):
         if not value:
             return queryset
-        amenities = value.split(',')
-        for amenity_id in amenities:
-             if amenity_id.isdigit():
-                 queryset = queryset.filter(amenities__id=amenity_id)
+        amenity_ids = [int(amenity_id) for amenity_id in value.split(',') if amenity_id.isdigit()]
+        # One bitmask predicate on the property row rather than a join per amenity
+        return with_amenities(queryset, amenity_ids)
+
+    def filter_near(self, queryset, name, value):
+        try:
+            latitude, longitude = (float(part) for part in value.split(','))
+        except ValueError:
+            raise ValidationError({'near': 'صيغة near غير صحيحة، استخدم lat,lng'})
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({'near': 'الإحداثيات خارج النطاق'})
+
+        radius_km = self.form.cleaned_data.get('radius_km') or getattr(settings, 'GEO_SEARCH_DEFAULT_RADIUS_KM', 25)
+        max_radius_km = getattr(settings, 'GEO_SEARCH_MAX_RADIUS_KM', 200)
+        if not 0 < radius_km <= max_radius_km:
+            raise ValidationError({'radius_km': f'نصف القطر يجب أن يكون بين 0 و {max_radius_km} كم'})
+
+        # Geohash cells first, then the exact haversine distance over those candidates
+        return geo.near(queryset, latitude, longitude, float(radius_km))
+
+    def filter_radius(self, queryset, name, value):
+        # Read by filter_near; a radius without a centre filters nothing
         return queryset
 
     def filter_availability(self, queryset, name, value):
@@ -75,21 +107,33 @@ class PropertyFilter(django_filters.FilterSet):
         if timezone.is_naive(end_dt):
             end_dt = timezone.make_aware(end_dt)
             
-        qs = Booking.objects.filter(status__in=['pending', 'confirmed'])
-        
-        # Overlap logic from services.py
-        overlap_q = Q(
-            start_datetime__isnull=False,
-            end_datetime__isnull=False,
-            start_datetime__lt=end_dt,
-            end_datetime__gt=start_dt
-        )
-        
-        legacy_q = Q(start_datetime__isnull=True, end_datetime__isnull=True) & (
-            Q(booking_date=start_dt.date()) | Q(booking_date=end_dt.date())
-        )
-        
-        conflicting_bookings = qs.filter(overlap_q | legacy_q)
-        booked_property_ids = conflicting_bookings.values_list('property_id', flat=True)
+        # Half-day aligned windows are answered by the per-day occupancy table
+        booked_property_ids = occupied_property_ids(start_dt, end_dt)
+        if booked_property_ids is None:
+            qs = Booking.objects.filter(blocking_q())
+
+            # Overlap logic from services.py
+            conflicting_bookings = qs.filter(overlap_q(start_dt, end_dt))
+            booked_property_ids = conflicting_bookings.values_list('property_id', flat=True)
         
         return queryset.exclude(id__in=booked_property_ids)
+
+
+class PropertyOrderingFilter(OrderingFilter):
+    """ترتيب العقارات، مع تجاهل ordering=distance إذا لم يُرسل near"""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and 'distance' not in queryset.query.annotations:
+            ordering = [field for field in ordering if field.lstrip('-') != 'distance'] or self.get_default_ordering(view)
+        return ordering
+
+
+class PropertySearchFilter(SearchFilter):
+    """معامل search عبر فهرس البحث النصي (portfolio/search.py) مرتباً حسب الصلة"""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        return search_backend().search(queryset, text)
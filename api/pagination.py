@@ -1,6 +1,113 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (created_at, id), newest first.
+
+    Each page is one index range scan that starts right after the previous page's last row:
+    no COUNT(*) and no OFFSET, so page 40 costs the same as page 1. The cursor encodes the
+    (created_at, id) of the row to continue from and the direction.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'مؤشر الصفحة غير صالح'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        reverse = False
+        queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            reverse, created_at, pk = position
+            # The range on created_at alone is what the (…, created_at, id) index answers; id breaks ties
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk)
+                ).order_by('created_at', 'id')
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, created_at, pk = b64decode(encoded.encode('ascii')).decode('ascii').split('|')
+            return direction == 'r', datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse):
+        raw = '|'.join(('r' if reverse else 'n', row.created_at.isoformat(), str(row.pk)))
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, b64encode(raw.encode('ascii')).decode('ascii'))
+
+    def get_next_link(self):
+        return self.encode_cursor(self.page[-1], reverse=False) if self.has_next and self.page else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(self.page[0], reverse=True) if self.has_previous and self.page else None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
 
 class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Page numbers by default; `?pagination=cursor` (or a `cursor` from a previous cursor
+    page) switches the request to KeysetPagination for infinite scrolling.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+    @staticmethod
+    def uses_keyset(request):
+        return request.query_params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.uses_keyset(request):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,12 +1,15 @@
 import math
-import secrets
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from accounts.models import UserProfile
 from portfolio.models import Property, Amenity, GalleryImage, PropertyReview
 from booking.models import Booking, BookingGuest, Payment, PaymentProvider
-from booking.services import is_timeslot_available
+from booking.pricing import quote
+from booking.services import is_timeslot_available, commit_booking, issue_guests, nearest_free_slots, parse_guest_names
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.conf import settings
 from django.utils import timezone
 
 # Auth Serializers
@@ -86,7 +89,7 @@ class PropertyListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Property
-        fields = ['id', 'name', 'description', 'city', 'price_per_day', 'main_image', 'property_type', 'capacity', 'amenities', 'is_verified_by_platform', 'privacy_rating']
+        fields = ['id', 'name', 'description', 'city', 'price_per_day', 'main_image', 'property_type', 'capacity', 'amenities', 'is_verified_by_platform', 'privacy_rating', 'avg_rating', 'reviews_count']
         
     def get_main_image(self, obj):
         request = self.context.get('request')
@@ -112,10 +115,30 @@ class PropertyDetailSerializer(serializers.ModelSerializer):
         return None
         
     def get_reviews_avg(self, obj):
-        reviews = obj.reviews.filter(is_approved=True)
-        if not reviews:
-            return 0
-        return sum(r.rating for r in reviews) / len(reviews)
+        # Kept for existing clients; same value as avg_rating
+        return obj.avg_rating or 0
+
+class BusyIntervalSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+
+class NextAvailableSerializer(serializers.Serializer):
+    property_id = serializers.IntegerField()
+    booking_type = serializers.CharField()
+    slots = BusyIntervalSerializer(many=True)
+
+class AvailabilityDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    status = serializers.CharField()
+    morning = serializers.CharField()
+    evening = serializers.CharField()
+
+class AvailabilityCalendarSerializer(serializers.Serializer):
+    property_id = serializers.IntegerField()
+    from_date = serializers.DateField()
+    to_date = serializers.DateField()
+    busy = BusyIntervalSerializer(many=True)
+    days = AvailabilityDaySerializer(many=True)
 
 # Review Serializers
 class ReviewSerializer(serializers.ModelSerializer):
@@ -153,6 +176,13 @@ class BookingSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user', 'status', 'total_price', 'payment_status', 'deposit_amount', 'created_at']
 
+    def validate_guest_names(self, value):
+        try:
+            parse_guest_names(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        return value
+
     def validate(self, data):
         start = data.get('start_datetime')
         end = data.get('end_datetime')
@@ -175,7 +205,16 @@ class BookingSerializer(serializers.ModelSerializer):
                     exclude_booking_id=self.instance.pk if self.instance else None
                 )
                  if not available:
-                    raise serializers.ValidationError('عذراً، هذا العقار محجوز بالفعل في الفترة الزمنية المحددة. يرجى اختيار وقت آخر.')
+                    suggested = nearest_free_slots(
+                        property_obj=property_obj,
+                        booking_type=data.get('booking_type') or (self.instance.booking_type if self.instance else 'full_day'),
+                        around=start,
+                        exclude_booking_id=self.instance.pk if self.instance else None
+                    )
+                    raise serializers.ValidationError({
+                        'non_field_errors': ['عذراً، هذا العقار محجوز بالفعل في الفترة الزمنية المحددة. يرجى اختيار وقت آخر.'],
+                        'suggested_slots': BusyIntervalSerializer(suggested, many=True).data,
+                    })
 
         return data
 
@@ -194,39 +233,20 @@ class BookingSerializer(serializers.ModelSerializer):
 
         total_price = 0
         if property_obj and booking_type:
-            if booking_type == 'half_day' and property_obj.price_half_day:
-                total_price = property_obj.price_half_day
-            else:
-                 total_price = property_obj.price_per_day or 0
+            total_price = quote(property_obj, booking_type, start, end) or 0
         
         validated_data['total_price'] = total_price
         
-        booking = super().create(validated_data)
-        
-        if guest_names:
-            lines = [ln.strip() for ln in guest_names.splitlines() if ln and ln.strip()]
-            if lines:
-                existing_codes = set()
-                serial = 1
-                for name in lines:
-                    code = gen_code()
-                    while code in existing_codes or BookingGuest.objects.filter(booking=booking, code=code).exists():
-                         code = gen_code()
-                    existing_codes.add(code)
-                    BookingGuest.objects.create(
-                        booking=booking,
-                        serial=serial,
-                        name=name,
-                        code=code,
-                    )
-                    serial += 1
+        try:
+            # Lock the property, re-check the window and insert booking + guests atomically
+            with transaction.atomic():
+                booking = commit_booking(Booking(**validated_data))
+                issue_guests(booking, guest_names)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
                     
         return booking
 
-def gen_code():
-    alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
-    return ''.join(secrets.choice(alphabet) for _ in range(6))
-
 class BookingDetailSerializer(serializers.ModelSerializer):
     guests = BookingGuestSerializer(many=True, read_only=True)
     property = PropertyDetailSerializer(read_only=True)
@@ -235,6 +255,38 @@ class BookingDetailSerializer(serializers.ModelSerializer):
         model = Booking
         fields = '__all__'
 
+class AvailabilitySlotSerializer(serializers.Serializer):
+    property_id = serializers.IntegerField()
+    start_datetime = serializers.DateTimeField()
+    end_datetime = serializers.DateTimeField()
+
+    def validate(self, data):
+        if data['end_datetime'] <= data['start_datetime']:
+            raise serializers.ValidationError({'end_datetime': 'وقت الانتهاء يجب أن يكون بعد وقت البدء'})
+        return data
+
+class AvailabilityBatchSerializer(serializers.Serializer):
+    slots = serializers.ListField(
+        child=AvailabilitySlotSerializer(),
+        allow_empty=False,
+        max_length=getattr(settings, 'AVAILABILITY_BATCH_MAX_SIZE', 50),
+    )
+
+class QuoteRequestSerializer(serializers.Serializer):
+    property_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=getattr(settings, 'QUOTE_MAX_PROPERTIES', 100),
+    )
+    booking_type = serializers.ChoiceField(choices=Booking.BOOKING_TYPE_CHOICES)
+    start_datetime = serializers.DateTimeField()
+    end_datetime = serializers.DateTimeField()
+
+    def validate(self, data):
+        if data['end_datetime'] <= data['start_datetime']:
+            raise serializers.ValidationError({'end_datetime': 'وقت الانتهاء يجب أن يكون بعد وقت البدء'})
+        return data
+
 # Payment Serializers
 class PaymentProviderSerializer(serializers.ModelSerializer):
     icon_url = serializers.SerializerMethodField()
@@ -3,10 +3,27 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
 from accounts.models import UserProfile
+from portfolio import geo
+from portfolio.amenities import MASK_BITS, amenity_bits, has_amenities, with_amenities
 from portfolio.models import Property, Amenity, PropertyReview
+from portfolio.forms import PropertySearchForm
+from portfolio.search import search_backend
+from portfolio.search_cache import filters_digest, normalized_filters
+from portfolio.suggest import VERSION_KEY as SUGGEST_VERSION_KEY, suggest_index
+from portfolio.text import normalize
 from booking.models import Booking, PaymentProvider, Payment
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+import sys
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 class AuthTests(APITestCase):
     def setUp(self):
@@ -308,6 +325,539 @@ class PropertyTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
 
+    def test_map_geojson(self):
+        """Map points are public GeoJSON, cut to the bbox and the search filters"""
+        Property.objects.filter(pk=self.property1.pk).update(latitude='15.350000', longitude='44.200000')
+        Property.objects.filter(pk=self.property3.pk).update(latitude='15.400000', longitude='44.250000')
+        Property.objects.filter(pk=self.property2.pk).update(latitude='12.800000', longitude='45.030000')
+        self.client.force_authenticate(user=None)
+        url = reverse('property-map')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['type'], 'FeatureCollection')
+        self.assertEqual(len(response.data['features']), 3)
+
+        response = self.client.get(url, {'bbox': '44.0,15.0,44.5,15.5'})
+        feature = next(f for f in response.data['features'] if f['id'] == self.property1.pk)
+        self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [44.2, 15.35]})
+        self.assertEqual(feature['properties']['slug'], self.property1.slug)
+        self.assertEqual(feature['properties']['name'], self.property1.name)
+        self.assertEqual(feature['properties']['type'], 'chalet')
+        self.assertEqual({f['id'] for f in response.data['features']}, {self.property1.pk, self.property3.pk})
+
+        response = self.client.get(url, {'bbox': '44.0,15.0,44.5,15.5', 'search': 'Budget'})
+        self.assertEqual([f['id'] for f in response.data['features']], [self.property3.pk])
+
+        self.assertEqual(self.client.get(url, {'bbox': '44,15,nope'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'bbox': '45,15,44,16'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_geohash_maintained_on_save(self):
+        self.property1.latitude, self.property1.longitude = Decimal('15.350000'), Decimal('44.200000')
+        self.property1.save(update_fields=['latitude', 'longitude'])
+        self.property1.refresh_from_db()
+        self.assertEqual(self.property1.geohash, geo.encode(15.35, 44.2))
+
+        Property.objects.filter(pk=self.property2.pk).update(latitude='12.800000', longitude='45.030000')
+        call_command('backfill_geohash', stdout=StringIO())
+        self.property2.refresh_from_db()
+        self.assertEqual(self.property2.geohash, geo.encode(12.8, 45.03))
+
+    def test_geohash_prefix_bounds(self):
+        self.assertEqual(geo.prefix_end('u4pr'), 'u4ps')
+        self.assertEqual(geo.prefix_end('u4p9'), 'u4pb')
+        self.assertEqual(geo.prefix_end('u4pz'), 'u4q')
+        self.assertEqual(geo.prefix_end('uzzz'), 'v')
+        self.assertIsNone(geo.prefix_end('zz'))
+        # Every hash under the cell sorts inside [cell, prefix_end(cell)), nothing else does
+        cell = 'u4pr'
+        for hash_ in ('u4pr', 'u4pr0', 'u4przzzzz', 'u4pq', 'u4ps', 'u4ps0'):
+            self.assertEqual(cell <= hash_ < geo.prefix_end(cell), hash_.startswith(cell), hash_)
+        q = geo.within_cells_q(['zz'])
+        self.assertEqual(q.children, [('geohash__gte', 'zz')])
+
+    def test_near_search_and_distance_ordering(self):
+        """Radius search: geohash cells narrow the candidates, haversine decides and sorts"""
+        # Sana'a centre, a property ~5.5 km north, one ~8 km east, and one in Aden (~300 km)
+        for prop, lat, lng in (
+            (self.property1, '15.400000', '44.210000'),
+            (self.property2, '15.350000', '44.285000'),
+            (self.property3, '15.352000', '44.207000'),
+            (self.property4, '12.800000', '45.030000'),
+        ):
+            prop.latitude, prop.longitude = Decimal(lat), Decimal(lng)
+            prop.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.list_url, {'near': '15.35,44.21', 'radius_km': 10, 'ordering': 'distance'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [p['id'] for p in response.data['results']],
+            [self.property3.pk, self.property1.pk, self.property2.pk],
+        )
+        self.assertTrue(any('"geohash" >=' in q['sql'] for q in ctx.captured_queries))
+
+        response = self.client.get(self.list_url, {'near': '15.35,44.21', 'radius_km': 6, 'ordering': '-distance'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.property1.pk, self.property3.pk])
+
+        # Without near, ordering=distance is ignored rather than failing
+        response = self.client.get(self.list_url, {'ordering': 'distance'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+
+        self.assertEqual(self.client.get(self.list_url, {'near': 'nowhere'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.list_url, {'near': '15.35,44.21', 'radius_km': 5000}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+class PropertySearchTests(APITestCase):
+    """Full-text search (portfolio/search.py) behind the search parameter"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.pool = Property.objects.create(
+            name='Pool Chalet', description='Quiet chalet with a heated pool', city='Ibb', capacity=5,
+        )
+        self.garden = Property.objects.create(
+            name='Family Garden', description='Large garden, children play area and a small pool nearby', city='Aden', capacity=20,
+        )
+        self.istiraha = Property.objects.create(
+            name='استراحة الوادي', description='استراحة واسعة مع مسبح', city="Sana'a", capacity=10,
+        )
+        self.url = reverse('property-list')
+
+    def ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [p['id'] for p in response.data['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(search_backend().name, 'fts5')
+        # The name match outranks the passing mention in a description
+        self.assertEqual(self.ids(search='pool'), [self.pool.pk, self.garden.pk])
+        self.assertEqual(self.ids(search='Chal'), [self.pool.pk])
+        self.assertEqual(self.ids(search='garden pool'), [self.garden.pk])
+        self.assertEqual(self.ids(search='مسب'), [self.istiraha.pk])
+        # FTS5 query syntax in the input is treated as plain words
+        self.assertEqual(self.ids(search='pool)" *:('), [self.pool.pk, self.garden.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.pool.name = 'Sunset Chalet'
+        self.pool.save()
+        self.assertEqual(self.ids(search='sunset'), [self.pool.pk])
+        self.garden.delete()
+        self.assertEqual(self.ids(search='pool'), [self.pool.pk])
+
+        Property.objects.filter(pk=self.istiraha.pk).update(description='Mountain view')
+        self.assertEqual(self.ids(search='mountain'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.ids(search='mountain'), [self.istiraha.pk])
+
+    @override_settings(PROPERTY_SEARCH_BACKEND='basic')
+    def test_basic_backend(self):
+        self.assertEqual(set(self.ids(search='pool')), {self.pool.pk, self.garden.pk})
+        self.assertEqual(self.ids(search='استراحه الوادى'), [self.istiraha.pk])
+
+    def test_arabic_spelling_variants_match(self):
+        self.assertEqual(normalize('اِسْتـراحةُ الأمير'), normalize('استراحه الامير'))
+        self.assertEqual(normalize('إب آمنة على'), 'اب امنه علي')
+        for query in ('استراحه', 'اِسْتِرَاحَة', 'استـــراحة الوادى', 'الوادي'):
+            self.assertEqual(self.ids(search=query), [self.istiraha.pk], query)
+
+        self.assertEqual(self.istiraha.search_text, "استراحه الوادي sana'a استراحه واسعه مع مسبح")
+        self.istiraha.name = 'مُنتجع الأمل'
+        self.istiraha.save(update_fields=['name'])
+        self.istiraha.refresh_from_db()
+        self.assertTrue(self.istiraha.search_text.startswith('منتجع الامل '))
+        self.assertEqual(self.ids(search='منتجع امل'), [])
+        self.assertEqual(self.ids(search='منتجع الامل'), [self.istiraha.pk])
+
+    def test_name_and_city_filters_fold_spelling_variants(self):
+        self.istiraha.city = 'إب'
+        self.istiraha.save()
+        for city in ('إب', 'اب', 'أب'):
+            self.assertEqual(self.ids(city=city), [self.istiraha.pk], city)
+        self.assertEqual(self.ids(name='استراحه'), [self.istiraha.pk])
+        self.assertEqual(self.ids(name='اِسْتـراحة الوادى'), [self.istiraha.pk])
+        self.assertEqual(set(self.ids(city='ib')), {self.pool.pk})
+        # Each filter only matches its own column
+        self.assertEqual(self.ids(city='استراحه'), [])
+        self.assertEqual(self.ids(name='aden'), [])
+
+    @override_settings(PROPERTY_SEARCH_BACKEND='basic')
+    def test_name_and_city_filters_basic_backend(self):
+        self.istiraha.city = 'إب'
+        self.istiraha.save()
+        self.pool.description = 'A short drive from Aden'
+        self.pool.save()
+        self.assertEqual(self.ids(name='اِسْتـراحة الوادى'), [self.istiraha.pk])
+        self.assertEqual(self.ids(city='اب'), [self.istiraha.pk])
+        # A city word in a description, or a name word, does not match the city filter
+        self.assertEqual(self.ids(city='aden'), [self.garden.pk])
+        self.assertEqual(self.ids(city='pool'), [])
+        self.assertEqual(self.ids(name='aden'), [])
+
+    def test_search_form_normalizes_query(self):
+        form = PropertySearchForm({'search': ' أسْتراحة  '})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['search'], 'استراحه')
+
+    def test_property_list_page_search(self):
+        response = self.client.get(reverse('portfolio:property_list'), {'search': 'pool'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p.pk for p in response.context['properties']], [self.pool.pk, self.garden.pk])
+
+class PropertyFacetTests(APITestCase):
+    """?facets=true: per-value counts over the filtered properties, cached per filter set"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='faceter', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.pool = Amenity.objects.create(name='Pool')
+        self.wifi = Amenity.objects.create(name='WiFi')
+        specs = [
+            ('Ibb', 'chalet', True, [self.pool, self.wifi]),
+            ('Ibb', 'chalet', False, [self.pool]),
+            ('Ibb', 'garden', False, []),
+            ('Aden', 'chalet', True, [self.wifi]),
+            ('Aden', 'istiraha', False, []),
+        ]
+        for i, (city, property_type, verified, amenities) in enumerate(specs):
+            prop = Property.objects.create(
+                name=f'Facet {i}', city=city, property_type=property_type, is_verified_by_platform=verified, capacity=5,
+            )
+            prop.amenities.set(amenities)
+        self.url = reverse('property-list')
+
+    def facets(self, **params):
+        response = self.client.get(self.url, {'facets': 'true', **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['facets']
+
+    def test_counts_follow_filters(self):
+        facets = self.facets()
+        self.assertEqual(facets['city'], [{'value': 'Ibb', 'count': 3}, {'value': 'Aden', 'count': 2}])
+        self.assertEqual(
+            [(row['value'], row['count']) for row in facets['property_type']],
+            [('chalet', 3), ('garden', 1), ('istiraha', 1)],
+        )
+        self.assertEqual(
+            [(row['name'], row['count']) for row in facets['amenities']], [('Pool', 2), ('WiFi', 2)],
+        )
+        self.assertEqual(facets['is_verified_by_platform'], {'true': 2, 'false': 3})
+
+        facets = self.facets(city='Ibb', amenities=str(self.pool.pk))
+        self.assertEqual(facets['city'], [{'value': 'Ibb', 'count': 2}])
+        self.assertEqual([(row['name'], row['count']) for row in facets['amenities']], [('Pool', 2), ('WiFi', 1)])
+        self.assertEqual(facets['is_verified_by_platform'], {'true': 1, 'false': 1})
+
+        self.assertNotIn('facets', self.client.get(self.url).data)
+
+    def test_cached_by_normalized_filters(self):
+        def group_by_queries(ctx):
+            return [q['sql'] for q in ctx.captured_queries if 'GROUP BY' in q['sql']]
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.facets(city='Ibb', page_size=2)
+        self.assertEqual(len(group_by_queries(ctx)), 4)
+        # Same filters in another order, another page and sort: the facet block comes from the cache
+        with CaptureQueriesContext(connection) as ctx:
+            facets = self.facets(page_size=2, page=2, ordering='-created_at', city=' Ibb ')
+        self.assertEqual(group_by_queries(ctx), [])
+        self.assertEqual(facets['city'], [{'value': 'Ibb', 'count': 3}])
+
+        # Changing a property's amenities starts a new cache generation once it commits
+        with self.captureOnCommitCallbacks() as callbacks:
+            Property.objects.get(name='Facet 2').amenities.add(self.wifi)
+            facets = self.facets(city='Ibb')
+            self.assertEqual([(row['name'], row['count']) for row in facets['amenities']], [('Pool', 2), ('WiFi', 1)])
+        for callback in callbacks:
+            callback()
+        facets = self.facets(city='Ibb')
+        self.assertEqual([(row['name'], row['count']) for row in facets['amenities']], [('Pool', 2), ('WiFi', 2)])
+
+
+class AmenityMaskTests(APITestCase):
+    """Property.amenity_mask (portfolio/amenities.py) behind the amenities filter"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='amenity-filter', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('property-list')
+
+    def ids(self, amenities):
+        response = self.client.get(self.url, {'amenities': amenities, 'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['id'] for item in response.data['results'])
+
+    def test_mask_follows_amenity_changes(self):
+        pool, wifi, bbq = (Amenity.objects.create(name=name) for name in ('Pool', 'WiFi', 'BBQ'))
+        far = Amenity.objects.create(pk=MASK_BITS + 10, name='Beyond the bitset')
+        first = Property.objects.create(name='Mask One', capacity=5)
+        second = Property.objects.create(name='Mask Two', capacity=5)
+        first.amenities.set([pool, wifi, far])
+        second.amenities.add(pool)
+
+        first.refresh_from_db()
+        self.assertEqual(first.amenity_mask, amenity_bits([pool.pk, wifi.pk]))
+        self.assertTrue(has_amenities(first.amenity_mask, [pool.pk, wifi.pk]))
+        self.assertFalse(has_amenities(first.amenity_mask, [bbq.pk]))
+
+        self.assertEqual(self.ids(f'{pool.pk}'), [first.pk, second.pk])
+        self.assertEqual(self.ids(f'{wifi.pk},{pool.pk}'), [first.pk])
+        self.assertEqual(self.ids(f'{pool.pk},{far.pk}'), [first.pk])
+        self.assertEqual(self.ids(f'{bbq.pk}'), [])
+
+        # Reverse side and clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            bbq.property_set.add(second)
+        self.assertEqual(self.ids(f'{pool.pk},{bbq.pk}'), [second.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            pool.property_set.clear()
+        self.assertEqual(self.ids(f'{pool.pk}'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            wifi.delete()
+        first.refresh_from_db()
+        self.assertEqual(first.amenity_mask, 0)
+
+        Property.objects.update(amenity_mask=0)
+        call_command('rebuild_amenity_masks', stdout=StringIO())
+        self.assertEqual(self.ids(f'{bbq.pk}'), [second.pk])
+
+    def test_benchmark_eight_amenities(self):
+        """Benchmark: 10k properties, 8 required amenities: M2M join per amenity vs one bitmask predicate"""
+        amenities = Amenity.objects.bulk_create([Amenity(name=f'Amenity {i}') for i in range(12)])
+        Property.objects.bulk_create([
+            Property(name=f'Bench {i}', slug=f'amenity-bench-{i}', description='', capacity=5) for i in range(10_000)
+        ])
+        through = Property.amenities.through
+        properties = list(Property.objects.order_by('pk').values_list('pk', flat=True))
+        through.objects.bulk_create([
+            through(property_id=pk, amenity_id=amenity.pk)
+            for i, pk in enumerate(properties)
+            for bit, amenity in enumerate(amenities) if i >> bit & 1
+        ], batch_size=5000)
+        call_command('rebuild_amenity_masks', batch_size=2000, stdout=StringIO())
+
+        wanted = [amenity.pk for amenity in amenities[:8]]
+        joined = Property.objects.all()
+        for amenity_id in wanted:
+            joined = joined.filter(amenities__id=amenity_id)
+        masked = with_amenities(Property.objects.all(), wanted)
+        self.assertNotIn('JOIN', str(masked.query))
+
+        timings = {}
+        for label, queryset in (('joins', joined), ('bitmask', masked)):
+            started = timezone.now()
+            for _ in range(5):
+                ids = sorted(queryset.values_list('pk', flat=True))
+            timings[label] = (timezone.now() - started).total_seconds() * 1000 / 5
+            timings[label + ' ids'] = ids
+        self.assertEqual(timings['joins ids'], timings['bitmask ids'])
+        self.assertEqual(len(timings['bitmask ids']), sum(1 for i in range(10_000) if i & 255 == 255))
+        sys.stderr.write(
+            f"\n[amenity filter] 10k properties, 8 amenities: joins {timings['joins']:.1f} ms, bitmask {timings['bitmask']:.1f} ms\n"
+        )
+
+
+class SearchCacheTests(APITestCase):
+    """Cached ordered id lists of property searches (portfolio/search_cache.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached-searcher', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.ibb = [
+            Property.objects.create(name=f'Ibb Chalet {i}', city='Ibb', capacity=10 + i, price_per_day=100)
+            for i in range(15)
+        ]
+        self.aden = Property.objects.create(name='Aden Garden', city='Aden', capacity=30, price_per_day=100)
+        self.url = reverse('property-list')
+        self.html_url = reverse('portfolio:property_list')
+
+    def id_list_queries(self, ctx):
+        # The search itself selects only ids; loading a page selects whole rows by id
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT "portfolio_property"."id" AS "pk" FROM')]
+
+    def test_canonical_filters(self):
+        self.assertEqual(
+            filters_digest(QueryDict('guests=20&city=Ibb&page=3&available_from=2026-10-23T08:00:00%2B03:00&search=%D8%A7%D8%B3%D8%AA%D8%B1%D8%A7%D8%AD%D8%A9')),
+            filters_digest(QueryDict('city=Ibb&available_from=2026-10-23T05:00:00Z&guests=20&search=  %D8%A5%D8%B3%D8%AA%D8%B1%D8%A7%D8%AD%D8%A9 &page_size=5')),
+        )
+        self.assertNotEqual(filters_digest(QueryDict('city=Ibb')), filters_digest(QueryDict('city=Ibb&ordering=price_per_day')))
+        self.assertEqual(
+            normalized_filters({'search': '', 'city': 'Ibb', 'booking_date': date(2026, 10, 23), 'verified_only': False, 'guests': None}),
+            [('booking_date', '2026-10-23'), ('city', 'Ibb')],
+        )
+
+    def test_api_pages_reuse_cached_ids(self):
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.client.get(self.url, {'guests': 12, 'page_size': 5})
+        self.assertEqual(len(self.id_list_queries(ctx)), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(self.url, {'page_size': 5, 'page': 2, 'guests': '12'})
+        self.assertEqual(self.id_list_queries(ctx), [])
+        self.assertEqual(first.data['count'], second.data['count'])
+        self.assertEqual(first.data['count'], 14)
+        expected = list(Property.objects.filter(capacity__gte=12).order_by('-created_at').values_list('pk', flat=True))
+        self.assertEqual([p['id'] for p in first.data['results'] + second.data['results']], expected[:10])
+
+        # A write starts a new generation once it commits
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.ibb[0].capacity = 50
+            self.ibb[0].save()
+            # Not before: a search running meanwhile would cache the old rows under the new generation
+            self.assertEqual(self.client.get(self.url, {'guests': 12}).data['count'], 14)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.url, {'guests': 12}).data['count'], 15)
+
+    def test_html_search_is_scoped_by_city(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.html_url, {'city': 'Ibb', 'page': 2})
+        self.assertEqual(len(self.id_list_queries(ctx)), 1)
+        # The second page loads only its own 3 rows
+        self.assertEqual(len(response.context['properties']), 3)
+        self.assertEqual(response.context['paginator'].count, 15)
+
+        # Writes in another city leave the Ibb entry valid
+        with self.captureOnCommitCallbacks(execute=True):
+            self.aden.name = 'Aden Garden Renamed'
+            self.aden.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.html_url, {'city': 'Ibb'})
+        self.assertEqual(self.id_list_queries(ctx), [])
+
+        # A booking in Ibb drops it: the property is taken that day
+        day = timezone.localdate() + timedelta(days=5)
+        start = timezone.make_aware(datetime.combine(day, time(8)))
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                user=self.user, property=self.ibb[3], booking_date=day, start_datetime=start, end_datetime=start + timedelta(hours=12),
+                status='confirmed', total_price=100, customer_name='Cached Searcher', customer_phone='0500000000',
+            )
+        response = self.client.get(self.html_url, {'city': 'Ibb', 'booking_date': day.isoformat()})
+        self.assertEqual(response.context['paginator'].count, 14)
+
+        # So does moving a property out of the city, and a new review
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ibb[4].city = 'Aden'
+            self.ibb[4].save()
+        self.assertEqual(self.client.get(self.html_url, {'city': 'Ibb'}).context['paginator'].count, 14)
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyReview.objects.create(property=self.ibb[5], user=self.user, rating=4, is_approved=True)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.html_url, {'city': 'Ibb'})
+        self.assertEqual(len(self.id_list_queries(ctx)), 1)
+
+
+class SearchSuggestTests(APITestCase):
+    """GET /api/search/suggest/ from the in-process prefix index (portfolio/suggest.py)"""
+
+    def setUp(self):
+        cache.clear()
+        suggest_index.clear()
+        self.pool = Property.objects.create(name='Pool Chalet', city='Ibb', capacity=5)
+        self.garden = Property.objects.create(name='Family Garden', city='Ibb', property_type='garden', capacity=5)
+        self.istiraha = Property.objects.create(name='استراحة الوادي', city='Aden', property_type='istiraha', capacity=5)
+        self.url = reverse('search_suggest')
+
+    def labels(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['type'], item['label']) for item in response.data['suggestions']]
+
+    def test_prefixes_of_names_cities_and_types(self):
+        self.assertEqual(self.labels('cha'), [('property_type', 'شاليه'), ('property', 'Pool Chalet')])
+        self.assertEqual(self.labels('I'), [('property_type', 'استراحة'), ('city', 'Ibb')])
+        self.assertEqual(self.labels('family gar'), [('property', 'Family Garden')])
+        # Same spelling folds as the search
+        self.assertEqual(self.labels('إستراحه'), [('property_type', 'استراحة'), ('property', 'استراحة الوادي')])
+        self.assertEqual(self.labels('ال'), [('property', 'استراحة الوادي')])
+        self.assertEqual(self.labels(''), [])
+        self.assertEqual(len(self.labels('i', limit=1)), 1)
+
+        # Once built, lookups never reach the database
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'q': 'pool'})
+
+    def test_follows_property_writes(self):
+        self.labels('pool')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pool.name = 'Sunset Villa'
+            self.pool.city = 'Taiz'
+            self.pool.save()
+            Property.objects.create(name='Poolside Rest', city='Aden', capacity=5)
+            self.garden.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('pool'), [('property', 'Poolside Rest')])
+            self.assertEqual(self.labels('sun'), [('property', 'Sunset Villa')])
+            self.assertEqual(self.labels('ibb'), [])
+            self.assertEqual(self.labels('a'), [('city', 'Aden')])
+
+        # A change applied by another worker only shows up as a new version: rebuild from the database
+        Property.objects.filter(pk=self.istiraha.pk).update(name='Hidden Valley')
+        cache.incr(SUGGEST_VERSION_KEY)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.labels('hid'), [('property', 'Hidden Valley')])
+
+    def test_index_dropped_between_check_and_lookup(self):
+        self.labels('pool')
+        ensure_current = suggest_index._ensure_current
+        calls = []
+
+        def raced():
+            ensure_current()
+            calls.append(1)
+            if len(calls) == 1:
+                # Another request's commit bumps the version right after the check
+                suggest_index._keys = None
+
+        with mock.patch.object(suggest_index, '_ensure_current', side_effect=raced):
+            self.assertEqual(self.labels('pool'), [('property', 'Pool Chalet')])
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(SEARCH_SUGGEST_MAX_ENTRIES=12)
+    def test_capped_in_memory(self):
+        Property.objects.bulk_create([Property(name=f'Extra Name {i}', slug=f'extra-{i}', city='Taiz', capacity=5) for i in range(20)])
+        self.labels('x')
+        self.assertLessEqual(len(suggest_index), 12)
+        # Cities and types are always there
+        self.assertEqual(self.labels('taiz'), [('city', 'Taiz')])
+        self.assertEqual(self.labels('garden'), [('property_type', 'حديقة')])
+
+    def test_benchmark_lookup(self):
+        """Micro-benchmark: 10k properties, lookups answered from memory"""
+        cities = ['Ibb', 'Aden', 'Taiz', "Sana'a", 'Hodeidah']
+        words = ['Pool', 'Chalet', 'Garden', 'Family', 'Sunset', 'Valley', 'استراحة', 'الوادي', 'شاليه', 'مسبح']
+        Property.objects.bulk_create([
+            Property(
+                name=f'{words[i % 10]} {words[i // 10 % 10]} {i}', slug=f'suggest-bench-{i}',
+                city=cities[i % 5], capacity=5,
+            )
+            for i in range(10_000)
+        ])
+        started = timezone.now()
+        suggest_index.suggest('warm')
+        build_ms = (timezone.now() - started).total_seconds() * 1000
+
+        prefixes = ['p', 'po', 'cha', 'sun', 'fam g', 'اس', 'الو', 'مسب', 'ta', 'garden 5', 'x', 'valley chalet 12']
+        rounds = 200
+        with self.assertNumQueries(0):
+            started = timezone.now()
+            for _ in range(rounds):
+                for prefix in prefixes:
+                    suggest_index.suggest(prefix)
+            per_lookup_ms = (timezone.now() - started).total_seconds() * 1000 / (rounds * len(prefixes))
+        self.assertLess(per_lookup_ms, 1)
+        sys.stderr.write(
+            f"\n[search suggest] {len(suggest_index)} keys, build {build_ms:.0f} ms, lookup {per_lookup_ms * 1000:.0f} µs\n"
+        )
+
+
 class ReviewTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='reviewer', password='password')
@@ -326,6 +876,85 @@ class ReviewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(PropertyReview.objects.count(), 1)
 
+
+class RatingAggregateTests(APITestCase):
+    """avg_rating / reviews_count / rating_histogram stored on Property (portfolio/ratings.py)"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'rater{i}', password='password') for i in range(4)]
+        self.property = Property.objects.create(name='Rated Chalet', capacity=10, price_per_day=100)
+        self.other = Property.objects.create(name='Other Chalet', capacity=10, price_per_day=100)
+
+    def review(self, user, rating, approved=True, prop=None):
+        return PropertyReview.objects.create(property=prop or self.property, user=user, rating=rating, is_approved=approved)
+
+    def stats(self, prop=None):
+        prop = prop or self.property
+        prop.refresh_from_db()
+        return prop.avg_rating, prop.reviews_count, prop.rating_histogram
+
+    def test_moderation_edits_and_deletes(self):
+        five = self.review(self.users[0], 5)
+        pending = self.review(self.users[1], 2, approved=False)
+        self.assertEqual(self.stats(), (5.0, 1, [0, 0, 0, 0, 1]))
+
+        pending.is_approved = True
+        pending.save()
+        self.assertEqual(self.stats(), (3.5, 2, [0, 1, 0, 0, 1]))
+
+        five.rating = 4
+        five.save()
+        self.assertEqual(self.stats(), (3.0, 2, [0, 1, 0, 1, 0]))
+
+        # Comment-only edits leave the aggregates alone
+        with CaptureQueriesContext(connection) as ctx:
+            five.comment = 'Still good'
+            five.save()
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in ctx.captured_queries))
+
+        # Moving a review updates both properties
+        five.property = self.other
+        five.save()
+        self.assertEqual(self.stats(), (2.0, 1, [0, 1, 0, 0, 0]))
+        self.assertEqual(self.stats(self.other), (4.0, 1, [0, 0, 0, 1, 0]))
+
+        pending.delete()
+        self.assertEqual(self.stats(), (None, 0, [0, 0, 0, 0, 0]))
+
+    def test_admin_actions(self):
+        from django.contrib.admin.sites import site
+        admin = site._registry[PropertyReview]
+        reviews = [self.review(user, rating, approved=False) for user, rating in zip(self.users, (5, 4, 4, 1))]
+        self.review(self.users[0], 3, approved=False, prop=self.other)
+
+        admin.approve_reviews(None, PropertyReview.objects.filter(pk__in=[r.pk for r in reviews]))
+        self.assertEqual(self.stats(), (3.5, 4, [1, 0, 0, 2, 1]))
+        self.assertEqual(self.stats(self.other), (None, 0, [0, 0, 0, 0, 0]))
+
+        admin.reject_reviews(None, PropertyReview.objects.filter(pk=reviews[-1].pk))
+        self.assertEqual(self.stats(), (4.33, 3, [0, 0, 0, 2, 1]))
+
+    def test_recompute_command_and_reads(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        Property.objects.filter(pk=self.property.pk).update(avg_rating=None, reviews_count=0, rating_histogram=[0] * 5)
+        call_command('recompute_ratings', stdout=StringIO())
+        self.assertEqual(self.stats(), (4.0, 2, [0, 0, 1, 0, 1]))
+
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('property-detail', kwargs={'pk': self.property.pk}))
+        self.assertEqual(response.data['reviews_avg'], 4.0)
+        self.assertEqual(response.data['rating_histogram'], [0, 0, 1, 0, 1])
+
+        # The HTML list reads the stored values instead of aggregating reviews
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('portfolio:property_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('portfolio_propertyreview' in q['sql'] for q in ctx.captured_queries))
+
+        # Deleting the property does not try to refresh it once per review
+        self.property.delete()
+
 class BookingTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='client', password='password')
@@ -354,6 +983,23 @@ class BookingTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Booking.objects.count(), 1)
         
+    def test_invalid_property_takes_no_lock(self):
+        start = timezone.now() + timedelta(days=1)
+        data = {
+            'property': 'not-a-property',
+            'start_datetime': start,
+            'end_datetime': start + timedelta(days=1),
+            'booking_type': 'full_day',
+            'customer_name': 'Client User Name One',
+            'customer_phone': '0500000000'
+        }
+        with mock.patch('api.views.property_write_lock') as lock:
+            response = self.client.post(self.list_url, data, follow=True)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('property', response.data)
+        lock.assert_not_called()
+        self.assertEqual(Booking.objects.count(), 0)
+
     def test_overlap(self):
         start = timezone.now() + timedelta(days=5)
         end = start + timedelta(days=1)
@@ -378,6 +1024,30 @@ class BookingTests(APITestCase):
         }
         response = self.client.post(self.list_url, data, follow=True)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['suggested_slots']), 3)
+
+    def test_next_available(self):
+        day = timezone.localdate() + timedelta(days=7)
+        morning = timezone.make_aware(datetime.combine(day, time(8, 0)))
+        Booking.objects.create(
+            user=self.user,
+            property=self.property,
+            booking_date=day,
+            start_datetime=morning,
+            end_datetime=morning + timedelta(hours=6),
+            status='confirmed',
+            total_price=100,
+            customer_name='Morning User',
+            customer_phone='0500000000'
+        )
+        url = reverse('property-next-available', args=[self.property.id])
+        response = self.client.get(url, {'booking_type': 'half_day', 'from': morning.isoformat(), 'count': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['slots']), 2)
+        self.assertEqual(response.data['slots'][0]['start'], (morning + timedelta(hours=6)).isoformat())
+
+        response = self.client.get(url, {'booking_type': 'hourly'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_check_availability(self):
         start = timezone.now() + timedelta(days=10)
@@ -392,6 +1062,61 @@ class BookingTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['available'])
 
+    @staticmethod
+    def overlap_queries(ctx):
+        # Availability probes are exists() queries; occupancy refreshes read the same range without LIMIT
+        return [q for q in ctx.captured_queries
+                if '"booking_booking"."end_datetime" >' in q['sql'] and q['sql'].endswith('LIMIT 1')]
+
+    def test_create_runs_one_overlap_query(self):
+        start = timezone.now() + timedelta(days=3)
+        data = {
+            'property': self.property.id,
+            'start_datetime': start,
+            'end_datetime': start + timedelta(hours=6),
+            'booking_type': 'half_day',
+            'customer_name': 'Client User Name One',
+            'customer_phone': '0500000000'
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.list_url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.overlap_queries(ctx)), 1)
+
+    def test_cancel_runs_no_overlap_query(self):
+        start = timezone.now() + timedelta(days=3)
+        booking = Booking.objects.create(
+            user=self.user,
+            property=self.property,
+            booking_date=start.date(),
+            start_datetime=start,
+            end_datetime=start + timedelta(hours=6),
+            total_price=100,
+            customer_name='Client User Name One',
+            customer_phone='0500000000'
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('booking-cancel', args=[booking.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.overlap_queries(ctx), [])
+
+    @override_settings(BOOKING_MAX_GUESTS=2)
+    def test_create_with_too_many_guests(self):
+        start = timezone.now() + timedelta(days=3)
+        data = {
+            'property': self.property.id,
+            'start_datetime': start,
+            'end_datetime': start + timedelta(hours=6),
+            'booking_type': 'half_day',
+            'customer_name': 'Client User Name One',
+            'customer_phone': '0500000000',
+            'guest_names': 'Guest One\nGuest Two\nGuest Three'
+        }
+        response = self.client.post(self.list_url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('guest_names', response.data)
+        self.assertEqual(Booking.objects.count(), 0)
+
 class PaymentTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='client', password='password')
@@ -423,3 +1148,281 @@ class PaymentTests(APITestCase):
         self.booking.refresh_from_db()
         self.assertEqual(self.booking.payment_status, 'pending')
 
+
+class AvailabilityCalendarTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.property = Property.objects.create(name='Calendar Property', price_per_day=100, capacity=5)
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.url = reverse('property-availability', kwargs={'pk': self.property.pk})
+
+    def _book(self, day, start_hour=None, end_hour=None, status='confirmed'):
+        from datetime import datetime, time
+        start = end = None
+        if start_hour is not None:
+            start = timezone.make_aware(datetime.combine(day, time(start_hour)))
+            end = timezone.make_aware(datetime.combine(day, time(end_hour)))
+        return Booking.objects.create(
+            property=self.property,
+            booking_date=day,
+            start_datetime=start,
+            end_datetime=end,
+            status=status,
+            total_price=100,
+            customer_name='Calendar User',
+            customer_phone='0500000000'
+        )
+
+    def test_month_calendar(self):
+        self._book(self.day, 14, 20)
+        self._book(self.day + timedelta(days=1), 8, 14)
+        self._book(self.day + timedelta(days=1), 14, 20)
+        self._book(self.day + timedelta(days=2))  # legacy date-only booking
+        self._book(self.day + timedelta(days=3), 8, 14, status='cancelled')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {
+                'from': self.day.isoformat(),
+                'to': (self.day + timedelta(days=3)).isoformat(),
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        days = response.data['days']
+        self.assertEqual(len(days), 4)
+        self.assertEqual((days[0]['status'], days[0]['morning'], days[0]['evening']), ('partial', 'free', 'busy'))
+        self.assertEqual(days[1]['status'], 'busy')
+        self.assertEqual(days[2]['status'], 'busy')
+        self.assertEqual((days[3]['status'], days[3]['morning'], days[3]['evening']), ('free', 'free', 'free'))
+        # The adjacent morning/evening blocks of the second day merge into one interval
+        self.assertEqual(len(response.data['busy']), 3)
+
+    def test_invalid_range(self):
+        response = self.client.get(self.url, {'from': self.day.isoformat(), 'to': (self.day - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'from': self.day.isoformat(), 'to': (self.day + timedelta(days=200)).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'from': 'not-a-date'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class BatchAvailabilityTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.properties = [
+            Property.objects.create(name=f'Batch Property {i}', price_per_day=100, capacity=5)
+            for i in range(50)
+        ]
+        self.start = timezone.now() + timedelta(days=2)
+        self.end = self.start + timedelta(hours=6)
+        Booking.objects.create(
+            property=self.properties[0],
+            booking_date=self.start.date(),
+            start_datetime=self.start,
+            end_datetime=self.end,
+            status='pending',
+            total_price=100,
+            customer_name='Batch User',
+            customer_phone='0500000000'
+        )
+        self.url = reverse('booking-check-availability-batch')
+
+    def _slots(self, properties):
+        return [
+            {'property_id': p.id, 'start_datetime': self.start.isoformat(), 'end_datetime': self.end.isoformat()}
+            for p in properties
+        ]
+
+    def test_batch_results(self):
+        slots = self._slots(self.properties[:3]) + [
+            {'property_id': 99999, 'start_datetime': self.start.isoformat(), 'end_datetime': self.end.isoformat()},
+            {'property_id': self.properties[0].id, 'start_datetime': self.end.isoformat(),
+             'end_datetime': (self.end + timedelta(hours=2)).isoformat()},
+        ]
+        response = self.client.post(self.url, {'slots': slots}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        available = [r['available'] for r in response.data['results']]
+        self.assertEqual(available, [False, True, True, None, True])
+        self.assertIn('error', response.data['results'][3])
+
+    def test_only_requested_windows_are_loaded(self):
+        from booking.services import booking_interval, check_timeslots_availability
+
+        prop = self.properties[0]
+        for days in (30, 90, 180):
+            day_start = self.start + timedelta(days=days)
+            Booking.objects.create(
+                property=prop, booking_date=day_start.date(), start_datetime=day_start,
+                end_datetime=day_start + timedelta(hours=6), status='confirmed', total_price=100,
+                customer_name='Batch User', customer_phone='0500000000',
+            )
+        far = self.start + timedelta(days=365)
+        with mock.patch('booking.services.booking_interval', wraps=booking_interval) as loaded:
+            results = check_timeslots_availability([
+                (prop.pk, self.start, self.end),
+                (prop.pk, far, far + timedelta(hours=6)),
+                (self.properties[1].pk, self.start, self.end),
+            ])
+        self.assertEqual([r['available'] for r in results], [False, True, True])
+        # Only the booking overlapping a requested slot, not the months between the slots
+        self.assertEqual(loaded.call_count, 1)
+
+    def test_batch_size_cap(self):
+        slots = self._slots(self.properties) * 2
+        response = self.client.post(self.url, {'slots': slots}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_constant_in_batch_size(self):
+        """Benchmark: the number of queries does not depend on how many triples are checked"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = {}
+        for size in (1, 10, 50):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.url, {'slots': self._slots(self.properties[:size])}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), size)
+            counts[size] = len(ctx.captured_queries)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+class QuoteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.properties = [
+            Property.objects.create(name=f'Quoted Property {i}', price_per_day=100 * (i + 1), price_half_day=60, capacity=5)
+            for i in range(100)
+        ]
+        self.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=2), time(14, 0)))
+        self.end = self.start + timedelta(days=2)
+        Booking.objects.create(
+            property=self.properties[0],
+            booking_date=self.start.date(),
+            start_datetime=self.start,
+            end_datetime=self.start + timedelta(hours=6),
+            status='confirmed',
+            total_price=100,
+            customer_name='Quote User',
+            customer_phone='0500000000'
+        )
+        self.url = reverse('quotes')
+
+    def _post(self, property_ids, booking_type='overnight'):
+        return self.client.post(self.url, {
+            'property_ids': property_ids,
+            'booking_type': booking_type,
+            'start_datetime': self.start.isoformat(),
+            'end_datetime': self.end.isoformat(),
+        }, format='json')
+
+    @override_settings(DEPOSIT_PERCENT=20)
+    def test_quote_results(self):
+        response = self._post([self.properties[0].id, self.properties[1].id, 99999])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, second, missing = response.data['results']
+        self.assertEqual((first['total'], first['deposit'], first['available']), (200, 40, False))
+        self.assertEqual((second['total'], second['deposit'], second['available']), (400, 80, True))
+        self.assertEqual(missing['property_id'], 99999)
+        self.assertIn('error', missing)
+
+    def test_quote_validation(self):
+        self.assertEqual(self._post([p.id for p in self.properties] + [99999]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._post([self.properties[0].id], booking_type='hourly').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_constant_in_property_count(self):
+        """Benchmark: quoting 100 properties costs the same number of queries as quoting one"""
+        counts = {}
+        for size in (1, 10, 100):
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self._post([p.id for p in self.properties[:size]])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), size)
+            counts[size] = len(ctx.captured_queries)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+class KeysetPaginationTests(APITestCase):
+    """?pagination=cursor: (created_at, id) keyset pages for properties, bookings and reviews"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='scroller', password='password')
+        self.client.force_authenticate(user=self.user)
+        Property.objects.bulk_create([
+            Property(name=f'Scroll Property {i}', slug=f'scroll-{i}', description='', capacity=5) for i in range(1000)
+        ])
+        # Ties on created_at are broken by id
+        Property.objects.filter(pk__in=Property.objects.order_by('pk').values('pk')[100:160]).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        self.url = reverse('property-list')
+
+    def walk(self, url, params):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_property_once_in_order(self):
+        ids, last = self.walk(self.url, {'pagination': 'cursor', 'page_size': 50})
+        self.assertEqual(ids, list(Property.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+        self.assertNotIn('count', last.data)
+
+        # previous goes back exactly one page
+        back = self.client.get(last.data['previous'])
+        self.assertEqual([item['id'] for item in back.data['results']], ids[-100:-50])
+        self.assertIsNotNone(back.data['previous'])
+        self.assertEqual(self.client.get(back.data['next']).data['results'], last.data['results'])
+
+        self.assertEqual(self.client.get(self.url, {'cursor': 'bm90LWEtY3Vyc29y'}).status_code, status.HTTP_404_NOT_FOUND)
+        # Without the parameter the page-number format is unchanged
+        self.assertEqual(self.client.get(self.url).data['count'], 1000)
+
+    def test_bookings_and_reviews(self):
+        prop = Property.objects.order_by('pk').first()
+        other = User.objects.create_user(username='other', password='password')
+        for i in range(25):
+            Booking.objects.create(
+                property=prop, user=self.user if i % 5 else other, booking_date=timezone.localdate(),
+                start_datetime=timezone.now() + timedelta(days=i + 1), end_datetime=timezone.now() + timedelta(days=i + 1, hours=2),
+                total_price=100, customer_name='Scroller', customer_phone='0500000000',
+            )
+        ids, _ = self.walk(reverse('booking-list'), {'pagination': 'cursor', 'page_size': 7})
+        self.assertEqual(ids, list(Booking.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+        users = [User.objects.create_user(username=f'reviewer{i}', password='password') for i in range(12)]
+        PropertyReview.objects.bulk_create([
+            PropertyReview(property=prop, user=user, rating=4, is_approved=i != 0) for i, user in enumerate(users)
+        ])
+        ids, _ = self.walk(reverse('review-list'), {'pagination': 'cursor', 'page_size': 5, 'property': prop.pk})
+        self.assertEqual(len(ids), 11)
+
+    def test_per_page_cost_does_not_grow_with_depth(self):
+        """Benchmark: cursor pages run the same single query at page 1 and page 40"""
+        timings, queries, counts, response = {}, {}, {}, None
+        for depth in range(1, 41):
+            params = {'pagination': 'cursor'} if response is None else None
+            url = self.url if response is None else response.data['next']
+            started = timezone.now()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params)
+            timings[depth] = (timezone.now() - started).total_seconds() * 1000
+            queries[depth] = [q['sql'] for q in ctx.captured_queries if 'FROM "portfolio_property" ' in q['sql']]
+            counts[depth] = len(ctx.captured_queries)
+            self.assertEqual(len(response.data['results']), 20)
+
+        for depth in (1, 40):
+            self.assertEqual(len(queries[depth]), 1, queries[depth])
+            self.assertNotIn('COUNT(', queries[depth][0])
+            self.assertNotIn('OFFSET', queries[depth][0])
+        self.assertEqual(counts[1], counts[40])
+
+        with CaptureQueriesContext(connection) as ctx, override_settings(PROPERTY_SEARCH_CACHE_MAX_IDS=0):
+            self.client.get(self.url, {'page': 40})
+        self.assertTrue(any('OFFSET 780' in q['sql'] for q in ctx.captured_queries))
+        sys.stderr.write(
+            f"\n[keyset pagination] page 1: {timings[1]:.1f} ms, page 10: {timings[10]:.1f} ms, page 40: {timings[40]:.1f} ms\n"
+        )
@@ -23,7 +23,10 @@ urlpatterns = [
 
     # Properties
     path('properties/search/', PropertyViewSet.as_view({'get': 'list'}), name='property_search'),
+    path('search/suggest/', SearchSuggestView.as_view(), name='search_suggest'),
     
+    path('quotes/', QuoteView.as_view(), name='quotes'),
+
     # Amenities
     path('amenities/', AmenityListView.as_view(), name='amenity_list'),
 
@@ -3,23 +3,33 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.utils.dateparse import parse_datetime
+from django.utils.dateparse import parse_datetime, parse_date
 from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
 
 from accounts.models import UserProfile
+from portfolio.facets import cached_property_facets
 from portfolio.models import Property, Amenity, PropertyReview
+from portfolio.search_cache import cached_search
+from portfolio.suggest import suggest_index
 from booking.models import Booking, Payment, PaymentProvider, BookingGuest
-from booking.services import is_timeslot_available
+from booking.pricing import deposit_for, quote_many
+from booking.services import (
+    is_timeslot_available, get_availability_calendar, check_timeslots_availability, property_write_lock,
+    nearest_free_slots, HOLD_EXPIRED_MESSAGE,
+)
 from booking.utils import generate_qr_code_for_guest
 
 from .serializers import *
 from .permissions import *
 from .pagination import StandardResultsSetPagination
-from .filters import PropertyFilter
+from .filters import PropertyFilter, PropertyOrderingFilter, PropertySearchFilter
 
 # Auth
 class RegisterView(generics.CreateAPIView):
@@ -78,12 +88,17 @@ class DeleteAccountView(views.APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 # Properties
+AVAILABILITY_MAX_DAYS = 92
+
+# Upper bound of the `count` parameter of the next-available endpoint
+NEXT_AVAILABLE_MAX_COUNT = 10
+
 class PropertyViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Property.objects.all()
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PropertySearchFilter, PropertyOrderingFilter]
     filterset_class = PropertyFilter
     search_fields = ['name', 'description', 'city']
-    ordering_fields = ['price_per_day', 'created_at']
+    ordering_fields = ['price_per_day', 'created_at', 'distance']
     pagination_class = StandardResultsSetPagination
 
     def get_serializer_class(self):
@@ -91,6 +106,24 @@ class PropertyViewSet(viewsets.ReadOnlyModelViewSet):
             return PropertyDetailSerializer
         return PropertyListSerializer
 
+    def list(self, request, *args, **kwargs):
+        """
+        قائمة العقارات؛ مع ?facets=true تُضاف كتلة facets بعدد العقارات المطابقة للفلاتر
+        لكل مدينة ونوع ومرفق وحالة توثيق.
+        """
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets', '').lower() in ('1', 'true'):
+            queryset = self.filter_queryset(self.get_queryset())
+            response.data['facets'] = cached_property_facets(queryset, request.query_params)
+        return response
+
+    def paginate_queryset(self, queryset):
+        # Page numbers page the cached id list of the search (portfolio/search_cache.py);
+        # cursor pages need the queryset itself
+        if self.action == 'list' and not self.paginator.uses_keyset(self.request):
+            queryset = cached_search(queryset, 'api', self.request.query_params)
+        return super().paginate_queryset(queryset)
+
     @action(detail=True, methods=['get'])
     def gallery(self, request, pk=None):
         property_obj = self.get_object()
@@ -98,11 +131,129 @@ class PropertyViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = GalleryImageSerializer(images, many=True, context={'request': request})
         return Response(serializer.data)
 
+    # Public like the HTML property list that embeds it
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def map(self, request):
+        """
+        نقاط العقارات على الخريطة بصيغة GeoJSON مختصرة، داخل المستطيل bbox
+        (min_lng,min_lat,max_lng,max_lat) ومع نفس فلاتر البحث في القائمة.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(latitude__isnull=False, longitude__isnull=False)
+
+        bbox = request.query_params.get('bbox')
+        if bbox:
+            try:
+                bounds = [Decimal(part) for part in bbox.split(',')]
+            except ArithmeticError:
+                bounds = []
+            if len(bounds) != 4 or not all(value.is_finite() for value in bounds):
+                return Response({"error": "صيغة bbox غير صحيحة، استخدم min_lng,min_lat,max_lng,max_lat"}, status=status.HTTP_400_BAD_REQUEST)
+            min_lng, min_lat, max_lng, max_lat = bounds
+            if min_lat > max_lat or min_lng > max_lng:
+                return Response({"error": "حدود bbox غير صحيحة"}, status=status.HTTP_400_BAD_REQUEST)
+            # latitude first: the range on the leading column of property_lat_lng_idx
+            queryset = queryset.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+
+        limit = getattr(settings, 'PROPERTY_MAP_MAX_FEATURES', 1000)
+        rows = list(
+            queryset.order_by().values('id', 'name', 'slug', 'latitude', 'longitude', 'price_per_day', 'property_type')[:limit + 1]
+        )
+        features = [
+            {
+                'type': 'Feature',
+                'id': row['id'],
+                'geometry': {'type': 'Point', 'coordinates': [float(row['longitude']), float(row['latitude'])]},
+                'properties': {
+                    'name': row['name'],
+                    'slug': row['slug'],
+                    'price': row['price_per_day'],
+                    'type': row['property_type'],
+                },
+            }
+            for row in rows[:limit]
+        ]
+        return Response({'type': 'FeatureCollection', 'features': features, 'truncated': len(rows) > limit})
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        property_obj = self.get_object()
+        from_str = request.query_params.get('from')
+        to_str = request.query_params.get('to')
+
+        try:
+            date_from = parse_date(from_str) if from_str else timezone.localdate()
+            date_to = parse_date(to_str) if to_str else None
+        except ValueError:
+            date_from = date_to = None
+        if date_from and not to_str:
+            date_to = date_from + timedelta(days=30)
+
+        if not date_from or not date_to:
+            return Response({"error": "صيغة التاريخ غير صحيحة، استخدم YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        if date_to < date_from:
+            return Response({"error": "تاريخ النهاية يجب أن يكون بعد تاريخ البداية"}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= AVAILABILITY_MAX_DAYS:
+            return Response({"error": f"لا يمكن أن تتجاوز الفترة {AVAILABILITY_MAX_DAYS} يوماً"}, status=status.HTTP_400_BAD_REQUEST)
+
+        calendar = get_availability_calendar(property_obj=property_obj, date_from=date_from, date_to=date_to)
+        serializer = AvailabilityCalendarSerializer({
+            'property_id': property_obj.pk,
+            'from_date': date_from,
+            'to_date': date_to,
+            **calendar,
+        })
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='next-available')
+    def next_available(self, request, pk=None):
+        property_obj = self.get_object()
+        booking_type = request.query_params.get('booking_type', 'full_day')
+        if booking_type not in dict(Booking.BOOKING_TYPE_CHOICES):
+            return Response({"error": "نوع الحجز غير صحيح"}, status=status.HTTP_400_BAD_REQUEST)
+
+        from_str = request.query_params.get('from')
+        count_str = request.query_params.get('count')
+        try:
+            around = parse_datetime(from_str) if from_str else timezone.now()
+            count = min(max(int(count_str), 1), NEXT_AVAILABLE_MAX_COUNT) if count_str else None
+        except ValueError:
+            around = None
+        if around is None:
+            return Response({"error": "صيغة المدخلات غير صحيحة: from بصيغة ISO 8601 و count رقم"}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(around):
+            around = timezone.make_aware(around)
+
+        slots = nearest_free_slots(property_obj=property_obj, booking_type=booking_type, around=around, count=count)
+        serializer = NextAvailableSerializer({
+            'property_id': property_obj.pk,
+            'booking_type': booking_type,
+            'slots': slots,
+        })
+        return Response(serializer.data)
+
 class AmenityListView(generics.ListAPIView):
     queryset = Amenity.objects.all()
     serializer_class = AmenitySerializer
     pagination_class = None 
 
+
+class SearchSuggestView(views.APIView):
+    """
+    اقتراحات مربع البحث أثناء الكتابة: أنواع العقارات والمدن وأسماء العقارات التي تبدأ
+    كلماتها بالنص q، من فهرس في الذاكرة دون استعلام قاعدة البيانات.
+    """
+    permission_classes = [permissions.AllowAny]
+    max_limit = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+        return Response({'query': query, 'suggestions': suggest_index.suggest(query, max(limit, 1))})
+
+
 # Reviews
 class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
@@ -137,6 +288,17 @@ class BookingViewSet(viewsets.ModelViewSet):
             return BookingDetailSerializer
         return BookingSerializer
 
+    def create(self, request, *args, **kwargs):
+        try:
+            property_id = int(request.data.get('property'))
+        except (TypeError, ValueError):
+            # No property to lock: the serializer rejects the input or books no window
+            return super().create(request, *args, **kwargs)
+        # Validate and insert under the property's write lock so the serializer and the
+        # model share one overlap check
+        with property_write_lock(property_id):
+            return super().create(request, *args, **kwargs)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         booking = self.get_object()
@@ -176,6 +338,20 @@ class BookingViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='check-availability-batch')
+    def check_availability_batch(self, request):
+        serializer = AvailabilityBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = check_timeslots_availability(
+            (slot['property_id'], slot['start_datetime'], slot['end_datetime'])
+            for slot in serializer.validated_data['slots']
+        )
+        for result in results:
+            if result['available'] is None:
+                result['error'] = 'العقار غير موجود'
+        return Response({"results": results})
+
 
 class BookingCancelView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -193,6 +369,46 @@ class BookingCancelView(views.APIView):
         booking.save()
         return Response({"status": "تم إلغاء الحجز"})
 
+
+class QuoteView(views.APIView):
+    """
+    تسعير نافذة حجز واحدة لعدة عقارات دفعة واحدة: الإجمالي والعربون والتوفر لكل عقار.
+    عدد الاستعلامات ثابت مهما كان عدد العقارات.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        serializer = QuoteRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        start, end = data['start_datetime'], data['end_datetime']
+        property_ids = list(dict.fromkeys(data['property_ids']))
+
+        availability = check_timeslots_availability((pk, start, end) for pk in property_ids)
+        totals = quote_many(property_ids, data['booking_type'], start, end)
+
+        results = []
+        for slot in availability:
+            property_id = slot['property_id']
+            if slot['available'] is None:
+                results.append({'property_id': property_id, 'error': 'العقار غير موجود'})
+                continue
+            total = totals.get(property_id)
+            results.append({
+                'property_id': property_id,
+                'total': total,
+                'deposit': deposit_for(total) if total is not None else None,
+                'available': slot['available'],
+            })
+        return Response({
+            'booking_type': data['booking_type'],
+            'start_datetime': start,
+            'end_datetime': end,
+            'deposit_percent': getattr(settings, 'DEPOSIT_PERCENT', 0),
+            'results': results,
+        })
+
+
 # Payments
 class PaymentProviderListView(generics.ListAPIView):
     queryset = PaymentProvider.objects.filter(is_active=True)
@@ -207,6 +423,8 @@ class PaymentSubmitView(generics.CreateAPIView):
     def perform_create(self, serializer):
         booking_id = self.request.data.get('booking')
         booking = get_object_or_404(Booking, id=booking_id, user=self.request.user)
+        if booking.hold_expired():
+            raise ValidationError({"booking": HOLD_EXPIRED_MESSAGE})
         
         if hasattr(booking, 'payment'):
              # If payment exists, maybe update it? Or fail?
@@ -5,3 +5,7 @@ class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
     verbose_name = 'إدارة الحجوزات'
+
+    def ready(self):
+        """تحميل الإشارات عند تشغيل التطبيق"""
+        import booking.signals
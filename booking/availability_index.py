@@ -0,0 +1,151 @@
+"""
+Optional in-process index of the blocking bookings of each property.
+
+Every property gets a sorted list of [start, end) intervals that is built lazily from
+the database on first use and kept in a bounded LRU. Entries are invalidated by the
+Booking post_save/post_delete signals (see booking/signals.py) and carry a version
+stamp stored in the Django cache, so that other workers sharing the same cache
+backend notice the change and rebuild their copy on the next lookup.
+
+The index only answers queries made outside of a transaction and for windows that
+start after the entry's horizon; everything else falls back to SQL.
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Booking
+
+VERSION_KEY = 'availability-index:version:{}'
+
+# How far in the past an entry keeps bookings; older windows are answered by SQL
+HORIZON = timedelta(days=1)
+
+
+class PropertyIntervals:
+    """Blocking intervals of one property sorted by start, with a running max of their ends."""
+
+    __slots__ = ('intervals', 'starts', 'max_ends', 'horizon', 'version', 'stale_at')
+
+    def __init__(self, intervals, horizon, version, stale_at=None):
+        self.intervals = sorted(intervals)
+        self.starts = [start for start, _, _ in self.intervals]
+        self.max_ends = []
+        running = None
+        for _, end, _ in self.intervals:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+        self.horizon = horizon
+        self.version = version
+        # Earliest hold expiry among the intervals: the entry must be rebuilt from then on
+        self.stale_at = stale_at
+
+    def is_stale(self):
+        return self.stale_at is not None and timezone.now() >= self.stale_at
+
+    def has_conflict(self, start, end, exclude_booking_id=None):
+        # Only intervals starting before `end` can overlap; walk them backwards until
+        # the running max of their ends falls at or before `start`.
+        idx = bisect.bisect_left(self.starts, end)
+        for i in range(idx - 1, -1, -1):
+            if self.max_ends[i] <= start:
+                break
+            _, interval_end, booking_id = self.intervals[i]
+            if interval_end > start and booking_id != exclude_booking_id:
+                return True
+        return False
+
+
+class AvailabilityIndex:
+    """Bounded LRU of PropertyIntervals keyed by property id."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'AVAILABILITY_INDEX_ENABLED', False)
+
+    @property
+    def max_properties(self):
+        return getattr(settings, 'AVAILABILITY_INDEX_MAX_PROPERTIES', 1000)
+
+    def is_available(self, property_id, start_dt, end_dt, exclude_booking_id=None):
+        """
+        Return True/False when the index can answer for the window, or None when the
+        caller has to fall back to SQL.
+        """
+        if not self.enabled or property_id is None or connection.in_atomic_block:
+            return None
+        entry = self._get(property_id)
+        if start_dt < entry.horizon:
+            return None
+        return not entry.has_conflict(start_dt, end_dt, exclude_booking_id)
+
+    def invalidate(self, property_id):
+        """Drop the local entry now and bump the shared version once the transaction commits."""
+        if property_id is None:
+            return
+        self._drop(property_id)
+
+        def bump():
+            key = VERSION_KEY.format(property_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+            self._drop(property_id)
+
+        transaction.on_commit(bump)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _drop(self, property_id):
+        with self._lock:
+            self._entries.pop(property_id, None)
+
+    def _get(self, property_id):
+        version = cache.get(VERSION_KEY.format(property_id))
+        if version is None:
+            cache.add(VERSION_KEY.format(property_id), 0, None)
+            version = cache.get(VERSION_KEY.format(property_id), 0)
+
+        with self._lock:
+            entry = self._entries.get(property_id)
+            if entry is not None and entry.version == version and not entry.is_stale():
+                self._entries.move_to_end(property_id)
+                return entry
+
+        entry = self._build(property_id, version)
+        with self._lock:
+            self._entries[property_id] = entry
+            self._entries.move_to_end(property_id)
+            while len(self._entries) > self.max_properties:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _build(self, property_id, version):
+        from .services import blocking_q, booking_interval
+
+        horizon = timezone.now() - HORIZON
+        bookings = list(Booking.objects.filter(
+            blocking_q(),
+            property_id=property_id,
+            end_datetime__gt=horizon,
+        ).only('booking_date', 'start_datetime', 'end_datetime', 'hold_expires_at'))
+
+        intervals = [(*booking_interval(b), b.pk) for b in bookings]
+        stale_at = min((b.hold_expires_at for b in bookings if b.hold_expires_at), default=None)
+        return PropertyIntervals(intervals, horizon, version, stale_at)
+
+
+availability_index = AvailabilityIndex()
@@ -219,6 +219,7 @@ class PropertyBookingForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.property = kwargs.pop('property', None)
+        self.suggested_slots = []
         super().__init__(*args, **kwargs)
 
         # إضافة علامة النجمة للحقول المطلوبة
@@ -259,6 +260,12 @@ class PropertyBookingForm(forms.ModelForm):
             )
         )
 
+    def clean_guest_names(self):
+        from .services import parse_guest_names
+        value = self.cleaned_data.get('guest_names')
+        parse_guest_names(value)
+        return value
+
     def clean(self):
         cleaned = super().clean()
         booking_type = cleaned.get('booking_type')
@@ -291,19 +298,9 @@ class PropertyBookingForm(forms.ModelForm):
             if not booking_date:
                 raise ValidationError('يرجى تحديد تاريخ الحجز')
                 
-            from datetime import datetime, time
-            if self.property and self.property.checkin_time:
-                start_time = self.property.checkin_time
-            else:
-                start_time = time(8, 0)
-                
-            if self.property and self.property.checkout_time:
-                end_time = self.property.checkout_time
-            else:
-                end_time = time(20, 0)
-                
-            start = timezone.make_aware(datetime.combine(booking_date, start_time))
-            end = timezone.make_aware(datetime.combine(booking_date, end_time))
+            # check-in/check-out times of the property (08:00-20:00 by default)
+            from .services import default_booking_window
+            start, end = default_booking_window(self.property, booking_date)
             cleaned['start_datetime'] = start
             cleaned['end_datetime'] = end
 
@@ -330,6 +327,14 @@ class PropertyBookingForm(forms.ModelForm):
                 exclude_booking_id=self.instance.pk
             )
             if not available:
+                # Offer the closest free windows of the same type instead of a blind retry
+                from .services import nearest_free_slots
+                self.suggested_slots = nearest_free_slots(
+                    property_obj=self.property,
+                    booking_type=booking_type,
+                    around=start,
+                    exclude_booking_id=self.instance.pk
+                )
                 raise ValidationError('عذراً، هذا العقار محجوز بالفعل في الفترة الزمنية المحددة. يرجى اختيار وقت آخر.')
 
         return cleaned
@@ -343,7 +348,5 @@ class PropertyBookingForm(forms.ModelForm):
         end = self.cleaned_data.get('end_datetime')
         if not booking_type:
             return None
-        if booking_type == 'half_day' and self.property.price_half_day:
-            return self.property.price_half_day
-        # full_day and overnight fallback to per_day
-        return self.property.price_per_day or 0
\ No newline at end of file
+        from .pricing import quote
+        return quote(self.property, booking_type, start, end) or 0
\ No newline at end of file
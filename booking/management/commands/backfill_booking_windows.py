@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from booking.availability_index import availability_index
+from booking.models import Booking
+from booking.occupancy import rebuild_occupancy
+from booking.services import default_booking_window
+
+
+class Command(BaseCommand):
+    help = 'تحويل الحجوزات القديمة (بالتاريخ فقط) إلى فترات زمنية صريحة حسب أوقات الدخول والخروج للعقار'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='عرض عدد الحجوزات دون تعديلها')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        legacy = Booking.objects.filter(
+            start_datetime__isnull=True, end_datetime__isnull=True
+        ).select_related('property').order_by('pk')
+
+        if options['dry_run']:
+            self.stdout.write(f'{legacy.count()} حجز بحاجة إلى تحويل')
+            return
+
+        converted = 0
+        last_pk = 0
+        while True:
+            batch = list(legacy.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for booking in batch:
+                booking.start_datetime, booking.end_datetime = default_booking_window(booking.property, booking.booking_date)
+            # bulk_update skips Booking.save(): past bookings must not be re-validated here
+            Booking.objects.bulk_update(batch, ['start_datetime', 'end_datetime'])
+            for property_id in {booking.property_id for booking in batch}:
+                availability_index.invalidate(property_id)
+                rebuild_occupancy(property_id)
+            converted += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'تم تحويل {converted} حجز...')
+
+        self.stdout.write(self.style.SUCCESS(f'اكتمل التحويل: {converted} حجز'))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from booking.availability_index import availability_index
+from booking.models import Booking
+from booking.occupancy import refresh_window
+from portfolio.models import Property
+from portfolio.search_cache import invalidate_properties_search_cache
+from portfolio.stats import drop_booking_stats
+
+
+class Command(BaseCommand):
+    help = 'إلغاء الحجوزات المعلقة التي انتهت مهلة الدفع الخاصة بها، على دفعات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        cancelled = batches = 0
+
+        while True:
+            batch_started = time.monotonic()
+            now = timezone.now()
+            # Range scan over the hold_expires_at index
+            expired = list(
+                Booking.objects.filter(status='pending', hold_expires_at__lte=now)
+                .order_by('hold_expires_at')
+                .values_list('pk', 'property_id', 'booking_date', 'start_datetime', 'end_datetime')[:batch_size]
+            )
+            if not expired:
+                break
+
+            with transaction.atomic():
+                # Re-check the hold: a payment submitted meanwhile releases it
+                count = Booking.objects.filter(
+                    pk__in=[row[0] for row in expired], status='pending', hold_expires_at__lte=now,
+                ).update(status='cancelled', hold_expires_at=None, updated_at=now)
+                # update() skips the Booking signals: refresh occupancy, the index and the owner stats here
+                for _, property_id, booking_date, start, end in expired:
+                    refresh_window(property_id, booking_date, start, end)
+                property_ids = {row[1] for row in expired}
+                for property_id in property_ids:
+                    availability_index.invalidate(property_id)
+                owner_ids = set(Property.objects.filter(pk__in=property_ids).values_list('owner_id', flat=True))
+                drop_booking_stats(property_ids, owner_ids)
+            # Cancelled holds leave the availability filter of the cached searches
+            invalidate_properties_search_cache(property_ids)
+
+            cancelled += count
+            batches += 1
+            self.stdout.write(f'الدفعة {batches}: أُلغي {count} حجز خلال {time.monotonic() - batch_started:.2f} ثانية')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'اكتمل: أُلغي {cancelled} حجز منتهي المهلة في {batches} دفعة خلال {time.monotonic() - started:.2f} ثانية'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from booking.occupancy import rebuild_occupancy
+from portfolio.models import Property
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء جدول الإشغال اليومي للعقارات من الحجوزات النشطة'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--property', type=int, action='append', dest='property_ids',
+                            help='رقم العقار (يمكن تكراره)، الافتراضي جميع العقارات')
+
+    def handle(self, *args, **options):
+        property_ids = options['property_ids'] or Property.objects.order_by('pk').values_list('pk', flat=True)
+
+        properties = days = 0
+        for property_id in property_ids:
+            with transaction.atomic():
+                days += rebuild_occupancy(property_id)
+            properties += 1
+
+        self.stdout.write(self.style.SUCCESS(f'اكتملت إعادة البناء: {properties} عقار، {days} يوم مشغول'))
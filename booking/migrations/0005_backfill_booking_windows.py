@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:17
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 500
+
+
+def backfill_booking_windows(apps, schema_editor):
+    """Give legacy date-only bookings an explicit window from the property's check-in/out times."""
+    Booking = apps.get_model('booking', 'Booking')
+    legacy = Booking.objects.filter(start_datetime__isnull=True, end_datetime__isnull=True).select_related('property')
+
+    batch = []
+    for booking in legacy.iterator(chunk_size=BATCH_SIZE):
+        prop = booking.property
+        start_time = (prop.checkin_time if prop else None) or time(8, 0)
+        end_time = (prop.checkout_time if prop else None) or time(20, 0)
+        end_day = booking.booking_date if end_time > start_time else booking.booking_date + timedelta(days=1)
+        booking.start_datetime = timezone.make_aware(datetime.combine(booking.booking_date, start_time))
+        booking.end_datetime = timezone.make_aware(datetime.combine(end_day, end_time))
+        batch.append(booking)
+        if len(batch) >= BATCH_SIZE:
+            Booking.objects.bulk_update(batch, ['start_datetime', 'end_datetime'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['start_datetime', 'end_datetime'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_bookingguest_checkin_checkout_times'),
+        ('portfolio', '0004_amenity_owner_alter_amenity_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='booking_type',
+            field=models.CharField(choices=[('half_day', 'نصف يوم'), ('full_day', 'يوم كامل'), ('overnight', 'مبيت')], default='full_day', max_length=20, verbose_name='نوع الحجز'),
+        ),
+        migrations.RunPython(backfill_booking_windows, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_boo_propert_27e35e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['property', 'status', 'start_datetime', 'end_datetime'], name='booking_prop_status_window_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:05
+
+import secrets
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Same alphabet and length as booking.services.generate_guest_codes
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+CODE_LENGTH = 10
+
+
+def reissue_colliding_codes(apps, schema_editor):
+    """
+    Codes were only unique per booking. Keep the oldest guest of every shared code (its
+    printed invitation stays valid) and give the others a new code, so the unique index
+    on code can be built.
+    """
+    BookingGuest = apps.get_model('booking', 'BookingGuest')
+    collisions = (
+        BookingGuest.objects.values('code')
+        .annotate(n=Count('id'), first_id=Min('id'))
+        .filter(n__gt=1)
+    )
+    taken = set(BookingGuest.objects.values_list('code', flat=True))
+    for collision in list(collisions):
+        guests = BookingGuest.objects.filter(code=collision['code']).exclude(id=collision['first_id'])
+        for guest in guests:
+            code = None
+            while code is None or code in taken:
+                code = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            taken.add(code)
+            guest.code = code
+            guest.save(update_fields=['code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_backfill_booking_windows'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='bookingguest',
+            name='unique_guest_code_per_booking',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookingguest',
+            name='booking_boo_booking_ed311c_idx',
+        ),
+        migrations.RunPython(reissue_colliding_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bookingguest',
+            name='code',
+            field=models.CharField(max_length=20, unique=True, verbose_name='رمز الدعوة'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:29
+
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of booking.services.ACTIVE_STATUSES / HALF_DAY_PERIODS
+ACTIVE_STATUSES = ('pending', 'confirmed')
+HALF_DAY_PERIODS = ((time(8, 0), time(14, 0)), (time(14, 0), time(20, 0)))
+
+
+def populate_occupancy(apps, schema_editor):
+    """Fill PropertyDayOccupancy from the active bookings, one property at a time."""
+    Booking = apps.get_model('booking', 'Booking')
+    PropertyDayOccupancy = apps.get_model('booking', 'PropertyDayOccupancy')
+
+    def aware(day, at):
+        return timezone.make_aware(datetime.combine(day, at))
+
+    property_ids = Booking.objects.filter(status__in=ACTIVE_STATUSES).values_list('property_id', flat=True).distinct()
+    for property_id in list(property_ids):
+        intervals = []
+        for b in Booking.objects.filter(property_id=property_id, status__in=ACTIVE_STATUSES).iterator():
+            if b.start_datetime and b.end_datetime:
+                intervals.append((b.start_datetime, b.end_datetime))
+            else:
+                intervals.append((aware(b.booking_date, time.min), aware(b.booking_date + timedelta(days=1), time.min)))
+
+        days = set()
+        for start, end in intervals:
+            day = timezone.localtime(start).date()
+            while day <= timezone.localtime(end - timedelta(microseconds=1)).date():
+                days.add(day)
+                day += timedelta(days=1)
+
+        rows = []
+        for day in sorted(days):
+            morning, evening = (
+                any(start < aware(day, period_end) and end > aware(day, period_start) for start, end in intervals)
+                for period_start, period_end in HALF_DAY_PERIODS
+            )
+            rows.append(PropertyDayOccupancy(
+                property_id=property_id, date=day,
+                morning_busy=morning, evening_busy=evening, full_busy=morning and evening,
+            ))
+        PropertyDayOccupancy.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_bookingguest_unique_code'),
+        ('portfolio', '0004_amenity_owner_alter_amenity_name_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyDayOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='اليوم')),
+                ('morning_busy', models.BooleanField(default=False, verbose_name='الفترة الصباحية محجوزة')),
+                ('evening_busy', models.BooleanField(default=False, verbose_name='الفترة المسائية محجوزة')),
+                ('full_busy', models.BooleanField(default=False, verbose_name='اليوم محجوز بالكامل')),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_occupancy', to='portfolio.property', verbose_name='العقار')),
+            ],
+            options={
+                'verbose_name': 'إشغال يومي',
+                'verbose_name_plural': 'الإشغال اليومي',
+                'indexes': [models.Index(fields=['date', 'property'], name='booking_occupancy_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('property', 'date'), name='unique_occupancy_per_property_day')],
+            },
+        ),
+        migrations.RunPython(populate_occupancy, migrations.RunPython.noop),
+    ]
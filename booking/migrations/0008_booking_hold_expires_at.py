@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_property_day_occupancy'),
+        ('portfolio', '0004_amenity_owner_alter_amenity_name_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_prop_status_window_idx',
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='انتهاء مهلة الحجز'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['property', 'status', 'start_datetime', 'end_datetime', 'hold_expires_at'], name='booking_prop_status_window_idx'),
+        ),
+    ]
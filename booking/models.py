@@ -98,6 +98,8 @@ class Booking(models.Model):
         default='pending', 
         verbose_name="حالة الحجز"
     )
+    # Unpaid pending bookings only hold their window until this time (see booking.services.blocking_q)
+    hold_expires_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="انتهاء مهلة الحجز")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -107,7 +109,15 @@ class Booking(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['property', 'start_datetime']),
-            models.Index(fields=['property', 'end_datetime']),
+            # Covers the overlap query of services.is_timeslot_available as one range scan
+            # (replaces the (property, end_datetime) index the planner preferred over it)
+            # hold_expires_at is carried so the hold check stays inside the index
+            models.Index(
+                fields=['property', 'status', 'start_datetime', 'end_datetime', 'hold_expires_at'],
+                name='booking_prop_status_window_idx',
+            ),
+            # Keyset pagination of a user's bookings in the API (api/pagination.py)
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created_idx'),
         ]
 
     def __str__(self):
@@ -115,10 +125,51 @@ class Booking(models.Model):
             return f"{self.customer_name} - {self.property.name} - {self.start_datetime:%Y-%m-%d %H:%M} → {self.end_datetime:%H:%M}"
         return f"{self.customer_name} - {self.booking_date}"
 
+    # Fields that place the booking in time; only changes to them need the window re-validated
+    WINDOW_FIELDS = frozenset({'property', 'booking_date', 'start_datetime', 'end_datetime'})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored window and status so re-saving a booking only re-validates what changed;
+        # status and phone also drive the home page counters (portfolio/stats.py)
+        instance._loaded_window = instance._window_state(instance.__dict__)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_phone = instance.__dict__.get('customer_phone')
+        instance._loaded_hold = instance.__dict__.get('hold_expires_at')
+        return instance
+
+    @staticmethod
+    def _window_state(values):
+        return (values.get('property_id'), values.get('booking_date'), values.get('start_datetime'), values.get('end_datetime'))
+
+    def window_changed(self):
+        """True for new bookings and for bookings whose property/date/start/end differ from the stored values"""
+        if self._state.adding:
+            return True
+        return getattr(self, '_loaded_window', None) != self._window_state(self.__dict__)
+
+    def needs_availability_check(self):
+        """
+        True when saving would newly occupy a window: an active booking that is new, moved or
+        re-activated. A pending booking whose hold expired no longer blocks its window, so
+        confirming it counts as a re-activation.
+        """
+        from .services import ACTIVE_STATUSES
+        if self.status not in ACTIVE_STATUSES:
+            return False
+        loaded_status = getattr(self, '_loaded_status', None)
+        loaded_hold = getattr(self, '_loaded_hold', None)
+        if loaded_status == 'pending' and loaded_hold is not None and loaded_hold <= timezone.now():
+            return True
+        return self.window_changed() or loaded_status not in ACTIVE_STATUSES
+
     def clean(self):
         """Validate booking timing and availability"""
+        window_changed = self.window_changed()
+
         # Legacy date-only validation
-        if self.booking_date and self.booking_date < timezone.now().date():
+        if window_changed and self.booking_date and self.booking_date < timezone.now().date():
             raise ValidationError({'booking_date': 'لا يمكن حجز تاريخ في الماضي'})
 
         # Timeslot validation when provided
@@ -127,28 +178,65 @@ class Booking(models.Model):
                 raise ValidationError({'end_datetime': 'وقت الانتهاء يجب أن يكون بعد وقت البدء'})
 
             # Prevent past timeslot bookings
-            if self.start_datetime < timezone.now():
+            if window_changed and self.start_datetime < timezone.now():
                 raise ValidationError({'start_datetime': 'لا يمكن الحجز في وقت مضى'})
 
-            # Check overlaps via service
-            try:
-                from .services import is_timeslot_available
-            except Exception:
-                is_timeslot_available = None
-
-            if is_timeslot_available is not None:
-                available = is_timeslot_available(
-                    property_obj=self.property if self.property_id else None,
-                    start_dt=self.start_datetime,
-                    end_dt=self.end_datetime,
-                    exclude_booking_id=self.pk,
-                )
-                if not available:
-                    raise ValidationError({'start_datetime': 'الوقت المحدد غير متاح', 'end_datetime': 'الوقت المحدد غير متاح'})
+            if self.needs_availability_check():
+                self.check_availability()
+
+    def check_availability(self):
+        """
+        Raise ValidationError when the booking's window overlaps another blocking booking.
+        Under property_write_lock an answer already computed for this window
+        (form/serializer validation, commit_booking) is reused.
+        """
+        if not (self.property_id and self.start_datetime and self.end_datetime):
+            return
+        from .services import is_timeslot_available
+        available = is_timeslot_available(
+            property_obj=self.property,
+            start_dt=self.start_datetime,
+            end_dt=self.end_datetime,
+            exclude_booking_id=self.pk,
+        )
+        if not available:
+            raise ValidationError({'start_datetime': 'الوقت المحدد غير متاح', 'end_datetime': 'الوقت المحدد غير متاح'})
+
+    def hold_expired(self):
+        """True for a pending booking whose unpaid hold has run out"""
+        return self.status == 'pending' and self.hold_expires_at is not None and self.hold_expires_at <= timezone.now()
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        if self.hold_expires_at and self.status != 'pending':
+            # Holds only apply to unpaid pending bookings
+            self.hold_expires_at = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = [*kwargs['update_fields'], 'hold_expires_at']
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not self.WINDOW_FIELDS.intersection(update_fields):
+            # Status/payment-only updates cannot move the window: validate just the written fields
+            self.clean_fields(exclude=[f.name for f in self._meta.fields if f.name not in update_fields])
+            if 'status' in update_fields and self.needs_availability_check():
+                # Re-activating a booking occupies its window again: check and write under the property's lock
+                from .services import property_write_lock
+                with property_write_lock(self.property_id):
+                    self.check_availability()
+                    self._save(*args, **kwargs)
+                return
+        else:
+            self.full_clean()
+        self._save(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
+        if self.booking_date and not (self.start_datetime or self.end_datetime):
+            # Date-only bookings get an explicit window so overlap checks stay pure range scans
+            from .services import default_booking_window
+            self.start_datetime, self.end_datetime = default_booking_window(self.property, self.booking_date)
         super().save(*args, **kwargs)
+        self._loaded_window = self._window_state(self.__dict__)
+        self._loaded_status = self.status
+        self._loaded_phone = self.customer_phone
+        self._loaded_hold = self.hold_expires_at
 
 
 class BookingGuest(models.Model):
@@ -161,7 +249,8 @@ class BookingGuest(models.Model):
     )
     serial = models.PositiveIntegerField(verbose_name="الرقم التسلسلي")
     name = models.CharField(max_length=200, verbose_name="اسم الضيف")
-    code = models.CharField(max_length=20, verbose_name="رمز الدعوة")
+    # Unique across all bookings: gate scans look guests up by code alone
+    code = models.CharField(max_length=20, unique=True, verbose_name="رمز الدعوة")
     checkin_time = models.DateTimeField(null=True, blank=True, verbose_name="وقت الدخول")
     checkout_time = models.DateTimeField(null=True, blank=True, verbose_name="وقت الخروج")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -172,10 +261,6 @@ class BookingGuest(models.Model):
         ordering = ['serial']
         constraints = [
             models.UniqueConstraint(fields=['booking', 'serial'], name='unique_guest_serial_per_booking'),
-            models.UniqueConstraint(fields=['booking', 'code'], name='unique_guest_code_per_booking'),
-        ]
-        indexes = [
-            models.Index(fields=['booking', 'code']),
         ]
 
     def __str__(self):
@@ -263,3 +348,34 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+class PropertyDayOccupancy(models.Model):
+    """
+    إشغال عقار في يوم واحد محسوب من الحجوزات النشطة (انظر booking/occupancy.py).
+    يوجد صف فقط للأيام التي يتقاطع معها حجز نشط، ليصبح فلتر البحث بالتاريخ مساواة على جدول صغير مفهرس.
+    """
+    property = models.ForeignKey(
+        Property,
+        on_delete=models.CASCADE,
+        related_name='day_occupancy',
+        verbose_name="العقار"
+    )
+    date = models.DateField(verbose_name="اليوم")
+    morning_busy = models.BooleanField(default=False, verbose_name="الفترة الصباحية محجوزة")
+    evening_busy = models.BooleanField(default=False, verbose_name="الفترة المسائية محجوزة")
+    full_busy = models.BooleanField(default=False, verbose_name="اليوم محجوز بالكامل")
+
+    class Meta:
+        verbose_name = "إشغال يومي"
+        verbose_name_plural = "الإشغال اليومي"
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'date'], name='unique_occupancy_per_property_day'),
+        ]
+        indexes = [
+            # Search filters by date equality and returns property ids
+            models.Index(fields=['date', 'property'], name='booking_occupancy_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id} - {self.date}"
@@ -0,0 +1,132 @@
+"""
+Per-day occupancy of properties, materialised in PropertyDayOccupancy.
+
+A row exists for every day an active booking overlaps, with flags for the morning and
+evening half-day periods and for the whole day (both periods busy). Rows are refreshed
+for the days a booking covered before and after each write (see booking/signals.py);
+`manage.py rebuild_occupancy` recomputes them from scratch. Expired holds keep their days
+busy until expire_booking_holds cancels them and refreshes those days.
+
+Searches use occupied_property_ids(), an equality filter on (date, property), whenever
+the requested window is made of whole half-day periods of one day; other windows fall
+back to the exact overlap query.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking, PropertyDayOccupancy
+from .services import (
+    ACTIVE_STATUSES, HALF_DAY_PERIODS, _overlaps_any, blocking_q, booking_interval, day_bounds,
+    half_day_busy, merge_intervals, overlap_q,
+)
+
+BATCH_SIZE = 500
+
+
+def covered_days(start, end):
+    """Local calendar days touched by the [start, end) window."""
+    day = timezone.localtime(start).date()
+    last = timezone.localtime(end - timedelta(microseconds=1)).date()
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _occupancy_rows(property_id, busy, days):
+    rows = []
+    for day in days:
+        if not _overlaps_any(busy, *day_bounds(day)):
+            continue
+        periods = half_day_busy(busy, day)
+        rows.append(PropertyDayOccupancy(
+            property_id=property_id,
+            date=day,
+            morning_busy=periods['morning'],
+            evening_busy=periods['evening'],
+            full_busy=all(periods.values()),
+        ))
+    return rows
+
+
+def refresh_occupancy(property_id, first_day, last_day):
+    """Recompute the occupancy rows of one property for the days first_day..last_day."""
+    window_start, _ = day_bounds(first_day)
+    _, window_end = day_bounds(last_day)
+    bookings = Booking.objects.filter(
+        blocking_q(),
+        property_id=property_id,
+    ).filter(overlap_q(window_start, window_end)).only('booking_date', 'start_datetime', 'end_datetime').order_by()
+    busy = merge_intervals(booking_interval(b) for b in bookings)
+
+    days = []
+    day = first_day
+    while day <= last_day:
+        days.append(day)
+        day += timedelta(days=1)
+
+    PropertyDayOccupancy.objects.filter(property_id=property_id, date__range=(first_day, last_day)).delete()
+    PropertyDayOccupancy.objects.bulk_create(_occupancy_rows(property_id, busy, days), batch_size=BATCH_SIZE)
+
+
+def rebuild_occupancy(property_id):
+    """Recompute every occupancy row of one property from its active bookings."""
+    bookings = Booking.objects.filter(
+        blocking_q(),
+        property_id=property_id,
+    ).only('booking_date', 'start_datetime', 'end_datetime').order_by()
+    busy = merge_intervals(booking_interval(b) for b in bookings)
+    days = sorted({day for start, end in busy for day in covered_days(start, end)})
+
+    PropertyDayOccupancy.objects.filter(property_id=property_id).delete()
+    PropertyDayOccupancy.objects.bulk_create(_occupancy_rows(property_id, busy, days), batch_size=BATCH_SIZE)
+    return len(days)
+
+
+def refresh_window(property_id, booking_date, start, end):
+    """Refresh the days covered by a booking window given as stored field values."""
+    if not property_id:
+        return
+    if not (start and end):
+        if not booking_date:
+            return
+        start, end = day_bounds(booking_date)
+    days = list(covered_days(start, end))
+    refresh_occupancy(property_id, days[0], days[-1])
+
+
+def refresh_booking_occupancy(booking, deleted=False):
+    """
+    Refresh the days a booking occupied before this write and occupies after it.
+    Writes that change neither the window nor whether the booking blocks it are skipped.
+    """
+    loaded = getattr(booking, '_loaded_window', None)
+    was_active = getattr(booking, '_loaded_status', None) in ACTIVE_STATUSES
+    current = booking._window_state(booking.__dict__)
+    if not deleted and loaded == current and was_active == (booking.status in ACTIVE_STATUSES):
+        return
+
+    for window in {current, loaded} - {None}:
+        refresh_window(*window)
+
+
+def occupied_property_ids(start, end):
+    """
+    Ids of the properties busy during [start, end), read from the occupancy table, or None
+    when the window is not made of whole half-day periods of a single day (use the exact
+    overlap query then).
+    """
+    local_start, local_end = timezone.localtime(start), timezone.localtime(end)
+    if local_start.date() != local_end.date() or local_start >= local_end:
+        return None
+
+    boundaries = {t for _, period_start, period_end in HALF_DAY_PERIODS for t in (period_start, period_end)}
+    if local_start.time() not in boundaries or local_end.time() not in boundaries:
+        return None
+
+    busy = Q()
+    for name, period_start, period_end in HALF_DAY_PERIODS:
+        if period_start >= local_start.time() and period_end <= local_end.time():
+            busy |= Q(**{f'{name}_busy': True})
+    return PropertyDayOccupancy.objects.filter(busy, date=local_start.date()).values('property_id')
@@ -0,0 +1,122 @@
+"""
+Booking prices.
+
+A property's rates are read once into an immutable RateCard. Cards are kept in the default
+cache for RATE_CARD_CACHE_SECONDS and dropped when the property is saved or deleted (see
+booking/signals.py), so pricing many properties costs at most one query for the cards
+that are not cached yet.
+"""
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from portfolio.models import Property
+
+RATE_CARD_KEY = 'rate-card:{}'
+
+# Priced by the hour from price_per_hour; not a Booking.booking_type choice
+HOURLY = 'hourly'
+
+RATE_FIELDS = ('price_per_hour', 'price_half_day', 'price_per_day')
+
+
+@dataclass(frozen=True)
+class RateCard:
+    """The rates of one property; None means the property does not offer that rate."""
+
+    property_id: int
+    per_hour: Decimal | None = None
+    half_day: Decimal | None = None
+    per_day: Decimal | None = None
+
+    @classmethod
+    def from_property(cls, property_obj):
+        return cls(
+            property_id=property_obj.pk,
+            per_hour=property_obj.price_per_hour,
+            half_day=property_obj.price_half_day,
+            per_day=property_obj.price_per_day,
+        )
+
+    def price(self, booking_type, start=None, end=None):
+        """
+        Total price of a `booking_type` booking over [start, end), or None when the
+        property has no rate for it.
+
+        - hourly: price_per_hour per started hour.
+        - half_day: price_half_day, else price_per_day (as before).
+        - full_day: price_per_day per started 24 hours.
+        - overnight: price_per_day per night (calendar days between check-in and check-out).
+        """
+        if booking_type == HOURLY:
+            if self.per_hour is None or not (start and end):
+                return None
+            return self.per_hour * math.ceil((end - start) / timedelta(hours=1))
+        if booking_type == 'half_day':
+            return self.half_day or self.per_day
+        if self.per_day is None:
+            return None
+        return self.per_day * self.units(booking_type, start, end)
+
+    @staticmethod
+    def units(booking_type, start, end):
+        """Number of days (full_day) or nights (overnight) billed for the window, at least one."""
+        if not (start and end):
+            return 1
+        if booking_type == 'overnight':
+            nights = (timezone.localtime(end).date() - timezone.localtime(start).date()).days
+            return max(nights, 1)
+        return max(math.ceil((end - start) / timedelta(days=1)), 1)
+
+
+def rate_cards(property_ids):
+    """Return {property_id: RateCard} for the existing properties among `property_ids`."""
+    property_ids = set(property_ids)
+    keys = {RATE_CARD_KEY.format(pk): pk for pk in property_ids}
+    cards = {keys[key]: card for key, card in cache.get_many(keys).items()}
+
+    missing = property_ids - cards.keys()
+    if missing:
+        loaded = {
+            row['pk']: RateCard(row['pk'], row['price_per_hour'], row['price_half_day'], row['price_per_day'])
+            for row in Property.objects.filter(pk__in=missing).order_by().values('pk', *RATE_FIELDS)
+        }
+        cache.set_many(
+            {RATE_CARD_KEY.format(pk): card for pk, card in loaded.items()},
+            getattr(settings, 'RATE_CARD_CACHE_SECONDS', 3600),
+        )
+        cards.update(loaded)
+    return cards
+
+
+def invalidate_rate_card(property_id):
+    """Forget the cached card once the transaction commits; dropped earlier, a concurrent quote could cache the old prices again."""
+    key = RATE_CARD_KEY.format(property_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def quote(property_obj, booking_type, start=None, end=None):
+    """Price one window for an already loaded property."""
+    return RateCard.from_property(property_obj).price(booking_type, start, end)
+
+
+def quote_many(property_ids, booking_type, start=None, end=None):
+    """
+    Price one window across many properties in a single pass: {property_id: total or None}.
+    Properties that do not exist are left out.
+    """
+    return {pk: card.price(booking_type, start, end) for pk, card in rate_cards(property_ids).items()}
+
+
+def deposit_for(total, percent=None):
+    """Deposit due on `total`: DEPOSIT_PERCENT of it, rounded half-up to a whole amount."""
+    if percent is None:
+        percent = getattr(settings, 'DEPOSIT_PERCENT', 0)
+    deposit = (Decimal(percent) / Decimal('100')) * (total or Decimal('0'))
+    return deposit.quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
@@ -1,43 +1,423 @@
+import bisect
+import secrets
 from datetime import datetime, time, timedelta
-from django.db.models import Q
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from .models import Booking
+from portfolio.models import Property
+from .models import Booking, BookingGuest
+from .availability_index import availability_index
+
+# Booking statuses that block a timeslot
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+BOOKING_CONFLICT_MESSAGE = 'عذراً، هذا العقار محجوز بالفعل في الفترة الزمنية المحددة. يرجى اختيار وقت آخر.'
+
+HOLD_EXPIRED_MESSAGE = 'انتهت مهلة الحجز لعدم إتمام الدفع في الوقت المحدد. يرجى إنشاء حجز جديد.'
+
+# Half-day periods offered by PropertyBookingForm (morning 8-14, evening 14-20)
+HALF_DAY_PERIODS = (
+    ('morning', time(8, 0), time(14, 0)),
+    ('evening', time(14, 0), time(20, 0)),
+)
+
+# Guest invitation codes: unambiguous upper-case letters and digits. Codes are unique across
+# the platform; 32**10 (~1.1e15) codes keep the chance that a new code hits any of 10 million
+# issued ones around 1e-8, so one probe query before inserting settles the rare collision.
+GUEST_CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+GUEST_CODE_LENGTH = 10
+
+# (property_id, {window: available}) while property_write_lock is held. Writers of the property
+# are serialised, so an answer stays valid until a booking of that property is saved.
+_locked_availability = ContextVar('locked_availability', default=None)
 
 
 def is_timeslot_available(*, property_obj, start_dt, end_dt, exclude_booking_id=None):
     """
     Returns True if the timeslot [start_dt, end_dt) is available for the given property.
-    Considers bookings with status in ['pending','confirmed'].
-    Treats legacy date-only bookings as full-day blocks on their booking_date.
+    Considers bookings with status in ['pending','confirmed'], ignoring expired holds (blocking_q).
+    Every booking carries an explicit window (see default_booking_window), so the check is
+    a single range scan over the (property, status, start_datetime, end_datetime) index.
+    Answers from the in-process availability index when it is enabled.
     """
     if start_dt >= end_dt:
         return False
 
-    qs = Booking.objects.filter(status__in=['pending', 'confirmed'])
+    answers = None
+    if property_obj is not None:
+        indexed = availability_index.is_available(property_obj.pk, start_dt, end_dt, exclude_booking_id)
+        if indexed is not None:
+            return indexed
+        answers = _locked_answers(property_obj.pk)
+        key = (start_dt, end_dt, exclude_booking_id or None)
+        if answers is not None and key in answers:
+            return answers[key]
+
+    qs = Booking.objects.filter(blocking_q())
     qs = qs.filter(property=property_obj)
 
     if exclude_booking_id:
         qs = qs.exclude(id=exclude_booking_id)
 
-    # Overlap for timeslot-based bookings (both start and end must exist)
-    overlap_q = Q(
-        start_datetime__isnull=False,
-        end_datetime__isnull=False,
-        start_datetime__lt=end_dt,
-        end_datetime__gt=start_dt
+    conflicting_bookings = qs.filter(overlap_q(start_dt, end_dt))
+
+    available = not conflicting_bookings.exists()
+    if answers is not None:
+        answers[key] = available
+    return available
+
+
+def _locked_answers(property_id):
+    """Availability answers cached for `property_id` by the enclosing property_write_lock, if any."""
+    scope = _locked_availability.get()
+    if scope is not None and scope[0] == property_id:
+        return scope[1]
+    return None
+
+
+def forget_locked_availability(property_id):
+    """Drop cached answers once a booking of `property_id` is written inside the lock."""
+    answers = _locked_answers(property_id)
+    if answers is not None:
+        answers.clear()
+
+
+def blocking_q(now=None):
+    """
+    Q matching bookings that block their window: pending or confirmed, except pending
+    bookings whose unpaid hold expired (they are cancelled by expire_booking_holds).
+    """
+    return Q(status__in=ACTIVE_STATUSES) & (
+        Q(hold_expires_at__isnull=True) | Q(hold_expires_at__gt=now or timezone.now())
     )
 
-    # Legacy date-only bookings: treat as whole day of booking_date
-    if isinstance(start_dt, datetime):
-        start_day = start_dt.date()
-        end_day = end_dt.date()
-    else:
-        start_day = end_day = None
 
-    legacy_q = Q(start_datetime__isnull=True, end_datetime__isnull=True) & (
-        Q(booking_date=start_day) | Q(booking_date=end_day)
+def hold_expiry():
+    """Expiry time of the hold given to a new pending booking, or None when holds are disabled."""
+    minutes = getattr(settings, 'BOOKING_HOLD_MINUTES', None)
+    return timezone.now() + timedelta(minutes=minutes) if minutes else None
+
+
+def overlap_q(start_dt, end_dt):
+    """Q matching bookings whose window overlaps [start_dt, end_dt)."""
+    return Q(start_datetime__lt=end_dt, end_datetime__gt=start_dt)
+
+
+def default_booking_window(property_obj, day):
+    """
+    Return the [start, end) window of a whole-day booking on `day`, from the property's
+    check-in/check-out times (08:00-20:00 when unset). A check-out time at or before the
+    check-in time ends on the next day.
+    """
+    start_time = (property_obj.checkin_time if property_obj else None) or time(8, 0)
+    end_time = (property_obj.checkout_time if property_obj else None) or time(20, 0)
+    end_day = day if end_time > start_time else day + timedelta(days=1)
+    start = timezone.make_aware(datetime.combine(day, start_time))
+    end = timezone.make_aware(datetime.combine(end_day, end_time))
+    return start, end
+
+
+def day_bounds(day):
+    """Return the aware [start, end) datetimes covering a calendar day in the current timezone."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def booking_interval(booking):
+    """
+    Return the [start, end) window occupied by a booking.
+    Date-only bookings that were not backfilled yet block the whole day of their booking_date.
+    """
+    if booking.start_datetime and booking.end_datetime:
+        return booking.start_datetime, booking.end_datetime
+    return day_bounds(booking.booking_date)
+
+
+def merge_intervals(intervals):
+    """Merge overlapping or touching [start, end) intervals into a sorted list of busy blocks."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _overlaps_any(busy, start, end):
+    return any(b_start < end and b_end > start for b_start, b_end in busy)
+
+
+def half_day_busy(busy, day):
+    """Map each half-day period of `day` to True when it overlaps one of the `busy` intervals."""
+    periods = {}
+    for name, period_start, period_end in HALF_DAY_PERIODS:
+        start = timezone.make_aware(datetime.combine(day, period_start))
+        end = timezone.make_aware(datetime.combine(day, period_end))
+        periods[name] = _overlaps_any(busy, start, end)
+    return periods
+
+
+def get_availability_calendar(*, property_obj, date_from, date_to):
+    """
+    Build the availability calendar of a property for the days date_from..date_to (inclusive).
+
+    All blocking bookings of the window are loaded with a single range query and merged into
+    busy intervals. Each day is reported as 'free', 'partial' or 'busy' together with the
+    status of the morning and evening half-day periods.
+    """
+    window_start, _ = day_bounds(date_from)
+    _, window_end = day_bounds(date_to)
+
+    bookings = Booking.objects.filter(
+        blocking_q(),
+        property=property_obj,
+    ).filter(overlap_q(window_start, window_end)).only('booking_date', 'start_datetime', 'end_datetime')
+
+    busy = merge_intervals(booking_interval(b) for b in bookings)
+
+    days = []
+    day = date_from
+    while day <= date_to:
+        periods = {name: 'busy' if is_busy else 'free' for name, is_busy in half_day_busy(busy, day).items()}
+
+        if all(value == 'busy' for value in periods.values()):
+            status = 'busy'
+        elif _overlaps_any(busy, *day_bounds(day)):
+            status = 'partial'
+        else:
+            status = 'free'
+
+        days.append({'date': day, 'status': status, **periods})
+        day += timedelta(days=1)
+
+    return {
+        'busy': [{'start': start, 'end': end} for start, end in busy],
+        'days': days,
+    }
+
+
+def check_timeslots_availability(slots):
+    """
+    Check many (property_id, start_dt, end_dt) triples at once.
+
+    Blocking bookings overlapping any requested window of its property are fetched with
+    a single query (one property/window condition per distinct triple, ORed together),
+    then each triple is resolved in memory. Returns one dict per triple, in order, with 'available' set to True/False,
+    or to None when the property does not exist.
+    """
+    slots = list(slots)
+    if not slots:
+        return []
+
+    property_ids = {property_id for property_id, _, _ in slots}
+    existing_ids = set(Property.objects.filter(pk__in=property_ids).values_list('pk', flat=True))
+
+    intervals = defaultdict(list)
+    windows = {(property_id, start, end) for property_id, start, end in slots if property_id in existing_ids and start < end}
+    if windows:
+        # Only the requested windows: a far-apart pair of slots does not load everything between them
+        requested = reduce(or_, (Q(property_id=property_id) & overlap_q(start, end) for property_id, start, end in windows))
+        bookings = Booking.objects.filter(blocking_q()).filter(requested).only(
+            'property_id', 'booking_date', 'start_datetime', 'end_datetime',
+        )
+        for booking in bookings:
+            intervals[booking.property_id].append(booking_interval(booking))
+
+    results = []
+    for property_id, start, end in slots:
+        if property_id not in existing_ids:
+            available = None
+        elif start >= end:
+            available = False
+        else:
+            available = not _overlaps_any(intervals[property_id], start, end)
+        results.append({
+            'property_id': property_id,
+            'start_datetime': start,
+            'end_datetime': end,
+            'available': available,
+        })
+    return results
+
+
+def candidate_slots(property_obj, booking_type, day):
+    """The [start, end) windows a booking of `booking_type` can occupy on `day`."""
+    if booking_type == 'half_day':
+        return [
+            (timezone.make_aware(datetime.combine(day, period_start)), timezone.make_aware(datetime.combine(day, period_end)))
+            for _, period_start, period_end in HALF_DAY_PERIODS
+        ]
+    return [default_booking_window(property_obj, day)]
+
+
+def nearest_free_slots(*, property_obj, booking_type, around, count=None, exclude_booking_id=None):
+    """
+    Return up to `count` free windows of `booking_type` closest to `around`, as
+    [{'start', 'end'}] ordered by distance, looking AVAILABILITY_SUGGESTION_DAYS days either
+    side and never into the past.
+
+    Blocking bookings of the whole search range are loaded with one query and merged into
+    sorted, disjoint busy intervals; each candidate window is then placed among them with a
+    binary search and kept when it fits in a gap.
+    """
+    count = count or getattr(settings, 'AVAILABILITY_SUGGESTIONS', 3)
+    days = getattr(settings, 'AVAILABILITY_SUGGESTION_DAYS', 30)
+    now = timezone.now()
+    around = max(around, now)
+    center = timezone.localtime(around).date()
+
+    candidates = []
+    day = max(center - timedelta(days=days), timezone.localdate())
+    while day <= center + timedelta(days=days):
+        candidates.extend(slot for slot in candidate_slots(property_obj, booking_type, day) if slot[0] >= now)
+        day += timedelta(days=1)
+    if not candidates:
+        return []
+
+    bookings = Booking.objects.filter(
+        blocking_q(),
+        property=property_obj,
+    ).filter(
+        overlap_q(min(start for start, _ in candidates), max(end for _, end in candidates))
+    ).only('booking_date', 'start_datetime', 'end_datetime')
+    if exclude_booking_id:
+        bookings = bookings.exclude(pk=exclude_booking_id)
+    busy = merge_intervals(booking_interval(b) for b in bookings)
+    busy_starts = [start for start, _ in busy]
+
+    def fits_in_gap(start, end):
+        i = bisect.bisect_right(busy_starts, start)
+        if i and busy[i - 1][1] > start:
+            return False
+        return i == len(busy) or busy[i][0] >= end
+
+    free = sorted(
+        (slot for slot in candidates if fits_in_gap(*slot)),
+        key=lambda slot: (abs(slot[0] - around), slot[0]),
     )
+    return [{'start': start, 'end': end} for start, end in free[:count]]
+
+
+@contextmanager
+def property_write_lock(property_id):
+    """
+    Open a transaction that serialises booking writers of one property.
+
+    Databases with row locks (PostgreSQL) lock the Property row with SELECT ... FOR UPDATE.
+    SQLite has no row locks, so the transaction starts with a no-op write that takes the
+    database write lock immediately, the same effect as BEGIN IMMEDIATE; concurrent
+    writers then wait on the busy timeout instead of failing on a lock upgrade.
 
-    conflicting_bookings = qs.filter(overlap_q | legacy_q)
-    
-    return not conflicting_bookings.exists()
+    While the lock is held, is_timeslot_available remembers its answers, so validating a
+    booking (form/serializer, Booking.clean) and committing it run the overlap query once.
+    Re-entering the lock for the same property (e.g. commit_booking inside a view that
+    already holds it) reuses the enclosing transaction.
+    """
+    if _locked_answers(property_id) is not None:
+        yield
+        return
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            list(Property.objects.select_for_update().filter(pk=property_id).values_list('pk', flat=True))
+        else:
+            Property.objects.filter(pk=property_id).update(updated_at=F('updated_at'))
+        token = _locked_availability.set((property_id, {}))
+        try:
+            yield
+        finally:
+            _locked_availability.reset(token)
+
+
+def commit_booking(booking):
+    """
+    Insert a new booking, checking its window exactly once under the property's write lock.
+    Raises ValidationError when the window is no longer available. Pending bookings hold
+    the window for BOOKING_HOLD_MINUTES until a payment is submitted (see release_hold).
+
+    Callers that create related rows (guests) should wrap this call and those writes in a
+    single transaction.atomic() block so the lock is held until everything is committed.
+    """
+    with property_write_lock(booking.property_id):
+        if booking.start_datetime and booking.end_datetime:
+            available = is_timeslot_available(
+                property_obj=booking.property,
+                start_dt=booking.start_datetime,
+                end_dt=booking.end_datetime,
+                exclude_booking_id=booking.pk,
+            )
+            if not available:
+                raise ValidationError(BOOKING_CONFLICT_MESSAGE)
+        if booking.status == 'pending' and booking.hold_expires_at is None:
+            booking.hold_expires_at = hold_expiry()
+        # Booking.clean() gets the answer above from the lock's cache
+        booking.save()
+    return booking
+
+
+def release_hold(booking_id):
+    """
+    Keep a pending booking once its payment is submitted: the hold is dropped, unless it
+    already expired (the window may have been given to someone else since).
+    """
+    return Booking.objects.filter(
+        pk=booking_id, status='pending', hold_expires_at__gt=timezone.now()
+    ).update(hold_expires_at=None)
+
+
+def parse_guest_names(text):
+    """
+    Split a guest-names textarea (one name per line) into stripped, non-empty names.
+    Raises ValidationError when there are more than BOOKING_MAX_GUESTS names.
+    """
+    names = [line.strip() for line in (text or '').splitlines() if line.strip()]
+    max_guests = getattr(settings, 'BOOKING_MAX_GUESTS', 500)
+    if len(names) > max_guests:
+        raise ValidationError(f'لا يمكن إضافة أكثر من {max_guests} ضيف للحجز الواحد')
+    return names
+
+
+def generate_guest_codes(count):
+    """
+    Return `count` distinct random invitation codes not yet issued to any guest.
+    Codes are de-duplicated in memory and checked against the table with one query per round;
+    a second round is only needed on a collision.
+    """
+    codes = set()
+    while len(codes) < count:
+        fresh = set()
+        while len(codes) + len(fresh) < count:
+            code = ''.join(secrets.choice(GUEST_CODE_ALPHABET) for _ in range(GUEST_CODE_LENGTH))
+            if code not in codes:
+                fresh.add(code)
+        fresh -= set(BookingGuest.objects.filter(code__in=fresh).values_list('code', flat=True))
+        codes |= fresh
+    return list(codes)
+
+
+def issue_guests(booking, guest_text):
+    """
+    Create the guests of a newly inserted booking from a guest-names textarea.
+
+    Serials run from 1 in input order and codes are generated up front (see
+    generate_guest_codes), so all rows go out in one bulk_create (batched by the backend's
+    parameter limit) instead of an existence probe and an INSERT per guest. Call it inside
+    the booking's transaction.
+    """
+    names = parse_guest_names(guest_text)
+    if not names:
+        return []
+    codes = generate_guest_codes(len(names))
+    return BookingGuest.objects.bulk_create([
+        BookingGuest(booking=booking, serial=serial, name=name, code=code)
+        for serial, (name, code) in enumerate(zip(names, codes), start=1)
+    ])
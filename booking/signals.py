@@ -0,0 +1,80 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from portfolio.models import Property
+from portfolio.search_cache import invalidate_properties_search_cache, invalidate_search_cache
+from portfolio.stats import booking_status_changed, drop_booking_stats, drop_site_stats
+
+from .availability_index import availability_index
+from .models import Booking, Payment
+from .occupancy import refresh_booking_occupancy
+from .pricing import invalidate_rate_card
+from .services import forget_locked_availability, release_hold
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_availability_index(sender, instance, **kwargs):
+    """إبطال فهرس التوفر للعقار عند إنشاء أو تعديل أو حذف حجز"""
+    availability_index.invalidate(instance.property_id)
+    forget_locked_availability(instance.property_id)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_day_occupancy(sender, instance, signal, **kwargs):
+    """تحديث جدول الإشغال اليومي للأيام التي يغطيها الحجز قبل التعديل وبعده"""
+    refresh_booking_occupancy(instance, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def drop_property_searches(sender, instance, **kwargs):
+    """إبطال نتائج البحث المخزنة لمدينة العقار عند تغيير حجوزاته (فلتر التوفر)"""
+    if Booking.property.is_cached(instance):
+        invalidate_search_cache({instance.property.city})
+    else:
+        invalidate_properties_search_cache({instance.property_id})
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def adjust_site_stats(sender, instance, signal, **kwargs):
+    """تحديث عدادات الصفحة الرئيسية عند تأكيد حجز أو إلغائه أو حذفه"""
+    booking_status_changed(instance, deleted=signal is post_delete)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def drop_owner_stats(sender, instance, **kwargs):
+    """إبطال إحصائيات المالك والعقار (قبل نقل الحجز وبعده) عند تغيير حجز"""
+    loaded = getattr(instance, '_loaded_window', None)
+    property_ids = {instance.property_id, loaded[0] if loaded else None} - {None}
+    if property_ids == {instance.property_id} and Booking.property.is_cached(instance):
+        owner_ids = {instance.property.owner_id}
+    else:
+        owner_ids = set(Property.objects.filter(pk__in=property_ids).values_list('owner_id', flat=True))
+    drop_booking_stats(property_ids, owner_ids)
+
+
+@receiver(post_save, sender=Payment)
+def release_booking_hold(sender, instance, created, **kwargs):
+    """إلغاء مهلة الحجز المعلق عند تقديم الدفع حتى لا يُلغى تلقائياً"""
+    if created:
+        release_hold(instance.booking_id)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def drop_rate_card(sender, instance, **kwargs):
+    """حذف بطاقة أسعار العقار من الكاش عند تعديله"""
+    invalidate_rate_card(instance.pk)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def drop_property_stats(sender, instance, **kwargs):
+    """إعادة حساب عدادات العقارات في الصفحة الرئيسية ولوحة المالك بعد إضافة عقار أو تعديله أو حذفه"""
+    transaction.on_commit(drop_site_stats)
+    drop_booking_stats([instance.pk], [instance.owner_id])
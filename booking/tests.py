@@ -1,3 +1,821 @@
-from django.test import TestCase
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from portfolio.models import Property
+from portfolio.search_cache import search_generation
+from portfolio.stats import (
+    LOCK_KEY, compute_owner_stats, compute_site_stats, drop_site_stats, owner_stats, property_booking_stats, site_stats,
+)
+from .availability_index import VERSION_KEY, availability_index
+from .models import Booking, BookingGuest, Payment, PropertyDayOccupancy
+from .occupancy import occupied_property_ids
+from .pricing import RateCard, deposit_for, quote, quote_many, rate_cards
+from .services import (
+    ACTIVE_STATUSES, commit_booking, default_booking_window, generate_guest_codes, is_timeslot_available,
+    issue_guests, nearest_free_slots, overlap_q, blocking_q,
+)
+
+
+def make_booking(property_obj, start, end, status='confirmed', **kwargs):
+    return Booking.objects.create(
+        property=property_obj,
+        booking_date=start.date(),
+        start_datetime=start,
+        end_datetime=end,
+        status=status,
+        **{'total_price': 100, 'customer_name': 'Test Customer', 'customer_phone': '0500000000', **kwargs}
+    )
+
+
+@override_settings(AVAILABILITY_INDEX_ENABLED=True, AVAILABILITY_INDEX_MAX_PROPERTIES=2)
+class AvailabilityIndexTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        availability_index.clear()
+        self.property = Property.objects.create(name='Indexed Property', price_per_day=100, capacity=5)
+        self.start = timezone.now() + timedelta(days=2)
+        self.end = self.start + timedelta(hours=6)
+        self.booking = make_booking(self.property, self.start, self.end)
+
+    def tearDown(self):
+        availability_index.clear()
+
+    def check(self, start, end, **kwargs):
+        return is_timeslot_available(property_obj=self.property, start_dt=start, end_dt=end, **kwargs)
+
+    def test_answers_from_memory_after_first_build(self):
+        self.assertFalse(self.check(self.start, self.end))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.check(self.start + timedelta(hours=1), self.end + timedelta(hours=1)))
+            self.assertTrue(self.check(self.end, self.end + timedelta(hours=2)))
+            self.assertTrue(self.check(self.start, self.end, exclude_booking_id=self.booking.pk))
+
+    def test_invalidated_by_booking_changes(self):
+        later = self.end + timedelta(hours=2)
+        self.assertTrue(self.check(later, later + timedelta(hours=2)))
+        other = make_booking(self.property, later, later + timedelta(hours=2), status='pending')
+        self.assertFalse(self.check(later, later + timedelta(hours=2)))
+        other.status = 'cancelled'
+        other.save()
+        self.assertTrue(self.check(later, later + timedelta(hours=2)))
+        self.booking.delete()
+        self.assertTrue(self.check(self.start, self.end))
+
+    def test_version_bump_from_another_worker_forces_rebuild(self):
+        self.check(self.start, self.end)
+        # Simulate another worker writing a booking and bumping the shared stamp
+        Booking.objects.filter(pk=self.booking.pk).update(status='cancelled')
+        self.assertFalse(self.check(self.start, self.end))
+        cache.incr(VERSION_KEY.format(self.property.pk))
+        self.assertTrue(self.check(self.start, self.end))
+
+    def test_lru_is_bounded(self):
+        others = [Property.objects.create(name=f'Other {i}', capacity=5) for i in range(3)]
+        for prop in [self.property, *others]:
+            is_timeslot_available(property_obj=prop, start_dt=self.start, end_dt=self.end)
+        self.assertEqual(len(availability_index._entries), 2)
+
+    def test_falls_back_to_sql_for_past_windows(self):
+        past = timezone.now() - timedelta(days=3)
+        self.check(self.start, self.end)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check(past, past + timedelta(hours=2)))
+
+
+class AvailabilityIndexDisabledTests(TestCase):
+    def test_sql_used_when_disabled(self):
+        prop = Property.objects.create(name='Plain Property', capacity=5)
+        start = timezone.now() + timedelta(days=1)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_timeslot_available(property_obj=prop, start_dt=start, end_dt=start + timedelta(hours=2)))
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+    'needs a database that blocks on locks instead of failing',
+)
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 300
+
+    def setUp(self):
+        self.property = Property.objects.create(name='Contested Property', price_per_day=100, capacity=5)
+        day = timezone.localdate() + timedelta(days=7)
+        self.start = timezone.make_aware(datetime.combine(day, dtime(14, 0)))
+        self.end = timezone.make_aware(datetime.combine(day, dtime(20, 0)))
+
+    def test_no_double_booking_under_contention(self):
+        barrier = threading.Barrier(self.THREADS)
+        created, rejected, errors = [], [], []
+
+        def attempt(n):
+            try:
+                barrier.wait()
+                booking = Booking(
+                    property=self.property,
+                    booking_date=self.start.date(),
+                    start_datetime=self.start,
+                    end_datetime=self.end,
+                    booking_type='half_day',
+                    total_price=100,
+                    customer_name=f'Customer {n}',
+                    customer_phone='0500000000',
+                )
+                commit_booking(booking)
+                created.append(booking.pk)
+            except ValidationError:
+                rejected.append(n)
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=attempt, args=(n,)) for n in range(self.THREADS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(rejected), self.THREADS - 1)
+        self.assertEqual(Booking.objects.filter(property=self.property).count(), 1)
+        sys.stderr.write(
+            f"\n[booking stress] {self.THREADS} conflicting requests in {elapsed:.2f}s "
+            f"({self.THREADS / elapsed:.0f} req/s), 1 booking committed\n"
+        )
+
+
+class BookingWindowBackfillTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(
+            name='Legacy Property', capacity=5, checkin_time=dtime(14, 0), checkout_time=dtime(12, 0)
+        )
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def test_save_fills_window_of_date_only_booking(self):
+        booking = Booking.objects.create(
+            property=self.property, booking_date=self.day, total_price=100,
+            customer_name='Legacy Customer', customer_phone='0500000000',
+        )
+        self.assertEqual(booking.start_datetime, timezone.make_aware(datetime.combine(self.day, dtime(14, 0))))
+        self.assertEqual(booking.end_datetime, timezone.make_aware(datetime.combine(self.day + timedelta(days=1), dtime(12, 0))))
+
+    def test_command_backfills_in_batches(self):
+        # bulk_create bypasses Booking.save(), like rows written before the backfill
+        Booking.objects.bulk_create([
+            Booking(property=self.property, booking_date=self.day + timedelta(days=i), total_price=100,
+                    customer_name='Legacy Customer', customer_phone='0500000000')
+            for i in range(5)
+        ])
+        out = StringIO()
+        call_command('backfill_booking_windows', batch_size=2, stdout=out)
+        self.assertFalse(Booking.objects.filter(start_datetime__isnull=True).exists())
+        first = Booking.objects.get(booking_date=self.day)
+        self.assertEqual(first.start_datetime, timezone.make_aware(datetime.combine(self.day, dtime(14, 0))))
+        self.assertIn('5', out.getvalue())
+
+    def test_conflict_query_is_single_index_range_scan(self):
+        """
+        Before (legacy OR predicate), SQLite:
+            SEARCH booking_booking USING INDEX booking_prop_status_window_idx (property_id=? AND status=?)
+        After (pure range predicate):
+            SEARCH booking_booking USING COVERING INDEX booking_prop_status_window_idx
+                (property_id=? AND status=? AND start_datetime<?)
+        """
+        start = timezone.make_aware(datetime.combine(self.day, dtime(14, 0)))
+        end = start + timedelta(hours=6)
+        base = Booking.objects.filter(status__in=ACTIVE_STATUSES, property=self.property).exclude(pk=1)
+
+        legacy_q = Q(start_datetime__isnull=True, end_datetime__isnull=True) & (
+            Q(booking_date=start.date()) | Q(booking_date=end.date())
+        )
+        before = base.filter(
+            Q(start_datetime__isnull=False, end_datetime__isnull=False, start_datetime__lt=end, end_datetime__gt=start)
+            | legacy_q
+        ).order_by().values('pk')[:1].explain()
+        # Expired holds are filtered from hold_expires_at, carried in the same index
+        after = base.filter(blocking_q(), overlap_q(start, end)).order_by().values('pk')[:1].explain()
+
+        message = f'\nbefore:\n{before}\nafter:\n{after}'
+        self.assertIn('booking_prop_status_window_idx', after, message)
+        if connection.vendor == 'sqlite':
+            self.assertIn('COVERING INDEX', after, message)
+            self.assertIn('start_datetime<?', after, message)
+            self.assertNotIn('start_datetime<?', before, message)
+
+
+class BookingValidationQueryTests(TestCase):
+    """One overlap query per created booking, none for status transitions"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='password')
+        UserProfile.objects.create(user=self.owner, is_owner=True)
+        self.customer = User.objects.create_user(username='customer', password='password')
+        self.property = Property.objects.create(name='Counted Property', price_per_day=100, capacity=5, owner=self.owner)
+        self.day = timezone.localdate() + timedelta(days=4)
+
+    @staticmethod
+    def overlap_queries(ctx):
+        # Availability probes are exists() queries; occupancy refreshes read the same range without LIMIT
+        return [q for q in ctx.captured_queries
+                if '"booking_booking"."end_datetime" >' in q['sql'] and q['sql'].endswith('LIMIT 1')]
+
+    def test_form_create_runs_one_overlap_query(self):
+        self.client.force_login(self.customer)
+        data = {
+            'booking_type': 'full_day',
+            'booking_date': self.day.isoformat(),
+            'customer_name': 'Test Customer Full Name',
+            'customer_phone': '777123456',
+            'guest_names': 'Guest One\nGuest Two',
+        }
+        url = reverse('booking:create_property_booking', args=[self.property.pk])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        booking = Booking.objects.get()
+        self.assertEqual(booking.guests.count(), 2)
+        self.assertEqual(len(self.overlap_queries(ctx)), 1)
+
+    def test_form_create_conflict(self):
+        start, end = default_booking_window(self.property, self.day)
+        make_booking(self.property, start, end)
+        self.client.force_login(self.customer)
+        url = reverse('booking:create_property_booking', args=[self.property.pk])
+        response = self.client.post(url, {
+            'booking_type': 'full_day',
+            'booking_date': self.day.isoformat(),
+            'customer_name': 'Test Customer Full Name',
+            'customer_phone': '777123456',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Booking.objects.count(), 1)
+        suggested = response.context['form'].suggested_slots
+        self.assertEqual(suggested[0]['start'], default_booking_window(self.property, self.day - timedelta(days=1))[0])
+
+    def test_status_transitions_run_no_overlap_query(self):
+        start = timezone.now() + timedelta(days=1)
+        booking = make_booking(self.property, start, start + timedelta(hours=6), status='pending')
+        # An ongoing booking: its start is already in the past
+        Booking.objects.filter(pk=booking.pk).update(start_datetime=timezone.now() - timedelta(hours=1))
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('portfolio:owner_booking_approve', args=[booking.pk]))
+            self.client.post(reverse('portfolio:owner_booking_cancel', args=[booking.pk]))
+        self.assertEqual(self.overlap_queries(ctx), [])
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, 'cancelled')
+
+    def test_reactivation_is_checked(self):
+        start = timezone.now() + timedelta(days=1)
+        end = start + timedelta(hours=6)
+        cancelled = make_booking(self.property, start, end, status='cancelled')
+        make_booking(self.property, start, end)
+        cancelled.status = 'pending'
+        with self.assertRaises(ValidationError):
+            cancelled.save()
+
+    def test_update_fields_reactivation_is_checked(self):
+        start = timezone.now() + timedelta(days=1)
+        end = start + timedelta(hours=6)
+        cancelled = make_booking(self.property, start, end, status='cancelled')
+        make_booking(self.property, start, end)
+        cancelled.status = 'confirmed'
+        with self.assertRaises(ValidationError):
+            cancelled.save(update_fields=['status', 'updated_at'])
+
+        # The owner approving the cancelled booking gets an error instead of a second confirmed booking
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('portfolio:owner_booking_approve', args=[cancelled.pk]))
+        self.assertRedirects(response, reverse('portfolio:owner_bookings'), fetch_redirect_response=False)
+        self.assertEqual(len(self.overlap_queries(ctx)), 1)
+        self.assertEqual(Booking.objects.get(pk=cancelled.pk).status, 'cancelled')
+        self.assertEqual(Booking.objects.filter(status='confirmed').count(), 1)
+
+
+class GuestIssuanceTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(name='Wedding Hall', price_per_day=100, capacity=1000)
+        start = timezone.now() + timedelta(days=2)
+        self.booking = make_booking(self.property, start, start + timedelta(hours=6))
+
+    def test_guests_written_with_one_insert(self):
+        names = '\n'.join(f'Guest {i}' for i in range(1, 61))
+        # One probe for already issued codes, one INSERT
+        with self.assertNumQueries(2):
+            issue_guests(self.booking, f'  \n{names}\n\n')
+        guests = list(self.booking.guests.all())
+        self.assertEqual([g.serial for g in guests], list(range(1, 61)))
+        self.assertEqual(guests[0].name, 'Guest 1')
+        self.assertEqual(len({g.code for g in guests}), 60)
+
+    def test_codes_already_issued_are_skipped(self):
+        taken = BookingGuest.objects.create(booking=self.booking, serial=99, name='Old Guest', code='A' * 10)
+        # First candidate collides with the stored code, the second is fresh
+        letters = iter('A' * 10 + 'B' * 10)
+        with mock.patch('booking.services.secrets.choice', side_effect=lambda alphabet: next(letters)):
+            self.assertEqual(generate_guest_codes(1), ['B' * 10])
+        self.assertEqual(taken.code, 'AAAAAAAAAA')
+
+    def test_gate_lookup_uses_unique_code_index(self):
+        plan = BookingGuest.objects.filter(code='ABCDEFGHJK').explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING INDEX', plan)
+
+    @override_settings(BOOKING_MAX_GUESTS=3)
+    def test_guest_count_is_capped(self):
+        with self.assertRaises(ValidationError):
+            issue_guests(self.booking, 'A\nB\nC\nD')
+        self.assertFalse(BookingGuest.objects.exists())
+
+    @override_settings(BOOKING_MAX_GUESTS=1000)
+    def test_benchmark_guest_issuance(self):
+        for count in (10, 100, 1000):
+            BookingGuest.objects.all().delete()
+            names = '\n'.join(f'Guest {i}' for i in range(count))
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                issue_guests(self.booking, names)
+                elapsed = time.perf_counter() - started
+            self.assertEqual(self.booking.guests.count(), count)
+            # Only the backend's bulk parameter limit splits the INSERT (previously 2 queries per guest)
+            self.assertLess(len(ctx.captured_queries), count // 100 + 3)
+            sys.stderr.write(
+                f"\n[guest issuance] {count} guests: {len(ctx.captured_queries)} queries, {elapsed * 1000:.1f} ms\n"
+            )
+
+
+class DayOccupancyTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(name='Occupied Chalet', price_per_day=100, capacity=5)
+        self.other = Property.objects.create(name='Free Chalet', price_per_day=100, capacity=5)
+        self.day = timezone.localdate() + timedelta(days=5)
+
+    def at(self, hour, day=None):
+        return timezone.make_aware(datetime.combine(day or self.day, dtime(hour, 0)))
+
+    def rows(self):
+        return list(
+            PropertyDayOccupancy.objects.filter(property=self.property).order_by('date')
+            .values_list('date', 'morning_busy', 'evening_busy', 'full_busy')
+        )
+
+    def test_rows_follow_booking_writes(self):
+        booking = make_booking(self.property, self.at(8), self.at(14), status='pending')
+        self.assertEqual(self.rows(), [(self.day, True, False, False)])
+
+        # Moved to the evening of the next day: old day cleared, new day filled
+        next_day = self.day + timedelta(days=1)
+        booking.start_datetime, booking.end_datetime = self.at(14, next_day), self.at(20, next_day)
+        booking.booking_date = next_day
+        booking.save()
+        self.assertEqual(self.rows(), [(next_day, False, True, False)])
+
+        # Approval keeps the booking blocking: no refresh
+        booking.status = 'confirmed'
+        with self.assertNumQueries(1):
+            booking.save(update_fields=['status'])
+
+        booking.status = 'cancelled'
+        booking.save(update_fields=['status'])
+        self.assertEqual(self.rows(), [])
+
+    def test_overnight_booking_spans_two_days(self):
+        booking = make_booking(self.property, self.at(8), self.at(12, self.day + timedelta(days=1)))
+        self.assertEqual(self.rows(), [
+            (self.day, True, True, True),
+            (self.day + timedelta(days=1), True, False, False),
+        ])
+        booking.delete()
+        self.assertEqual(self.rows(), [])
+
+    def test_rebuild_command_matches_incremental_rows(self):
+        make_booking(self.property, self.at(8), self.at(20))
+        make_booking(self.property, self.at(14, self.day + timedelta(days=2)), self.at(20, self.day + timedelta(days=2)))
+        incremental = self.rows()
+        PropertyDayOccupancy.objects.all().delete()
+        call_command('rebuild_occupancy', stdout=StringIO())
+        self.assertEqual(self.rows(), incremental)
+
+    def test_search_paths_use_occupancy(self):
+        make_booking(self.property, self.at(14), self.at(20))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('portfolio:property_list'), {'booking_date': self.day.isoformat()})
+        listed = [p.pk for p in response.context['properties']]
+        self.assertEqual(listed, [self.other.pk])
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "booking_booking"' in q['sql']])
+
+        self.assertEqual(list(occupied_property_ids(self.at(8), self.at(14))), [])
+        self.assertEqual(list(occupied_property_ids(self.at(8), self.at(20))), [{'property_id': self.property.pk}])
+        # Not made of half-day periods: callers fall back to the exact overlap query
+        self.assertIsNone(occupied_property_ids(self.at(9), self.at(13)))
+        self.assertIsNone(occupied_property_ids(self.at(20), self.at(8, self.day + timedelta(days=1))))
+
+
+class NearestFreeSlotsTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(name='Busy Chalet', price_per_day=100, capacity=5)
+        self.day = timezone.localdate() + timedelta(days=10)
+
+    def at(self, hour, days=0):
+        return timezone.make_aware(datetime.combine(self.day + timedelta(days=days), dtime(hour, 0)))
+
+    def test_half_day_suggestions_fill_gaps_nearest_first(self):
+        make_booking(self.property, self.at(8), self.at(14))
+        make_booking(self.property, self.at(14, 1), self.at(20, 1))
+        with self.assertNumQueries(1):
+            slots = nearest_free_slots(property_obj=self.property, booking_type='half_day', around=self.at(8), count=3)
+        self.assertEqual([slot['start'] for slot in slots], [self.at(14), self.at(14, -1), self.at(8, -1)])
+
+    def test_full_day_suggestions_skip_busy_days(self):
+        make_booking(self.property, self.at(8), self.at(20))
+        make_booking(self.property, self.at(8, 1), self.at(20, 1))
+        slots = nearest_free_slots(property_obj=self.property, booking_type='full_day', around=self.at(8, 1), count=2)
+        self.assertEqual(slots, [
+            {'start': self.at(8, 2), 'end': self.at(20, 2)},
+            {'start': self.at(8, -1), 'end': self.at(20, -1)},
+        ])
+
+    def test_no_suggestions_in_the_past(self):
+        around = timezone.now() - timedelta(days=3)
+        slots = nearest_free_slots(property_obj=self.property, booking_type='half_day', around=around, count=5)
+        self.assertTrue(all(slot['start'] >= timezone.now() for slot in slots))
+
+
+@override_settings(BOOKING_HOLD_MINUTES=30)
+class BookingHoldTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create(name='Held Chalet', price_per_day=100, capacity=5)
+        self.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=3), dtime(8, 0)))
+        self.end = self.start + timedelta(hours=6)
+
+    def hold(self):
+        return commit_booking(Booking(
+            property=self.property, booking_date=self.start.date(), start_datetime=self.start, end_datetime=self.end,
+            total_price=100, customer_name='Held Customer', customer_phone='0500000000',
+        ))
+
+    def expire(self, booking):
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+    def available(self):
+        return is_timeslot_available(property_obj=self.property, start_dt=self.start, end_dt=self.end)
+
+    def test_pending_booking_blocks_until_hold_expires(self):
+        booking = self.hold()
+        self.assertIsNotNone(booking.hold_expires_at)
+        self.assertFalse(self.available())
+        self.expire(booking)
+        self.assertTrue(self.available())
+
+    def test_payment_and_confirmation_release_the_hold(self):
+        booking = self.hold()
+        Payment.objects.create(booking=booking, payment_method='cash', status='pending')
+        booking.refresh_from_db()
+        self.assertIsNone(booking.hold_expires_at)
+
+        other = commit_booking(Booking(
+            property=self.property, booking_date=self.end.date(), start_datetime=self.end,
+            end_datetime=self.end + timedelta(hours=6), total_price=100,
+            customer_name='Held Customer', customer_phone='0500000000',
+        ))
+        other.status = 'confirmed'
+        other.save(update_fields=['status', 'updated_at'])
+        other.refresh_from_db()
+        self.assertIsNone(other.hold_expires_at)
+
+    def test_confirming_an_expired_hold_is_checked(self):
+        booking = self.hold()
+        self.expire(booking)
+        # The window was given to someone else once the hold ran out
+        self.hold()
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = 'confirmed'
+        with self.assertRaises(ValidationError):
+            booking.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(Booking.objects.filter(status='confirmed').count(), 0)
+
+        # Without a competing booking the expired hold can still be confirmed
+        Booking.objects.exclude(pk=booking.pk).delete()
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = 'confirmed'
+        booking.save(update_fields=['status', 'updated_at'])
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).hold_expires_at)
+
+    def test_sweeper_cancels_expired_holds_in_batches(self):
+        expired = [self.hold()]
+        for days in (1, 2):
+            start, end = self.start + timedelta(days=days), self.end + timedelta(days=days)
+            expired.append(commit_booking(Booking(
+                property=self.property, booking_date=start.date(), start_datetime=start, end_datetime=end,
+                total_price=100, customer_name='Held Customer', customer_phone='0500000000',
+            )))
+        for booking in expired:
+            self.expire(booking)
+        live = commit_booking(Booking(
+            property=self.property, booking_date=self.end.date(), start_datetime=self.end,
+            end_datetime=self.end + timedelta(hours=6), total_price=100,
+            customer_name='Held Customer', customer_phone='0500000000',
+        ))
+        self.assertEqual(PropertyDayOccupancy.objects.filter(property=self.property).count(), 3)
+
+        out = StringIO()
+        call_command('expire_booking_holds', batch_size=2, stdout=out)
+
+        self.assertEqual(Booking.objects.filter(status='cancelled').count(), 3)
+        self.assertEqual(Booking.objects.get(pk=live.pk).status, 'pending')
+        # Only the day of the live hold stays busy
+        self.assertEqual(
+            list(PropertyDayOccupancy.objects.values_list('date', 'morning_busy', 'evening_busy')),
+            [(self.start.date(), False, True)],
+        )
+        self.assertIn('3', out.getvalue().splitlines()[-1])
+
+    @override_settings(AVAILABILITY_INDEX_ENABLED=True)
+    def test_index_entry_goes_stale_when_a_hold_expires(self):
+        availability_index.clear()
+        booking = self.hold()
+        entry = availability_index._get(self.property.pk)
+        self.assertTrue(entry.has_conflict(self.start, self.end))
+        with mock.patch('django.utils.timezone.now', return_value=booking.hold_expires_at):
+            self.assertTrue(entry.is_stale())
+            self.assertFalse(availability_index._get(self.property.pk).has_conflict(self.start, self.end))
+        availability_index.clear()
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.property = Property.objects.create(
+            name='Priced Chalet', price_per_hour=50, price_half_day=300, price_per_day=500, capacity=5,
+        )
+        self.start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=3), dtime(14, 0)))
+
+    def test_rate_card_prices_each_booking_type(self):
+        card = RateCard.from_property(self.property)
+        self.assertEqual(card.price('hourly', self.start, self.start + timedelta(minutes=150)), 150)
+        self.assertEqual(card.price('half_day', self.start, self.start + timedelta(hours=6)), 300)
+        self.assertEqual(card.price('full_day', self.start, self.start + timedelta(hours=24)), 500)
+        self.assertEqual(card.price('full_day', self.start, self.start + timedelta(hours=30)), 1000)
+        self.assertEqual(card.price('overnight', self.start, self.start + timedelta(days=3, hours=-2)), 1500)
+        self.assertIsNone(RateCard(self.property.pk).price('full_day'))
+        self.assertEqual(RateCard(self.property.pk, per_day=500).price('half_day'), 500)
+
+    def test_quote_many_uses_one_query_then_the_cache(self):
+        others = [Property.objects.create(name=f'Priced {i}', price_per_day=100 * (i + 1), capacity=5) for i in range(3)]
+        ids = [self.property.pk] + [p.pk for p in others] + [999999]
+        end = self.start + timedelta(hours=24)
+
+        with self.assertNumQueries(1):
+            totals = quote_many(ids, 'full_day', self.start, end)
+        self.assertEqual(totals, {self.property.pk: 500, others[0].pk: 100, others[1].pk: 200, others[2].pk: 300})
+        with self.assertNumQueries(0):
+            self.assertEqual(quote_many(list(totals), 'full_day', self.start, end), totals)
+
+    def test_saving_a_property_drops_its_rate_card(self):
+        rate_cards([self.property.pk])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.property.price_per_day = 650
+            self.property.save()
+            # Until the save commits a concurrent quote would reload the old prices: keep the card
+            with self.assertNumQueries(0):
+                rate_cards([self.property.pk])
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(1):
+            self.assertEqual(rate_cards([self.property.pk])[self.property.pk].per_day, 650)
+        self.assertEqual(quote(self.property, 'full_day'), 650)
+
+    @override_settings(DEPOSIT_PERCENT=20)
+    def test_deposit_is_rounded_half_up(self):
+        self.assertEqual(deposit_for(Decimal('512.50')), 103)
+        self.assertEqual(deposit_for(Decimal('100'), 15), 15)
+        self.assertEqual(deposit_for(None), 0)
+
+
+class SiteStatsTests(TestCase):
+    """Home page counters (portfolio/stats.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.property = Property.objects.create(name='Stats Chalet', price_per_day=100, capacity=5, is_verified_by_platform=True)
+        Property.objects.create(name='Stats Garden', price_per_day=100, capacity=5)
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def at(self, day_offset, hour):
+        return timezone.make_aware(datetime.combine(self.day + timedelta(days=day_offset), dtime(hour)))
+
+    def book(self, day_offset, phone, status='confirmed'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_booking(self.property, self.at(day_offset, 8), self.at(day_offset, 14), status=status, customer_phone=phone)
+
+    def test_one_query_then_cached(self):
+        self.book(0, '0500000001')
+        self.book(1, '0500000001')
+        self.book(2, '0500000002')
+        self.book(3, '0500000003', status='pending')
+        with self.assertNumQueries(1):
+            stats = compute_site_stats()
+        self.assertEqual(stats, {'total_properties': 2, 'verified_properties': 1, 'total_bookings': 3, 'happy_customers': 2})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('portfolio:home'))
+        self.assertEqual(response.context['stats'], stats)
+        self.assertEqual(len([q for q in ctx.captured_queries if 'COUNT(' in q['sql']]), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('portfolio:home'))
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_status_transitions_adjust_cached_counters(self):
+        site_stats()
+        first = self.book(0, '0500000001', status='pending')
+        second = self.book(1, '0500000001')
+        expected = compute_site_stats()
+        self.assertEqual(site_stats(), expected)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = 'confirmed'
+            first.save(update_fields=['status'])
+        with self.assertNumQueries(0):
+            stats = site_stats()
+        self.assertEqual(stats, compute_site_stats())
+        self.assertEqual((stats['total_bookings'], stats['happy_customers']), (2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.customer_phone = '0500000009'
+            second.save()
+        self.assertEqual(site_stats(), compute_site_stats())
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = 'cancelled'
+            first.save(update_fields=['status'])
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        with self.assertNumQueries(0):
+            stats = site_stats()
+        self.assertEqual(stats, compute_site_stats())
+        self.assertEqual((stats['total_bookings'], stats['happy_customers']), (0, 0))
+
+        # Property writes drop the counters: the next read recomputes them
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.create(name='Stats Istiraha', price_per_day=100, capacity=5, is_verified_by_platform=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(site_stats()['verified_properties'], 2)
+
+    def test_single_flight_recompute(self):
+        calls = []
+
+        def slow_compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'total_properties': 1, 'verified_properties': 1, 'total_bookings': 0, 'happy_customers': 0}
+
+        results = []
+        with mock.patch('portfolio.stats.compute_site_stats', side_effect=slow_compute):
+            threads = [threading.Thread(target=lambda: results.append(site_stats())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result['total_properties'] == 1 for result in results))
+
+        # Expired counters with a recomputation in progress elsewhere: serve the last values
+        drop_site_stats()
+        cache.add(LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(site_stats()['total_properties'], 1)
+
+
+class OwnerStatsTests(TestCase):
+    """Owner dashboard counters (portfolio/stats.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='stats-owner', password='password')
+        UserProfile.objects.create(user=self.owner, is_owner=True)
+        self.other = User.objects.create_user(username='other-owner', password='password')
+        self.property = Property.objects.create(name='Owner Chalet', price_per_day=100, capacity=5, owner=self.owner)
+        self.empty = Property.objects.create(name='Owner Garden', price_per_day=100, capacity=5, owner=self.owner)
+        self.foreign = Property.objects.create(name='Other Chalet', price_per_day=100, capacity=5, owner=self.other)
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def at(self, day_offset, hour):
+        return timezone.make_aware(datetime.combine(self.day + timedelta(days=day_offset), dtime(hour)))
+
+    def book(self, property_obj, day_offset, status='confirmed', total_price=100):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_booking(property_obj, self.at(day_offset, 8), self.at(day_offset, 14), status=status, total_price=total_price)
+
+    def test_one_query_matches_per_status_counts(self):
+        self.book(self.property, 0, total_price=150)
+        self.book(self.property, 1, total_price=250)
+        self.book(self.property, 2, status='pending')
+        self.book(self.property, 3, status='cancelled')
+        self.book(self.foreign, 0)
+        with self.assertNumQueries(1):
+            stats = compute_owner_stats(self.owner.pk)
+        self.assertEqual(stats, {
+            'properties_count': 2, 'bookings_count': 4, 'pending_count': 1, 'confirmed_count': 2,
+            'cancelled_count': 1, 'total_revenue': Decimal('400'),
+        })
+        self.assertEqual(compute_owner_stats(self.other.pk)['properties_count'], 1)
+        with self.assertNumQueries(1):
+            site = compute_owner_stats()
+        self.assertEqual((site['bookings_count'], site['confirmed_count'], site['total_revenue']), (5, 3, Decimal('500')))
+
+        # No bookings at all: zero revenue rather than None
+        empty = compute_owner_stats(User.objects.create_user(username='new-owner').pk)
+        self.assertEqual((empty['properties_count'], empty['bookings_count'], empty['total_revenue']), (0, 0, Decimal('0')))
+
+    def test_cached_until_a_booking_of_the_owner_changes(self):
+        booking = self.book(self.property, 0, status='pending')
+        self.assertEqual(owner_stats(self.owner)['pending_count'], 1)
+        self.assertEqual(owner_stats(self.other)['bookings_count'], 0)
+        self.assertEqual(property_booking_stats(self.property.pk)['pending_count'], 1)
+        with self.assertNumQueries(0):
+            owner_stats(self.owner)
+            property_booking_stats(self.property.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'confirmed'
+            booking.save(update_fields=['status'])
+        with self.assertNumQueries(0):
+            # Another owner's counters are untouched
+            owner_stats(self.other)
+        self.assertEqual(owner_stats(self.owner)['confirmed_count'], 1)
+        self.assertEqual(property_booking_stats(self.property.pk)['confirmed_count'], 1)
+
+        # Moving the booking to another owner's property refreshes both owners
+        owner_stats(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.get(pk=booking.pk)
+            booking.property = self.foreign
+            booking.save()
+        self.assertEqual(owner_stats(self.owner)['bookings_count'], 0)
+        self.assertEqual(owner_stats(self.other)['bookings_count'], 1)
+        self.assertEqual(property_booking_stats(self.property.pk)['bookings_count'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(owner_stats(self.other)['bookings_count'], 0)
+
+    @override_settings(BOOKING_HOLD_MINUTES=30)
+    def test_sweeper_drops_stats_of_expired_holds(self):
+        start = self.at(0, 8)
+        booking = commit_booking(Booking(
+            property=self.property, booking_date=start.date(), start_datetime=start, end_datetime=start + timedelta(hours=6),
+            total_price=100, customer_name='Held Customer', customer_phone='0500000000',
+        ))
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(owner_stats(self.owner)['pending_count'], 1)
+        self.assertEqual(property_booking_stats(self.property.pk)['pending_count'], 1)
+        generation = search_generation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_booking_holds', stdout=StringIO())
+        self.assertEqual((owner_stats(self.owner)['pending_count'], owner_stats(self.owner)['cancelled_count']), (0, 1))
+        self.assertEqual(property_booking_stats(self.property.pk)['cancelled_count'], 1)
+        self.assertNotEqual(search_generation(), generation)
+
+    def test_dashboard_views_use_cached_stats(self):
+        self.book(self.property, 0, total_price=300)
+        self.book(self.property, 1, status='pending')
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('portfolio:owner_dashboard'))
+        self.assertEqual(response.context['stats'], compute_owner_stats(self.owner.pk))
+        self.assertEqual(response.context['stats']['total_revenue'], Decimal('300'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('portfolio:owner_dashboard'))
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+        response = self.client.get(reverse('portfolio:owner_property_detail', args=[self.property.slug]))
+        self.assertEqual(
+            (response.context['total_bookings'], response.context['confirmed_bookings'], response.context['pending_bookings']),
+            (2, 1, 1),
+        )
+
+        # A new property of the owner shows up in the counters
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.create(name='Owner Istiraha', price_per_day=100, capacity=5, owner=self.owner)
+        self.assertEqual(owner_stats(self.owner)['properties_count'], 3)
@@ -6,13 +6,15 @@ from django.http import HttpResponseRedirect, HttpResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from portfolio.models import Property
-from .models import Booking, Payment, PaymentProvider, BookingGuest
+from .models import Booking, Payment, PaymentProvider
 from .forms import PropertyBookingForm, PaymentForm
+from .pricing import deposit_for
+from .services import HOLD_EXPIRED_MESSAGE, commit_booking, issue_guests, property_write_lock
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
 from django.utils import timezone
-import secrets
 import string
 from django.db.models import Q
 
@@ -66,46 +68,34 @@ class CreatePropertyBookingView(LoginRequiredMixin, TemplateView):
         property_id = kwargs.get('property_id')
         prop = get_object_or_404(Property, pk=property_id)
         form = PropertyBookingForm(request.POST, property=prop)
+        booking = None
 
-        if form.is_valid():
-            booking = form.save(commit=False)
-            booking.property = prop
-            booking.user = request.user
-            # Backfill legacy booking_date for compatibility
-            if booking.start_datetime:
-                booking.booking_date = booking.start_datetime.date()
-            # Compute total based on booking_type
-            total = form.compute_total_price()
-            if total is None:
-                total = prop.price_per_day or 0
-            booking.total_price = total
-            booking.status = 'pending'
-            booking.save()
+        try:
+            # Validate and insert under the property's write lock: the form, the model and
+            # commit_booking share one overlap check, and booking + guests commit atomically
+            with property_write_lock(prop.pk):
+                if form.is_valid():
+                    booking = form.save(commit=False)
+                    booking.property = prop
+                    booking.user = request.user
+                    # Backfill legacy booking_date for compatibility
+                    if booking.start_datetime:
+                        booking.booking_date = booking.start_datetime.date()
+                    # Compute total based on booking_type
+                    total = form.compute_total_price()
+                    if total is None:
+                        total = prop.price_per_day or 0
+                    booking.total_price = total
+                    booking.status = 'pending'
 
-            # Save guests (if provided)
-            guest_text = form.cleaned_data.get('guest_names') or ''
-            lines = [ln.strip() for ln in guest_text.splitlines() if ln and ln.strip()]
-            if lines:
-                # generate unique code per guest within this booking
-                def gen_code():
-                    alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
-                    return ''.join(secrets.choice(alphabet) for _ in range(6))
-                existing_codes = set()
-                serial = 1
-                for name in lines:
-                    code = gen_code()
-                    # ensure uniqueness per booking
-                    while code in existing_codes or BookingGuest.objects.filter(booking=booking, code=code).exists():
-                        code = gen_code()
-                    existing_codes.add(code)
-                    BookingGuest.objects.create(
-                        booking=booking,
-                        serial=serial,
-                        name=name,
-                        code=code,
-                    )
-                    serial += 1
+                    commit_booking(booking)
 
+                    issue_guests(booking, form.cleaned_data.get('guest_names'))
+        except ValidationError as e:
+            form.add_error(None, e)
+            booking = None
+
+        if booking is not None:
             messages.success(request, 'تم إنشاء الحجز بنجاح. يرجى اختيار طريقة الدفع.')
             return redirect('booking:select_payment_method', booking_id=booking.id)
 
@@ -114,6 +104,12 @@ class CreatePropertyBookingView(LoginRequiredMixin, TemplateView):
         return render(request, self.template_name, context)
 
 
+def hold_expired_redirect(request, booking):
+    """إعادة المستخدم لصفحة الحجز عند انتهاء مهلة الدفع"""
+    messages.error(request, HOLD_EXPIRED_MESSAGE)
+    return redirect('booking:create_property_booking', property_id=booking.property_id)
+
+
 class SelectPaymentMethodView(LoginRequiredMixin, TemplateView):
     """اختيار طريقة الدفع للحجز"""
     template_name = 'booking/select_payment_method.html'
@@ -123,19 +119,18 @@ class SelectPaymentMethodView(LoginRequiredMixin, TemplateView):
         booking_id = kwargs.get('booking_id')
         context['booking'] = get_object_or_404(Booking, pk=booking_id, status='pending')
         # Deposit info
-        dep_percent = getattr(settings, 'DEPOSIT_PERCENT', 0)
         total = context['booking'].total_price or Decimal('0')
-        deposit_amount = (Decimal(dep_percent) / Decimal('100')) * total
-        deposit_amount = deposit_amount.quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
-        context['deposit_percent'] = dep_percent
+        deposit_amount = deposit_for(total)
+        context['deposit_percent'] = getattr(settings, 'DEPOSIT_PERCENT', 0)
         context['deposit_amount'] = deposit_amount
-        balance_amount = (total - deposit_amount).quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
-        context['balance_amount'] = balance_amount
+        context['balance_amount'] = (total - deposit_amount).quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
         return context
     
     def post(self, request, *args, **kwargs):
         booking_id = kwargs.get('booking_id')
         booking = get_object_or_404(Booking, pk=booking_id, status='pending')
+        if booking.hold_expired():
+            return hold_expired_redirect(request, booking)
         payment_method = request.POST.get('payment_method')
         
         if payment_method == 'bank_transfer':
@@ -147,11 +142,7 @@ class SelectPaymentMethodView(LoginRequiredMixin, TemplateView):
             # Cash requires deposit; set payment status accordingly
             booking.payment_method = 'cash'
             # Compute and store deposit amount
-            dep_percent = getattr(settings, 'DEPOSIT_PERCENT', 0)
-            total = booking.total_price or Decimal('0')
-            deposit_amount = (Decimal(dep_percent) / Decimal('100')) * total
-            deposit_amount = deposit_amount.quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
-            booking.deposit_amount = deposit_amount
+            booking.deposit_amount = deposit_for(booking.total_price)
             booking.payment_status = 'cash_on_arrival'
             booking.save(update_fields=['payment_method', 'payment_status', 'deposit_amount'])
             return redirect('booking:cash_payment_confirmation', booking_id=booking.id)
@@ -187,6 +178,8 @@ class BankTransferPaymentView(LoginRequiredMixin, TemplateView):
     def post(self, request, *args, **kwargs):
         booking_id = kwargs.get('booking_id')
         booking = get_object_or_404(Booking, pk=booking_id, status='pending')
+        if booking.hold_expired():
+            return hold_expired_redirect(request, booking)
         provider_id = request.POST.get('provider_id')
         
         if not provider_id:
@@ -232,7 +225,7 @@ class CashPaymentConfirmationView(LoginRequiredMixin, TemplateView):
         # Deposit info
         dep_percent = getattr(settings, 'DEPOSIT_PERCENT', 0)
         total = context['booking'].total_price or Decimal('0')
-        deposit_amount = context['booking'].deposit_amount or (Decimal(dep_percent) / Decimal('100')) * total
+        deposit_amount = context['booking'].deposit_amount or deposit_for(total, dep_percent)
         deposit_amount = Decimal(deposit_amount).quantize(Decimal('1.'), rounding=ROUND_HALF_UP)
         context['deposit_percent'] = dep_percent
         context['deposit_amount'] = deposit_amount
@@ -242,6 +235,8 @@ class CashPaymentConfirmationView(LoginRequiredMixin, TemplateView):
     def post(self, request, *args, **kwargs):
         booking_id = kwargs.get('booking_id')
         booking = get_object_or_404(Booking, pk=booking_id, status='pending')
+        if booking.hold_expired():
+            return hold_expired_redirect(request, booking)
         
         # إنشاء سجل دفع نقدي
         payment = Payment.objects.create(
@@ -122,6 +122,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # The shared-cache in-memory test database fails with "table is locked" instead of
+        # waiting on locks, so concurrent booking tests need a file-backed database.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Holds rate cards, facet counts and search results with their generation counters. The
+# local-memory cache is per process: with several workers, point it at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'property-booking',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
@@ -206,6 +225,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 DEPOSIT_PERCENT = 20
 
+# Seconds a property's rate card (booking/pricing.py) stays in the cache; saving the property drops it
+RATE_CARD_CACHE_SECONDS = 3600
+
+# Maximum number of (property, start, end) triples accepted by the batch availability check
+AVAILABILITY_BATCH_MAX_SIZE = 50
+
+# Geohash characters stored per property (portfolio/geo.py); run `manage.py backfill_geohash` after changing it
+GEOHASH_PRECISION = 9
+
+# Radius search of the property API (?near=lat,lng&radius_km=)
+GEO_SEARCH_DEFAULT_RADIUS_KM = 25
+GEO_SEARCH_MAX_RADIUS_KM = 200
+
+# Full-text property search (portfolio/search.py): 'fts5', 'postgres' or 'basic'; None picks by database
+PROPERTY_SEARCH_BACKEND = None
+
+# Maximum number of features returned by GET /api/properties/map/ (the response says when it was cut)
+PROPERTY_MAP_MAX_FEATURES = 1000
+
+# Facet counts of GET /api/properties/?facets=true (portfolio/facets.py): seconds cached per
+# filter combination, and values listed per facet (most frequent first)
+PROPERTY_FACETS_CACHE_SECONDS = 300
+PROPERTY_FACETS_MAX_VALUES = 50
+
+# Cached ordered id lists of property searches (portfolio/search_cache.py): seconds kept,
+# and the longest result cached (longer ones are paged straight from the database)
+PROPERTY_SEARCH_CACHE_SECONDS = 120
+PROPERTY_SEARCH_CACHE_MAX_IDS = 1000
+
+# Seconds the home page counters (portfolio/stats.py) stay cached between full recomputations
+SITE_STATS_CACHE_SECONDS = 600
+
+# Seconds owner/property booking counters (portfolio/stats.py) stay cached; booking writes drop them
+OWNER_STATS_CACHE_SECONDS = 300
+
+# Keys held by the in-process search suggestion index (portfolio/suggest.py, GET /api/search/suggest/)
+SEARCH_SUGGEST_MAX_ENTRIES = 50000
+
+# Maximum number of property ids accepted by POST /api/quotes/
+QUOTE_MAX_PROPERTIES = 100
+
+# In-process availability index (booking/availability_index.py). Workers share invalidations
+# through the version stamps kept in the default cache, so enable it only with a cache
+# backend that all workers can see.
+AVAILABILITY_INDEX_ENABLED = False
+AVAILABILITY_INDEX_MAX_PROPERTIES = 1000
+
+# Free slots suggested when a requested window is taken, searched this many days either side
+AVAILABILITY_SUGGESTIONS = 3
+AVAILABILITY_SUGGESTION_DAYS = 30
+
+# Minutes an unpaid pending booking holds its window; expired holds stop blocking and are
+# cancelled by `manage.py expire_booking_holds` (run it from cron). None disables holds.
+BOOKING_HOLD_MINUTES = 30
+
+# Maximum number of guests (guest_names lines) per booking
+BOOKING_MAX_GUESTS = 500
+
 # Unfold Admin Theme Configuration
 UNFOLD = {
     "SITE_TITLE": "منصة حجز العقارات",
@@ -245,8 +322,11 @@ def environment_callback(request):
 
 def dashboard_callback(request, context):
     """Return dashboard data"""
-    from booking.models import Booking, Payment
-    from portfolio.models import Property
+    from booking.models import Payment
+    from portfolio.stats import owner_stats, site_stats
+
+    # Cached counters shared with the owner dashboard and the home page (portfolio/stats.py)
+    bookings = owner_stats()
     
     # Add dashboard metrics to the existing context
     context.update({
@@ -255,7 +335,7 @@ def dashboard_callback(request, context):
                 "title": "إحصائيات سريعة",
                 "metric": {
                     "title": "إجمالي الحجوزات",
-                    "value": Booking.objects.count(),
+                    "value": bookings['bookings_count'],
                     "unit": "حجز",
                 },
             },
@@ -263,7 +343,7 @@ def dashboard_callback(request, context):
                 "title": "الحجوزات المؤكدة",
                 "metric": {
                     "title": "حجوزات مؤكدة",
-                    "value": Booking.objects.filter(status='confirmed').count(),
+                    "value": bookings['confirmed_count'],
                     "unit": "حجز",
                 },
             },
@@ -271,7 +351,7 @@ def dashboard_callback(request, context):
                 "title": "العقارات الموثّقة",
                 "metric": {
                     "title": "عقارات موثّقة",
-                    "value": Property.objects.filter(is_verified_by_platform=True).count(),
+                    "value": site_stats()['verified_properties'],
                     "unit": "عقار",
                 },
             },
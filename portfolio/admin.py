@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import GalleryImage, Amenity, Property, PropertyReview
 from .forms import PropertyAdminForm
+from .ratings import set_reviews_approval
 
 
 @admin.register(Amenity)
@@ -21,7 +22,7 @@ class PropertyAdmin(admin.ModelAdmin):
     list_filter = ('property_type', 'city', 'owner', 'is_verified_by_platform', 'privacy_rating', 'created_at')
     search_fields = ('name', 'description', 'city', 'owner__username', 'owner__email')
     filter_horizontal = ('amenities',)
-    readonly_fields = ('main_image_preview',)
+    readonly_fields = ('main_image_preview', 'avg_rating', 'reviews_count', 'rating_histogram')
     fieldsets = (
         ('المعلومات الأساسية', {
             'fields': ('name', 'slug', 'description', 'property_type', 'owner', 'main_image', 'main_image_preview')
@@ -39,6 +40,10 @@ class PropertyAdmin(admin.ModelAdmin):
         ('التوقيت', {
             'fields': ('checkin_time', 'checkout_time')
         }),
+        ('التقييمات', {
+            'fields': ('avg_rating', 'reviews_count', 'rating_histogram'),
+            'description': 'تُحدَّث تلقائياً عند اعتماد التقييمات أو رفضها أو تعديلها أو حذفها'
+        }),
     )
 
     class Media:
@@ -96,8 +101,8 @@ class PropertyReviewAdmin(admin.ModelAdmin):
 
     @admin.action(description="اعتماد التقييمات المحددة")
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
+        set_reviews_approval(queryset, True)
 
     @admin.action(description="رفض التقييمات المحددة")
     def reject_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
+        set_reviews_approval(queryset, False)
@@ -0,0 +1,73 @@
+"""
+Amenity bitsets stored on Property.
+
+Property.amenity_mask has bit (id - 1) set for every amenity of the property with an id up
+to MASK_BITS; it is rebuilt from the M2M table whenever Property.amenities changes (the
+m2m_changed receivers in portfolio/signals.py) or an amenity is deleted. Requiring several
+amenities is then one `amenity_mask & wanted = wanted` predicate on the property row
+instead of one join of the M2M table per amenity, and has_amenities() answers the same
+question in Python for properties already loaded. Amenities with larger ids are filtered
+through the M2M table as before.
+`manage.py rebuild_amenity_masks` repairs every property in batches.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.lookups import Exact
+
+from .models import Property
+from .search_cache import invalidate_properties_search_cache
+
+# Bits of a signed 64-bit column usable without touching the sign
+MASK_BITS = 63
+
+BATCH_SIZE = 500
+
+
+def amenity_bits(amenity_ids):
+    """Mask of the amenity ids that fit in MASK_BITS; the others are ignored."""
+    mask = 0
+    for amenity_id in amenity_ids:
+        if 0 < amenity_id <= MASK_BITS:
+            mask |= 1 << (amenity_id - 1)
+    return mask
+
+
+def has_amenities(mask, amenity_ids):
+    """Whether a property with `mask` has all of `amenity_ids` (all must fit in the mask)."""
+    wanted = amenity_bits(amenity_ids)
+    return mask & wanted == wanted
+
+
+def with_amenities(queryset, amenity_ids):
+    """Properties of `queryset` that have every amenity in `amenity_ids`."""
+    amenity_ids = set(amenity_ids)
+    wanted = amenity_bits(amenity_ids)
+    if wanted:
+        queryset = queryset.filter(Exact(F('amenity_mask').bitand(wanted), Value(wanted)))
+    for amenity_id in sorted(amenity_ids):
+        if amenity_id > MASK_BITS:
+            queryset = queryset.filter(amenities__id=amenity_id)
+    return queryset
+
+
+def refresh_amenity_masks(property_ids):
+    """Rebuild amenity_mask of the given properties from the M2M table; returns how many were updated."""
+    property_ids = {pk for pk in property_ids if pk is not None}
+    if not property_ids:
+        return 0
+
+    through = Property.amenities.through
+    with transaction.atomic():
+        existing = list(Property.objects.filter(pk__in=property_ids).order_by('pk').values_list('pk', flat=True))
+        amenity_ids = defaultdict(list)
+        for property_id, amenity_id in through.objects.filter(property_id__in=existing).values_list('property_id', 'amenity_id'):
+            amenity_ids[property_id].append(amenity_id)
+        Property.objects.bulk_update(
+            [Property(pk=pk, amenity_mask=amenity_bits(amenity_ids[pk])) for pk in existing],
+            ['amenity_mask'],
+            batch_size=BATCH_SIZE,
+        )
+    invalidate_properties_search_cache(existing)
+    return len(existing)
@@ -5,3 +5,7 @@ class PortfolioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portfolio'
     verbose_name = 'معرض العقارات'
+
+    def ready(self):
+        """تحميل الإشارات عند تشغيل التطبيق"""
+        import portfolio.signals
@@ -0,0 +1,86 @@
+"""
+Facet counts for the property search sidebar.
+
+property_facets(queryset) counts the already-filtered properties per city, property_type,
+amenity and verified flag: one GROUP BY query per facet, whatever the number of values.
+
+Results are cached for PROPERTY_FACETS_CACHE_SECONDS under facet_cache_key(), built from
+the normalized filter parameters of the request (portfolio/search_cache.py) and a
+generation number. Saving or deleting a property or an amenity, or changing a property's
+amenities, starts a new generation once it commits (see portfolio/signals.py), so older entries are never read again; changes that
+bypass the signals (queryset.update(), new bookings for the availability filter) show up
+once the entry expires.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Property
+from .search_cache import IGNORED_PARAMS, filters_digest
+
+FACET_KEY = 'property-facets:{}:{}'
+GENERATION_KEY = 'property-facets:generation'
+
+# Sorting does not change the counts
+FACET_IGNORED_PARAMS = IGNORED_PARAMS | {'ordering'}
+
+
+def facet_generation():
+    return cache.get_or_set(GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_facets():
+    """Start a new generation once the transaction commits, so every cached facet block is recomputed."""
+    # Bumped earlier, a concurrent request could cache the pre-commit counts under the new generation
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, time.time_ns(), timeout=None))
+
+
+def facet_cache_key(params):
+    return FACET_KEY.format(facet_generation(), filters_digest(params, FACET_IGNORED_PARAMS))
+
+
+def count_by(queryset, *fields, distinct=False):
+    limit = getattr(settings, 'PROPERTY_FACETS_MAX_VALUES', 50)
+    rows = queryset.values(*fields).annotate(count=Count('pk', distinct=distinct)).order_by('-count', *fields)
+    return list(rows[:limit])
+
+
+def property_facets(queryset):
+    """Counts of the properties in `queryset` per city, property_type, amenity and verified flag."""
+    queryset = queryset.order_by()
+    type_labels = dict(Property.PROPERTY_TYPES)
+    return {
+        'city': [
+            {'value': row['city'], 'count': row['count']}
+            for row in count_by(queryset.exclude(city=''), 'city')
+        ],
+        'property_type': [
+            {'value': row['property_type'], 'label': type_labels.get(row['property_type'], row['property_type']), 'count': row['count']}
+            for row in count_by(queryset, 'property_type')
+        ],
+        # distinct: the amenities filter joins the same table for ids beyond the bitset
+        'amenities': [
+            {'id': row['amenities__id'], 'name': row['amenities__name'], 'count': row['count']}
+            for row in count_by(queryset.filter(amenities__isnull=False), 'amenities__id', 'amenities__name', distinct=True)
+        ],
+        'is_verified_by_platform': {
+            'true': 0, 'false': 0,
+            **{
+                'true' if row['is_verified_by_platform'] else 'false': row['count']
+                for row in count_by(queryset, 'is_verified_by_platform')
+            },
+        },
+    }
+
+
+def cached_property_facets(queryset, params):
+    """property_facets() of the filtered `queryset`, cached by the request's filter parameters `params`."""
+    key = facet_cache_key(params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = property_facets(queryset)
+        cache.set(key, facets, getattr(settings, 'PROPERTY_FACETS_CACHE_SECONDS', 300))
+    return facets
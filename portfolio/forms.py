@@ -4,6 +4,7 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Fieldset, Row, Column, Div, Submit, HTML
 from .models import Property, Amenity, PropertyReview
 from django.db.models import Q
+from .text import normalize
 from .widgets import LocationPickerField
 from django.utils import timezone
 
@@ -136,6 +137,10 @@ class PropertySearchForm(forms.Form):
     # عرض المعتمد فقط (hidden field for toggle)
     verified_only = forms.BooleanField(required=False, widget=forms.HiddenInput(), initial=False)
 
+    def clean_search(self):
+        # Same spelling as Property.search_text, so أ/إ/آ, ى/ي, ة/ه and harakat do not matter
+        return normalize(self.cleaned_data.get('search'))
+
     def clean(self):
         cleaned = super().clean()
         return cleaned
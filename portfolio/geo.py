@@ -0,0 +1,130 @@
+"""
+Geohash encoding and radius search helpers.
+
+Property.geohash holds the GEOHASH_PRECISION-character geohash of the property's
+coordinates; it is kept up to date by Property.save() and filled for existing rows by
+`manage.py backfill_geohash`. A radius search first narrows the candidates to the 3x3
+block of geohash cells around the centre (index range scans on the geohash column),
+then computes exact haversine distances for those candidates in the database. Only
+Django's portable math functions are used, so it works on SQLite without a spatial
+extension.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+def geohash_precision():
+    return getattr(settings, 'GEOHASH_PRECISION', 9)
+
+
+def encode(latitude, longitude, precision=None):
+    """Geohash of a point, or '' when either coordinate is missing."""
+    if latitude is None or longitude is None:
+        return ''
+    precision = precision or geohash_precision()
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lng_degrees) spanned by one geohash cell of `precision` characters."""
+    bit_count = 5 * precision
+    return 180.0 / 2 ** (bit_count // 2), 360.0 / 2 ** ((bit_count + 1) // 2)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose cells together contain every point within radius_km of the
+    centre: the centre cell and its eight neighbours, at the finest precision whose cells
+    are at least radius_km across. None when the radius is too large to prefilter.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    # Degrees of longitude shrink towards the poles: size cells for the circle's poleward edge
+    poleward = min(abs(latitude) + radius_km / KM_PER_DEGREE, 89.0)
+    km_per_lng_degree = KM_PER_DEGREE * math.cos(math.radians(poleward))
+
+    for precision in range(geohash_precision(), 0, -1):
+        lat_deg, lng_deg = cell_size(precision)
+        if lat_deg * KM_PER_DEGREE >= radius_km and lng_deg * km_per_lng_degree >= radius_km:
+            break
+    else:
+        return None
+
+    cells = set()
+    for dlat in (-lat_deg, 0, lat_deg):
+        neighbour_lat = latitude + dlat
+        if not -90 <= neighbour_lat <= 90:
+            continue
+        for dlng in (-lng_deg, 0, lng_deg):
+            neighbour_lng = (longitude + dlng + 180) % 360 - 180
+            cells.add(encode(neighbour_lat, neighbour_lng, precision))
+    return sorted(cells)
+
+
+def prefix_end(cell):
+    """
+    The first geohash after every hash under `cell` ('u4pr' -> 'u4ps', 'u4pz' -> 'u4q'),
+    or None when nothing sorts after it ('zz'). Only BASE32 characters are compared, so
+    the range holds under locale collations that ignore punctuation, not just byte order.
+    """
+    cell = cell.rstrip(BASE32[-1])
+    if not cell:
+        return None
+    return cell[:-1] + BASE32[BASE32.index(cell[-1]) + 1]
+
+
+def within_cells_q(cells, field='geohash'):
+    """Prefix match on the geohash column written as ranges, so it scans the index on every backend."""
+    q = Q()
+    for cell in cells:
+        cell_q = Q(**{f'{field}__gte': cell})
+        end = prefix_end(cell)
+        if end is not None:
+            cell_q &= Q(**{f'{field}__lt': end})
+        q |= cell_q
+    return q
+
+
+def distance_km(latitude, longitude, lat_field='latitude', lng_field='longitude'):
+    """Haversine distance in km from the point to each row's coordinates, as a query expression."""
+    lat1 = Radians(Value(float(latitude), output_field=FloatField()))
+    lng1 = Radians(Value(float(longitude), output_field=FloatField()))
+    lat2 = Radians(Cast(F(lat_field), FloatField()))
+    lng2 = Radians(Cast(F(lng_field), FloatField()))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lng2 - lng1) / 2), 2)
+    )
+    return ASin(Sqrt(a), output_field=FloatField()) * (2 * EARTH_RADIUS_KM)
+
+
+def near(queryset, latitude, longitude, radius_km):
+    """Rows within radius_km of the point, annotated with `distance` in km."""
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells is not None:
+        queryset = queryset.filter(within_cells_q(cells))
+    return queryset.annotate(distance=distance_km(latitude, longitude)).filter(distance__lte=radius_km)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from portfolio import geo
+from portfolio.models import Property
+from portfolio.search_cache import clear_search_cache
+
+
+class Command(BaseCommand):
+    help = 'حساب عمود geohash للعقارات من إحداثياتها (للبيانات القديمة أو بعد تغيير GEOHASH_PRECISION)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        properties = Property.objects.only('pk', 'latitude', 'longitude', 'geohash').order_by('pk')
+
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(properties.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            changed = []
+            for prop in batch:
+                geohash = geo.encode(prop.latitude, prop.longitude)
+                if prop.geohash != geohash:
+                    prop.geohash = geohash
+                    changed.append(prop)
+            Property.objects.bulk_update(changed, ['geohash'])
+            updated += len(changed)
+            last_pk = batch[-1].pk
+
+        clear_search_cache()
+        self.stdout.write(self.style.SUCCESS(f'اكتمل: تم تحديث geohash لـ {updated} عقار'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.models import Property
+from portfolio.amenities import refresh_amenity_masks
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء bitset المرافق المخزن على العقارات من جدول المرافق، على دفعات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        property_ids = Property.objects.order_by('pk').values_list('pk', flat=True)
+
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(property_ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            updated += refresh_amenity_masks(batch)
+            last_pk = batch[-1]
+            self.stdout.write(f'تمت معالجة {updated} عقار...')
+
+        self.stdout.write(self.style.SUCCESS(f'اكتملت إعادة البناء: {updated} عقار'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.search import search_backend
+from portfolio.search_cache import clear_search_cache
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء فهرس البحث النصي للعقارات (FTS5 على SQLite، أو فهرس GIN على PostgreSQL)'
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        count = backend.rebuild()
+        clear_search_cache()
+        self.stdout.write(self.style.SUCCESS(f'اكتملت إعادة البناء ({backend.name}): {count} عقار في الفهرس'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_property_lat_lng_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='يُحسب تلقائياً من الإحداثيات (portfolio/geo.py)', max_length=12, verbose_name='Geohash'),
+        ),
+    ]
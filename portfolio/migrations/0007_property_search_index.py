@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:05
+
+from django.db import migrations
+
+# Frozen copies of the names and expression used by portfolio/search.py
+FTS_TABLE = 'portfolio_property_fts'
+PG_INDEX = 'portfolio_property_search_idx'
+PG_DOCUMENT = (
+    "to_tsvector('simple', coalesce(portfolio_property.name, '') || ' ' || "
+    "coalesce(portfolio_property.description, '') || ' ' || coalesce(portfolio_property.city, ''))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 table filled from the existing properties on SQLite, GIN index on PostgreSQL."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, description, city, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) '
+            f'SELECT id, name, description, city FROM portfolio_property'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON portfolio_property USING GIN ({PG_DOCUMENT})')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_property_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
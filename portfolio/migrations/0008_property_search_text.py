@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:52
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copies of portfolio/text.py and of the index names used by portfolio/search.py
+DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+FOLDS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه'})
+SUMMARY_CHARS = 1000
+FTS_TABLE = 'portfolio_property_fts'
+PG_INDEX = 'portfolio_property_search_idx'
+OLD_PG_DOCUMENT = (
+    "to_tsvector('simple', coalesce(portfolio_property.name, '') || ' ' || "
+    "coalesce(portfolio_property.description, '') || ' ' || coalesce(portfolio_property.city, ''))"
+)
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = DIACRITICS_RE.sub('', text).replace('\u0640', '').translate(FOLDS).casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def populate_search_text(apps, schema_editor):
+    """Fill search_text and re-index the normalized text (FTS5) or search_text (PostgreSQL)."""
+    Property = apps.get_model('portfolio', 'Property')
+    vendor = schema_editor.connection.vendor
+
+    properties = list(Property.objects.only('pk', 'name', 'city', 'description'))
+    fts_rows = []
+    for prop in properties:
+        parts = normalize(prop.name), normalize(prop.city), normalize((prop.description or '')[:SUMMARY_CHARS])
+        prop.search_text = ' '.join(part for part in parts if part)
+        fts_rows.append((prop.pk, parts[0], parts[2], parts[1]))
+    Property.objects.bulk_update(properties, ['search_text'], batch_size=500)
+
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DELETE FROM {FTS_TABLE}')
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) VALUES (%s, %s, %s, %s)', fts_rows)
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+        schema_editor.execute(
+            f"CREATE INDEX {PG_INDEX} ON portfolio_property USING GIN (to_tsvector('simple', portfolio_property.search_text))"
+        )
+
+
+def restore_raw_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DELETE FROM {FTS_TABLE}')
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) '
+            f'SELECT id, name, description, city FROM portfolio_property'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+        schema_editor.execute(f'CREATE INDEX {PG_INDEX} ON portfolio_property USING GIN ({OLD_PG_DOCUMENT})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_property_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, help_text='الاسم والمدينة وملخص الوصف بعد توحيد الكتابة العربية (portfolio/text.py)', verbose_name='نص البحث'),
+        ),
+        migrations.RunPython(populate_search_text, restore_raw_index),
+    ]
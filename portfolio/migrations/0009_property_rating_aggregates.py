@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:55
+
+import portfolio.models
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    """Compute avg_rating, reviews_count and rating_histogram from the approved reviews."""
+    Property = apps.get_model('portfolio', 'Property')
+    PropertyReview = apps.get_model('portfolio', 'PropertyReview')
+
+    histograms = {}
+    counts = PropertyReview.objects.filter(is_approved=True).values('property_id', 'rating').annotate(n=Count('pk')).order_by()
+    for row in counts:
+        if 1 <= row['rating'] <= 5:
+            histograms.setdefault(row['property_id'], [0] * 5)[row['rating'] - 1] = row['n']
+
+    properties = list(Property.objects.filter(pk__in=histograms).only('pk'))
+    for prop in properties:
+        histogram = histograms[prop.pk]
+        prop.reviews_count = sum(histogram)
+        prop.avg_rating = round(sum(stars * n for stars, n in enumerate(histogram, start=1)) / prop.reviews_count, 2)
+        prop.rating_histogram = histogram
+    Property.objects.bulk_update(properties, ['avg_rating', 'reviews_count', 'rating_histogram'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_property_search_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='avg_rating',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='متوسط التقييم'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_histogram',
+            field=models.JSONField(default=portfolio.models.empty_rating_histogram, editable=False, help_text='عدد التقييمات المعتمدة لكل نجمة من 1 إلى 5', verbose_name='توزيع التقييمات'),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='عدد التقييمات'),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 21:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_property_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['created_at', 'id'], name='property_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertyreview',
+            index=models.Index(fields=['is_approved', 'created_at', 'id'], name='review_approved_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='propertyreview',
+            index=models.Index(fields=['property', 'is_approved', 'created_at', 'id'], name='review_prop_created_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:07
+
+from django.db import migrations, models
+
+# Frozen copy of portfolio/amenities.py
+MASK_BITS = 63
+
+
+def populate_amenity_masks(apps, schema_editor):
+    """Set amenity_mask from the existing Property.amenities rows."""
+    Property = apps.get_model('portfolio', 'Property')
+    through = Property.amenities.through
+
+    masks = {}
+    for property_id, amenity_id in through.objects.values_list('property_id', 'amenity_id'):
+        if 0 < amenity_id <= MASK_BITS:
+            masks[property_id] = masks.get(property_id, 0) | 1 << (amenity_id - 1)
+
+    properties = list(Property.objects.filter(pk__in=masks).only('pk'))
+    for prop in properties:
+        prop.amenity_mask = masks[prop.pk]
+    Property.objects.bulk_update(properties, ['amenity_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='amenity_mask',
+            field=models.BigIntegerField(default=0, editable=False, help_text='يُحدَّث تلقائياً من المرافق المختارة (portfolio/amenities.py)', verbose_name='مرافق العقار (bitset)'),
+        ),
+        migrations.RunPython(populate_amenity_masks, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils.text import slugify
 from django.conf import settings
 from django.db.models import Q
 import uuid
 
+from . import geo, text
+
 
 class GalleryImage(models.Model):
     """صور المعرض للعقارات"""
@@ -56,6 +58,10 @@ class Amenity(models.Model):
         return self.name
 
 
+def empty_rating_histogram():
+    return [0, 0, 0, 0, 0]
+
+
 class Property(models.Model):
     PROPERTY_TYPES = [
         ('chalet', 'Chalet'),
@@ -75,6 +81,11 @@ class Property(models.Model):
     is_price_negotiable = models.BooleanField(default=False)
 
     amenities = models.ManyToManyField('Amenity', blank=True)
+    amenity_mask = models.BigIntegerField(
+        default=0, editable=False,
+        verbose_name="مرافق العقار (bitset)",
+        help_text="يُحدَّث تلقائياً من المرافق المختارة (portfolio/amenities.py)"
+    )
     city = models.CharField(max_length=100, blank=True)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -97,9 +108,28 @@ class Property(models.Model):
         verbose_name="خط الطول",
         help_text="خط الطول للموقع على الخريطة"
     )
+    geohash = models.CharField(
+        max_length=12, blank=True, default='', db_index=True, editable=False,
+        verbose_name="Geohash",
+        help_text="يُحسب تلقائياً من الإحداثيات (portfolio/geo.py)"
+    )
     address = models.TextField(blank=True, verbose_name="العنوان")
+    search_text = models.TextField(
+        blank=True, default='', editable=False,
+        verbose_name="نص البحث",
+        help_text="الاسم والمدينة وملخص الوصف بعد توحيد الكتابة العربية (portfolio/text.py)"
+    )
 
     privacy_rating = models.PositiveSmallIntegerField(default=3)
+
+    # Aggregates of the approved reviews, maintained by portfolio/ratings.py
+    avg_rating = models.FloatField(null=True, blank=True, editable=False, verbose_name="متوسط التقييم")
+    reviews_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="عدد التقييمات")
+    rating_histogram = models.JSONField(
+        default=empty_rating_histogram, editable=False,
+        verbose_name="توزيع التقييمات",
+        help_text="عدد التقييمات المعتمدة لكل نجمة من 1 إلى 5"
+    )
     is_verified_by_platform = models.BooleanField(default=False)
     checkin_time = models.TimeField(null=True, blank=True)
     checkout_time = models.TimeField(null=True, blank=True)
@@ -119,13 +149,36 @@ class Property(models.Model):
         verbose_name = "عقار"
         verbose_name_plural = "العقارات"
         ordering = ['-created_at']
+        indexes = [
+            # Bounding-box scans of the map endpoint (api/properties/map/)
+            models.Index(fields=['latitude', 'longitude'], name='property_lat_lng_idx'),
+            # Keyset pagination of the property API (api/pagination.py)
+            models.Index(fields=['created_at', 'id'], name='property_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The city searches were cached under before a save (portfolio/search_cache.py)
+        instance._loaded_city = instance.__dict__.get('city')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name, allow_unicode=True)
+        self.geohash = geo.encode(self.latitude, self.longitude)
+        self.search_text = text.search_text(self.name, self.city, self.description)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields.add('geohash')
+            if {'name', 'city', 'description'} & update_fields:
+                update_fields.add('search_text')
+            kwargs['update_fields'] = update_fields
         super().save(*args, **kwargs)
 
 
@@ -148,6 +201,27 @@ class PropertyReview(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['property', 'user'], condition=Q(user__isnull=False), name='unique_property_review_per_user')
         ]
+        indexes = [
+            # Keyset pagination of the review API: all approved reviews, or those of one property
+            models.Index(fields=['is_approved', 'created_at', 'id'], name='review_approved_created_idx'),
+            models.Index(fields=['property', 'is_approved', 'created_at', 'id'], name='review_prop_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.rating_state()
+        return instance
+
+    def rating_state(self):
+        """(property_id, rating, is_approved): what this review contributes to its property's aggregates."""
+        return tuple(self.__dict__.get(field) for field in ('property_id', 'rating', 'is_approved'))
+
+    def save(self, *args, **kwargs):
+        # The post_save signal refreshes the property's rating aggregates in this transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_rating = self.rating_state()
 
     def __str__(self):
         uname = self.user.username if self.user and hasattr(self.user, 'username') else 'مستخدم'
@@ -0,0 +1,69 @@
+"""
+Rating aggregates stored on Property.
+
+Property.avg_rating, reviews_count and rating_histogram (counts of 1..5 star approved
+reviews) are recomputed from the approved reviews of a property whenever one of them
+changes: PropertyReview saves and deletes (portfolio/signals.py, inside the same
+transaction) and the bulk moderation of set_reviews_approval(). Each refresh is one
+GROUP BY over the reviews of the affected properties and one bulk update.
+`manage.py recompute_ratings` repairs every property in batches.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Property, PropertyReview
+
+RATING_FIELDS = ('avg_rating', 'reviews_count', 'rating_histogram')
+
+BATCH_SIZE = 500
+
+
+def rating_stats(histogram):
+    """avg_rating/reviews_count/rating_histogram values for a [count of 1 star, ..., count of 5 stars] list."""
+    count = sum(histogram)
+    total = sum(stars * n for stars, n in enumerate(histogram, start=1))
+    return {
+        'avg_rating': round(total / count, 2) if count else None,
+        'reviews_count': count,
+        'rating_histogram': list(histogram),
+    }
+
+
+def refresh_rating_stats(property_ids):
+    """Recompute the stored rating aggregates of the given properties; returns how many were updated."""
+    property_ids = {pk for pk in property_ids if pk is not None}
+    if not property_ids:
+        return 0
+
+    with transaction.atomic():
+        # Lock the rows in a fixed order so concurrent moderations serialize instead of deadlocking
+        existing = list(
+            Property.objects.select_for_update().filter(pk__in=property_ids).order_by('pk').values_list('pk', flat=True)
+        )
+        histograms = defaultdict(lambda: [0] * 5)
+        counts = (
+            PropertyReview.objects.filter(property_id__in=existing, is_approved=True)
+            .values('property_id', 'rating').annotate(n=Count('pk')).order_by()
+        )
+        for row in counts:
+            if 1 <= row['rating'] <= 5:
+                histograms[row['property_id']][row['rating'] - 1] = row['n']
+
+        Property.objects.bulk_update(
+            [Property(pk=pk, **rating_stats(histograms[pk])) for pk in existing],
+            RATING_FIELDS,
+            batch_size=BATCH_SIZE,
+        )
+    return len(existing)
+
+
+def set_reviews_approval(queryset, approved):
+    """Approve or reject the reviews in `queryset` and refresh the affected properties; returns the number changed."""
+    with transaction.atomic():
+        changed = queryset.exclude(is_approved=approved)
+        property_ids = set(changed.values_list('property_id', flat=True))
+        count = changed.update(is_approved=approved)
+        refresh_rating_stats(property_ids)
+    return count
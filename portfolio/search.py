@@ -0,0 +1,235 @@
+"""
+Full-text search over property name, city and description.
+
+The backend follows the database: an FTS5 virtual table on SQLite, a GIN index on a
+`tsvector` of Property.search_text on PostgreSQL, and plain `contains` scans of
+search_text elsewhere. Set PROPERTY_SEARCH_BACKEND to 'fts5', 'postgres' or 'basic' to
+force one.
+
+Indexed text and queries both go through portfolio.text.normalize(), so Arabic spelling
+variants match. The FTS5 table (migration 0007) holds the normalized name, description
+summary and city keyed by property id and is kept in sync from the Property signals
+(portfolio/signals.py); search_text is written by Property.save().
+`manage.py rebuild_search_index` rebuilds either from scratch.
+
+search_backend().search(queryset, text) returns the matching rows annotated with
+`search_rank` (higher is more relevant), most relevant first. Every word of the query
+must match, as a prefix, so results refine as the user types. filter(queryset, text, field)
+applies the same matching to one of SEARCH_FIELDS (the API's name and city filters),
+without ranking. Only FTS5 indexes the fields separately; the other backends compare the
+words with the field folded in the database (normalized_field()), which covers the
+letter folds, tatweel and the common harakat but not the rarer Quranic marks.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower, Replace
+
+from .text import FOLDS, TATWEEL, normalize, search_parts, search_text
+
+FTS_TABLE = 'portfolio_property_fts'
+PG_INDEX = 'portfolio_property_search_idx'
+SEARCH_FIELDS = ('name', 'description', 'city')
+
+# Longest queries are cut to this many words
+MAX_TERMS = 8
+
+REBUILD_BATCH_SIZE = 500
+
+
+# What normalized_field() replaces in the database: normalize()'s letter folds, tatweel and
+# the common harakat (fathatan to sukun, superscript alef)
+SQL_FOLDS = (
+    *((chr(code), replacement) for code, replacement in FOLDS.items()),
+    (TATWEEL, ''),
+    *((chr(code), '') for code in (*range(0x064b, 0x0653), 0x0670)),
+)
+
+
+def normalized_field(field):
+    """`field` lowercased and folded like normalize(), as a query expression (no index)."""
+    expression = Lower(field)
+    for char, replacement in SQL_FOLDS:
+        expression = Replace(expression, Value(char), Value(replacement))
+    return expression
+
+
+def search_terms(text):
+    """Words of a free-text query, normalized like the indexed text, without punctuation or query syntax."""
+    return re.findall(r'\w+', normalize(text))[:MAX_TERMS]
+
+
+class BasicSearchBackend:
+    """Every word must appear in Property.search_text; no index and no ranking."""
+
+    name = 'basic'
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset
+        return self.matching(queryset, terms).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def filter(self, queryset, text, field):
+        """Rows whose `field` (one of SEARCH_FIELDS) matches every word of `text`, in the queryset's order."""
+        terms = search_terms(text)
+        if not terms:
+            return queryset
+        return self.matching(queryset, terms, field)
+
+    def matching(self, queryset, terms, field=None):
+        if field is not None:
+            return self.field_matching(queryset, terms, field)
+        return queryset.filter(reduce(and_, [Q(search_text__contains=term) for term in terms]))
+
+    @staticmethod
+    def field_matching(queryset, terms, field):
+        if field not in SEARCH_FIELDS:
+            raise ValueError(f'Not an indexed field: {field}')
+        alias = f'normalized_{field}'
+        return queryset.alias(**{alias: normalized_field(field)}).filter(
+            reduce(and_, [Q(**{f'{alias}__contains': term}) for term in terms])
+        )
+
+    def index(self, property_obj):
+        pass
+
+    def remove(self, property_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class FTS5SearchBackend(BasicSearchBackend):
+    """SQLite FTS5 table keyed by property id, ranked with bm25."""
+
+    name = 'fts5'
+
+    def match_expression(self, terms, field=None):
+        # "term"* : each word as a quoted prefix, so user input never reaches FTS5 syntax;
+        # `field :` limits a word to that column
+        column = f'{field} : ' if field else ''
+        return ' '.join('{}"{}"*'.format(column, term.replace('"', '""')) for term in terms)
+
+    def matching(self, queryset, terms, field=None):
+        if field not in (None, *SEARCH_FIELDS):
+            raise ValueError(f'Not an indexed field: {field}')
+        match = self.match_expression(terms, field)
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset
+        match = self.match_expression(terms)
+        table = queryset.model._meta.db_table
+        # bm25() is lower for better matches; negate it so higher means more relevant everywhere.
+        # Column weights: name, description, city
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 4.0, 1.0, 2.0) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [match], output_field=FloatField(),
+        )
+        return self.matching(queryset, terms).annotate(search_rank=rank).order_by('-search_rank', '-created_at')
+
+    def index(self, property_obj):
+        name, city, summary = search_parts(property_obj.name, property_obj.city, property_obj.description)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [property_obj.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) VALUES (%s, %s, %s, %s)',
+                [property_obj.pk, name, summary, city],
+            )
+
+    def remove(self, property_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [property_id])
+
+    def rebuild(self):
+        from .models import Property
+
+        rows = Property.objects.order_by().values_list('pk', 'name', 'city', 'description')
+        count = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            batch = []
+            for pk, *fields in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                name, city, summary = search_parts(*fields)
+                batch.append((pk, name, summary, city))
+                if len(batch) == REBUILD_BATCH_SIZE:
+                    cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) VALUES (%s, %s, %s, %s)', batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, name, description, city) VALUES (%s, %s, %s, %s)', batch)
+                count += len(batch)
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return count
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """GIN index on a tsvector of the searchable columns, ranked with ts_rank."""
+
+    name = 'postgres'
+
+    @staticmethod
+    def document(table):
+        # Must stay identical to the expression of the index created by migration 0008
+        return f"to_tsvector('simple', {table}.search_text)"
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset
+        query = self.tsquery(terms)
+        document = self.document(queryset.model._meta.db_table)
+        return self.matching(queryset, terms).annotate(
+            search_rank=RawSQL(f"ts_rank({document}, to_tsquery('simple', %s))", [query], output_field=FloatField())
+        ).order_by('-search_rank', '-created_at')
+
+    @staticmethod
+    def tsquery(terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def matching(self, queryset, terms, field=None):
+        document = self.document(queryset.model._meta.db_table)
+        queryset = queryset.filter(
+            RawSQL(f"{document} @@ to_tsquery('simple', %s)", [self.tsquery(terms)], output_field=BooleanField())
+        )
+        if field is not None:
+            # The tsvector covers every field: keep the rows where the words are in `field`
+            queryset = self.field_matching(queryset, terms, field)
+        return queryset
+
+    def rebuild(self):
+        from .models import Property
+
+        # search_text is written by Property.save(); refresh it for rows changed with update()
+        rows = Property.objects.order_by().only('pk', 'name', 'city', 'description', 'search_text')
+        stale = []
+        for prop in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            value = search_text(prop.name, prop.city, prop.description)
+            if prop.search_text != value:
+                prop.search_text = value
+                stale.append(prop)
+        Property.objects.bulk_update(stale, ['search_text'], batch_size=REBUILD_BATCH_SIZE)
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+            cursor.execute('SELECT count(*) FROM portfolio_property')
+            return cursor.fetchone()[0]
+
+
+BACKENDS = {backend.name: backend for backend in (BasicSearchBackend, FTS5SearchBackend, PostgresSearchBackend)}
+
+
+def search_backend():
+    """The backend named by PROPERTY_SEARCH_BACKEND, or the one matching the database."""
+    name = getattr(settings, 'PROPERTY_SEARCH_BACKEND', None)
+    if not name:
+        name = {'sqlite': 'fts5', 'postgresql': 'postgres'}.get(connection.vendor, 'basic')
+    return BACKENDS[name]()
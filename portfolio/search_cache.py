@@ -0,0 +1,169 @@
+"""
+Cached property search results.
+
+A search is keyed on its canonical filter set (normalized_filters(): sorted parameters,
+normalized search terms, sorted amenity ids, dates and datetimes in one ISO form) and
+stores the ordered list of matching property ids for PROPERTY_SEARCH_CACHE_SECONDS.
+Pages are then rendered by loading only the ids of the requested page (CachedSearchResults).
+
+Keys carry a generation number. Searches limited to one city read that city's generation,
+other searches the global one. Property, Booking and PropertyReview writes bump the
+global generation and the generation of the cities involved once their transaction
+commits (portfolio/signals.py, booking/signals.py), as do amenity changes
+(portfolio/amenities.py), so cached id lists are never read after a change. The rebuild commands start a new epoch, which retires
+every generation at once. Writes that bypass the model signals (queryset.update(),
+bulk_create()) and expiring booking holds show up once the entry expires.
+"""
+import hashlib
+import time
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .search import search_terms
+from .text import normalize
+
+RESULTS_KEY = 'property-search:{}:{}:{}:{}'
+EPOCH_KEY = 'property-search:epoch'
+GENERATION_KEY = 'property-search:generation'
+CITY_GENERATION_KEY = 'property-search:generation:city:{}'
+
+# Query parameters that page or display the results without changing which properties match, or their order
+IGNORED_PARAMS = {'page', 'page_size', 'cursor', 'pagination', 'facets', 'format', 'view'}
+
+
+def canonical_datetime(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(dt_timezone.utc).isoformat()
+
+
+def canonical_value(name, value):
+    if isinstance(value, bool):
+        return 'true' if value else ''
+    if isinstance(value, datetime):
+        return canonical_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    value = str(value).strip()
+    if name == 'search':
+        return ' '.join(search_terms(value))
+    if name == 'amenities':
+        return ','.join(sorted({part for part in value.split(',') if part.strip().isdigit()}, key=int))
+    try:
+        parsed_date = parse_date(value)
+        if parsed_date:
+            return parsed_date.isoformat()
+        parsed = parse_datetime(value)
+        if parsed:
+            return canonical_datetime(parsed)
+    except ValueError:
+        pass
+    return value
+
+
+def normalized_filters(params, ignored=IGNORED_PARAMS):
+    """
+    Sorted (name, value) pairs of the filter parameters in `params` (a QueryDict or a form's
+    cleaned_data), with empty ones and those in `ignored` left out.
+    """
+    pairs = []
+    for name in params:
+        if name in ignored:
+            continue
+        values = params.getlist(name) if hasattr(params, 'getlist') else [params[name]]
+        for value in values:
+            if value is None:
+                continue
+            value = canonical_value(name, value)
+            if value:
+                pairs.append((name, value))
+    return sorted(set(pairs))
+
+
+def filters_digest(params, ignored=IGNORED_PARAMS):
+    return hashlib.sha1(repr(normalized_filters(params, ignored)).encode()).hexdigest()
+
+
+def city_key(city):
+    return CITY_GENERATION_KEY.format(hashlib.md5(normalize(city).encode()).hexdigest())
+
+
+def search_generation(city=None):
+    """(epoch, generation) of searches limited to `city`, or of all other searches."""
+    keys = [EPOCH_KEY, city_key(city) if city else GENERATION_KEY]
+    values = cache.get_many(keys)
+    return tuple(values.get(key) or cache.get_or_set(key, time.time_ns, timeout=None) for key in keys)
+
+
+def invalidate_search_cache(cities=()):
+    """Start a new global generation, and one for each of `cities`, once the transaction commits."""
+    keys = {GENERATION_KEY} | {city_key(city) for city in cities if city}
+
+    def bump():
+        generation = time.time_ns()
+        cache.set_many({key: generation for key in keys}, timeout=None)
+
+    # Bumped earlier, a concurrent search could cache the pre-commit rows under the new generation
+    transaction.on_commit(bump)
+
+
+def clear_search_cache():
+    """Start a new epoch: every cached search, whatever its city, is recomputed."""
+    cache.set(EPOCH_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_properties_search_cache(property_ids):
+    """invalidate_search_cache() for the cities of the given properties."""
+    from .models import Property
+
+    cities = Property.objects.filter(pk__in=[pk for pk in property_ids if pk is not None]).values_list('city', flat=True)
+    invalidate_search_cache(set(cities))
+
+
+class CachedSearchResults:
+    """
+    The rows of `queryset` with the given ordered ids, as a sequence for Paginator: its
+    length is the number of ids and slicing loads only the ids of the slice.
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1 or None][0]
+        ids = self.ids[index]
+        # Same filters as the search, so annotations are kept and rows that stopped matching drop out
+        rows = self.queryset.order_by().in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def cached_search(queryset, scope, params, city=None):
+    """
+    The results of the filtered `queryset` as CachedSearchResults, from the cache when the
+    same filters were searched in the current generation. `scope` separates callers whose
+    parameters mean different filters; `city` is the exact city the search is limited to.
+    Results longer than PROPERTY_SEARCH_CACHE_MAX_IDS are not cached and `queryset` is
+    returned as is.
+    """
+    key = RESULTS_KEY.format(scope, *search_generation(city), filters_digest(params))
+    ids = cache.get(key)
+    if ids is None:
+        max_ids = getattr(settings, 'PROPERTY_SEARCH_CACHE_MAX_IDS', 1000)
+        ids = list(queryset.values_list('pk', flat=True)[:max_ids + 1])
+        if len(ids) > max_ids:
+            return queryset
+        cache.set(key, ids, getattr(settings, 'PROPERTY_SEARCH_CACHE_SECONDS', 120))
+    return CachedSearchResults(queryset, ids)
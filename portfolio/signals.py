@@ -0,0 +1,116 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .amenities import refresh_amenity_masks
+from .facets import invalidate_facets
+from .models import Amenity, Property, PropertyReview
+from .ratings import refresh_rating_stats
+from .search import SEARCH_FIELDS, search_backend
+from .search_cache import invalidate_properties_search_cache, invalidate_search_cache
+from .suggest import suggest_index
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, update_fields=None, **kwargs):
+    """تحديث فهرس البحث النصي عند حفظ العقار"""
+    if update_fields is not None and not set(SEARCH_FIELDS) & set(update_fields):
+        return
+    search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    """حذف العقار من فهرس البحث النصي"""
+    search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Property)
+def suggest_property(sender, instance, update_fields=None, **kwargs):
+    """تحديث فهرس اقتراحات البحث عند حفظ العقار"""
+    if update_fields is not None and not {'name', 'slug', 'city'} & set(update_fields):
+        return
+    suggest_index.update(instance)
+
+
+@receiver(post_delete, sender=Property)
+def unsuggest_property(sender, instance, **kwargs):
+    """حذف العقار من فهرس اقتراحات البحث"""
+    suggest_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=PropertyReview)
+def review_saved(sender, instance, **kwargs):
+    """تحديث متوسط وعدد تقييمات العقار عند اعتماد التقييم أو تعديله"""
+    loaded = getattr(instance, '_loaded_rating', None)
+    current = instance.rating_state()
+    if loaded == current:
+        return
+    # A review counts towards its property only while approved: refresh where it counted before or counts now
+    states = [current] if loaded is None else [loaded, current]
+    refresh_rating_stats({property_id for property_id, _, approved in states if approved})
+
+
+@receiver(post_delete, sender=PropertyReview)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    """تحديث تقييمات العقار عند حذف تقييم معتمد"""
+    # Reviews deleted along with their property leave nothing to update
+    if instance.is_approved and not isinstance(origin, Property):
+        refresh_rating_stats({instance.property_id})
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=Amenity)
+@receiver(post_delete, sender=Amenity)
+def drop_facets(sender, **kwargs):
+    """إبطال أعداد الفلاتر المخزنة عند تغيير العقارات أو المرافق"""
+    invalidate_facets()
+
+
+@receiver(m2m_changed, sender=Property.amenities.through)
+def amenities_changed(sender, action, **kwargs):
+    """إبطال أعداد الفلاتر المخزنة عند تعديل مرافق عقار"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_facets()
+
+
+@receiver(m2m_changed, sender=Property.amenities.through)
+def amenity_mask_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """إعادة حساب bitset المرافق للعقارات التي تغيرت مرافقها"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_amenity_masks({instance.pk})
+        return
+    # amenity.property_set.…: pk_set holds property ids, except for clear()
+    if action == 'pre_clear':
+        instance._cleared_property_ids = set(instance.property_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh_amenity_masks(getattr(instance, '_cleared_property_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        refresh_amenity_masks(pk_set or ())
+
+
+@receiver(pre_delete, sender=Amenity)
+def remember_amenity_properties(sender, instance, **kwargs):
+    instance._cleared_property_ids = set(instance.property_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Amenity)
+def amenity_deleted(sender, instance, **kwargs):
+    """إزالة المرفق المحذوف من bitset العقارات التي كانت تملكه"""
+    refresh_amenity_masks(getattr(instance, '_cleared_property_ids', ()))
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def drop_property_searches(sender, instance, **kwargs):
+    """إبطال نتائج البحث المخزنة لمدينة العقار (قبل التعديل وبعده) وللبحث العام"""
+    invalidate_search_cache({getattr(instance, '_loaded_city', None), instance.city})
+    instance._loaded_city = instance.city
+
+
+@receiver(post_save, sender=PropertyReview)
+@receiver(post_delete, sender=PropertyReview)
+def drop_review_searches(sender, instance, **kwargs):
+    """إبطال نتائج البحث المخزنة عند إضافة أو تعديل أو حذف تقييم"""
+    invalidate_properties_search_cache({instance.property_id})
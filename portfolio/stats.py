@@ -0,0 +1,213 @@
+"""
+Site statistics shown on the home page, and booking statistics of owners.
+
+site_stats() returns the counters from the cache. When they are missing they are computed
+in one query (scalar subqueries, compute_site_stats()) by a single worker: the first to
+take the recompute lock. The others serve the last computed values meanwhile, or wait
+briefly for them on a cold cache, so an expiry under load costs one recomputation.
+
+Each counter is its own cache key, so booking status transitions adjust them in place with
+cache.incr/decr once the transaction commits (booking_status_changed(), called from
+booking/signals.py). Property saves and deletes drop the counters instead. Changes that
+bypass the model signals show up after SITE_STATS_CACHE_SECONDS.
+
+owner_stats() gives the property and booking counters and confirmed revenue of one owner
+(or of the whole site) from a single conditional aggregate, and property_booking_stats()
+those of one property. Both are cached for OWNER_STATS_CACHE_SECONDS and dropped when a
+booking of the owner or property changes (drop_booking_stats()).
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Func, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from booking.models import Booking
+
+from .models import Property
+
+STATS_KEY = 'site-stats:{}'
+OWNER_STATS_KEY = 'owner-stats:{}'
+PROPERTY_STATS_KEY = 'property-booking-stats:{}'
+STALE_KEY = 'site-stats:last'
+LOCK_KEY = 'site-stats:lock'
+COUNTERS = ('total_properties', 'verified_properties', 'total_bookings', 'happy_customers')
+
+CONFIRMED = 'confirmed'
+
+# Longest a recomputation may hold the lock, and how long others wait on a cold cache
+LOCK_SECONDS = 30
+WAIT_SECONDS = 2
+WAIT_STEP = 0.05
+
+
+class ScalarCount(Func):
+    """COUNT() without GROUP BY, so a queryset compiles to a one-row scalar subquery."""
+
+    function = 'COUNT'
+
+    def __init__(self, expression, distinct=False):
+        if distinct:
+            super().__init__(expression, template='%(function)s(DISTINCT %(expressions)s)')
+        else:
+            super().__init__(expression)
+
+
+def compute_site_stats():
+    """All counters from the database in one query."""
+    confirmed = Booking.objects.filter(status=CONFIRMED)
+    subqueries = {
+        'total_properties': Property.objects.annotate(n=ScalarCount(F('pk'))),
+        'verified_properties': Property.objects.filter(is_verified_by_platform=True).annotate(n=ScalarCount(F('pk'))),
+        'total_bookings': confirmed.annotate(n=ScalarCount(F('pk'))),
+        'happy_customers': confirmed.annotate(n=ScalarCount(F('customer_phone'), distinct=True)),
+    }
+    parts, params = [], []
+    for name in COUNTERS:
+        sql, part_params = subqueries[name].order_by().values('n').query.sql_with_params()
+        parts.append(f'({sql})')
+        params.extend(part_params)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(parts)}", params)
+        return dict(zip(COUNTERS, cursor.fetchone()))
+
+
+def cached_stats():
+    values = cache.get_many([STATS_KEY.format(name) for name in COUNTERS])
+    if len(values) < len(COUNTERS):
+        return None
+    return {name: values[STATS_KEY.format(name)] for name in COUNTERS}
+
+
+def store_stats(stats):
+    timeout = getattr(settings, 'SITE_STATS_CACHE_SECONDS', 600)
+    cache.set_many({STATS_KEY.format(name): value for name, value in stats.items()}, timeout)
+    cache.set(STALE_KEY, stats, None)
+
+
+def site_stats():
+    """The home page counters: total and verified properties, confirmed bookings and distinct customers."""
+    stats = cached_stats()
+    if stats is not None:
+        return stats
+
+    if cache.add(LOCK_KEY, 1, LOCK_SECONDS):
+        try:
+            stats = compute_site_stats()
+            store_stats(stats)
+        finally:
+            cache.delete(LOCK_KEY)
+        return stats
+
+    # Someone else is recomputing: the previous values will do, or wait for theirs
+    stale = cache.get(STALE_KEY)
+    if stale is not None:
+        return stale
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        stats = cached_stats()
+        if stats is not None:
+            return stats
+    return compute_site_stats()
+
+
+def drop_site_stats():
+    cache.delete_many([STATS_KEY.format(name) for name in COUNTERS])
+
+
+def adjust(name, delta):
+    try:
+        cache.incr(STATS_KEY.format(name), delta)
+    except ValueError:
+        # Not cached: the next site_stats() computes it
+        pass
+
+
+def booking_status_changed(booking, deleted=False):
+    """Adjust the booking counters for a saved or deleted booking once the transaction commits."""
+    was_confirmed = getattr(booking, '_loaded_status', None) == CONFIRMED
+    old_phone = getattr(booking, '_loaded_phone', None)
+    is_confirmed = not deleted and booking.status == CONFIRMED
+    phone = booking.customer_phone
+    if was_confirmed == is_confirmed and (not is_confirmed or old_phone == phone):
+        return
+
+    def apply():
+        if cache.get(STATS_KEY.format('total_bookings')) is None:
+            return
+        confirmed = Booking.objects.filter(status=CONFIRMED)
+        if was_confirmed:
+            adjust('total_bookings', -1)
+            if not confirmed.filter(customer_phone=old_phone).exists():
+                adjust('happy_customers', -1)
+        if is_confirmed:
+            adjust('total_bookings', 1)
+            # This booking is the customer's only confirmed one: a new customer
+            if confirmed.filter(customer_phone=phone)[:2].count() == 1:
+                adjust('happy_customers', 1)
+
+    transaction.on_commit(apply)
+
+
+def booking_aggregates(prefix=''):
+    """Conditional aggregates of the bookings reached through `prefix` (e.g. 'booking__')."""
+    def status_q(status):
+        return Q(**{f'{prefix}status': status})
+
+    pk = f'{prefix}pk'
+    return {
+        'bookings_count': Count(pk),
+        'pending_count': Count(pk, filter=status_q('pending')),
+        'confirmed_count': Count(pk, filter=status_q(CONFIRMED)),
+        'cancelled_count': Count(pk, filter=status_q('cancelled')),
+        'total_revenue': Coalesce(
+            Sum(f'{prefix}total_price', filter=status_q(CONFIRMED)), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    }
+
+
+def compute_owner_stats(owner_id=None):
+    """properties_count plus the booking counters and confirmed revenue in one query; None for the whole site."""
+    if owner_id is None:
+        stats = Booking.objects.aggregate(**booking_aggregates())
+        stats['properties_count'] = None
+        return stats
+    # Properties LEFT JOIN their bookings: one row per booking, or per property without any
+    return Property.objects.filter(owner_id=owner_id).aggregate(
+        properties_count=Count('pk', distinct=True), **booking_aggregates('booking__'),
+    )
+
+
+def cached(key, compute):
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute()
+        cache.set(key, stats, getattr(settings, 'OWNER_STATS_CACHE_SECONDS', 300))
+    return stats
+
+
+def owner_stats(owner=None):
+    """Counters of the properties and bookings of `owner` (a user or an id), or of the whole site."""
+    owner_id = getattr(owner, 'pk', owner)
+    return cached(OWNER_STATS_KEY.format(owner_id or 'all'), lambda: compute_owner_stats(owner_id))
+
+
+def property_booking_stats(property_id):
+    """Booking counters and confirmed revenue of one property."""
+    return cached(
+        PROPERTY_STATS_KEY.format(property_id),
+        lambda: Booking.objects.filter(property_id=property_id).aggregate(**booking_aggregates()),
+    )
+
+
+def drop_booking_stats(property_ids=(), owner_ids=()):
+    """Forget the cached stats of the given properties and owners, and of the whole site, once the transaction commits."""
+    keys = [OWNER_STATS_KEY.format('all')]
+    keys += [PROPERTY_STATS_KEY.format(pk) for pk in property_ids if pk is not None]
+    keys += [OWNER_STATS_KEY.format(pk) for pk in owner_ids if pk is not None]
+    transaction.on_commit(lambda: cache.delete_many(keys))
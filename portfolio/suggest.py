@@ -0,0 +1,214 @@
+"""
+In-process prefix index for search box suggestions.
+
+Property names, cities and property types are normalized like the search text
+(portfolio/text.py) and kept in one sorted list of keys, so the suggestions for a prefix
+are a bisect plus a short forward scan, without a database query. A name is indexed from
+each of its words ("pool chalet" is found by "cha" too).
+
+The index is built from the database on first use and updated in place by the Property
+post_save/post_delete signals (portfolio/signals.py). Every change also bumps a version
+stamp in the Django cache; a worker that sees a stamp it did not apply rebuilds its copy on
+the next lookup, so use a cache backend all workers share. At most SEARCH_SUGGEST_MAX_ENTRIES
+keys are held: when full, names of the newest properties are kept and cities and types
+are always indexed.
+"""
+import bisect
+import re
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Property
+from .text import normalize
+
+VERSION_KEY = 'search-suggest:version'
+
+# Kinds in the order suggestions are listed
+PROPERTY_TYPE, CITY, PROPERTY = 0, 1, 2
+KIND_NAMES = {PROPERTY_TYPE: 'property_type', CITY: 'city', PROPERTY: 'property'}
+KINDS = {name: kind for kind, name in KIND_NAMES.items()}
+
+# Arabic names of the property types, indexed next to their labels
+PROPERTY_TYPE_NAMES = {'chalet': 'شاليه', 'garden': 'حديقة', 'istiraha': 'استراحة'}
+
+# Words of a name indexed as starting points
+MAX_NAME_WORDS = 8
+
+# Keys looked at per lookup before ranking, as a multiple of the limit
+SCAN_FACTOR = 5
+
+
+def suggest_key(text):
+    """`text` as it is compared against the index: normalized words separated by single spaces."""
+    return ' '.join(re.findall(r'\w+', normalize(text)))
+
+
+def name_keys(name):
+    words = suggest_key(name).split(' ')[:MAX_NAME_WORDS]
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class SuggestIndex:
+    """Sorted (key, kind, ref) tuples: ref is a property type value, a city or a property id."""
+
+    def __init__(self):
+        self._keys = None
+        self._properties = {}
+        self._cities = Counter()
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'SEARCH_SUGGEST_MAX_ENTRIES', 50000)
+
+    def suggest(self, query, limit=10):
+        """Up to `limit` suggestions for the prefix `query`: property types, then cities, then properties."""
+        prefix = suggest_key(query)
+        if not prefix:
+            return []
+        while True:
+            self._ensure_current()
+            with self._lock:
+                if self._keys is not None:
+                    return self._lookup(prefix, limit)
+            # Dropped by a concurrent _bump() since the check: rebuild and look again
+
+    def _lookup(self, prefix, limit):
+        """The suggestions for `prefix`; the caller holds the lock and the index is built."""
+        keys = self._keys
+        found = {}
+        index = bisect.bisect_left(keys, (prefix,))
+        end = min(len(keys), index + limit * SCAN_FACTOR)
+        while index < end and keys[index][0].startswith(prefix):
+            _, kind, ref = keys[index]
+            found.setdefault((kind, ref), None)
+            index += 1
+        suggestions = sorted((self._describe(kind, ref) for kind, ref in found), key=self._rank)
+        return suggestions[:limit]
+
+    def update(self, property_obj):
+        """Re-index one saved property once the transaction commits, here and (through the version) elsewhere."""
+        pk, name, slug, city = property_obj.pk, property_obj.name, property_obj.slug, property_obj.city
+
+        def apply():
+            with self._lock:
+                if self._keys is not None:
+                    self._remove(pk)
+                    self._add(pk, name, slug, city)
+            self._bump()
+
+        transaction.on_commit(apply)
+
+    def remove(self, property_id):
+        def apply():
+            with self._lock:
+                if self._keys is not None:
+                    self._remove(property_id)
+            self._bump()
+
+        transaction.on_commit(apply)
+
+    def clear(self):
+        with self._lock:
+            self._keys = None
+            self._properties = {}
+            self._cities = Counter()
+            self._version = None
+
+    def __len__(self):
+        return len(self._keys or ())
+
+    @staticmethod
+    def _rank(suggestion):
+        # Types, then cities with the most properties, then properties; alphabetical within each
+        return KINDS[suggestion['type']], -suggestion.get('count', 0), suggestion['label']
+
+    def _describe(self, kind, ref):
+        if kind == PROPERTY_TYPE:
+            return {'type': KIND_NAMES[kind], 'value': ref, 'label': PROPERTY_TYPE_NAMES.get(ref, ref)}
+        if kind == CITY:
+            return {'type': KIND_NAMES[kind], 'value': ref, 'label': ref, 'count': self._cities[ref]}
+        name, slug, _ = self._properties[ref]
+        return {'type': KIND_NAMES[kind], 'id': ref, 'slug': slug, 'label': name}
+
+    def _ensure_current(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 0, None)
+            version = cache.get(VERSION_KEY, 0)
+        with self._lock:
+            if self._keys is not None and self._version == version:
+                return
+        self._build(version)
+
+    def _bump(self):
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = 1
+            cache.set(VERSION_KEY, version, None)
+        with self._lock:
+            # Our own change is already applied; a missed one from another worker is not
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+            else:
+                self._keys = None
+
+    def _build(self, version):
+        rows = Property.objects.order_by('-created_at').values_list('pk', 'name', 'slug', 'city')
+        with self._lock:
+            self._keys, self._properties, self._cities = [], {}, Counter()
+            for value, label in Property.PROPERTY_TYPES:
+                for text in {value, label, PROPERTY_TYPE_NAMES.get(value, value)}:
+                    self._keys.append((suggest_key(text), PROPERTY_TYPE, value))
+            entries = []
+            for pk, name, slug, city in rows.iterator(chunk_size=2000):
+                entries.extend(self._entries(pk, name, slug, city, room=self.max_entries - len(entries) - len(self._keys)))
+            self._keys.extend(entries)
+            self._keys.sort()
+            self._version = version
+
+    def _entries(self, pk, name, slug, city, room):
+        """Record one property and return its new keys; its name is left out when there is no `room`."""
+        entries = []
+        city = (city or '').strip()
+        if city:
+            self._cities[city] += 1
+            if self._cities[city] == 1:
+                entries.append((suggest_key(city), CITY, city))
+        keys = name_keys(name)
+        if len(keys) <= room - len(entries):
+            entries.extend((key, PROPERTY, pk) for key in keys)
+            self._properties[pk] = (name, slug, city)
+        else:
+            # Only counted towards its city
+            self._properties[pk] = (None, None, city)
+        return entries
+
+    def _add(self, pk, name, slug, city):
+        for entry in self._entries(pk, name, slug, city, room=self.max_entries - len(self._keys)):
+            bisect.insort(self._keys, entry)
+
+    def _remove(self, pk):
+        record = self._properties.pop(pk, None)
+        if record is None:
+            return
+        name, _, city = record
+        dropped = [(key, PROPERTY, pk) for key in name_keys(name)]
+        if city:
+            self._cities[city] -= 1
+            if self._cities[city] <= 0:
+                del self._cities[city]
+                dropped.append((suggest_key(city), CITY, city))
+        for entry in dropped:
+            index = bisect.bisect_left(self._keys, entry)
+            if index < len(self._keys) and self._keys[index] == entry:
+                del self._keys[index]
+
+
+suggest_index = SuggestIndex()
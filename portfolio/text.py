@@ -0,0 +1,39 @@
+"""
+Arabic text normalization for search.
+
+Users spell the same word several ways: with or without harakat and tatweel, with any
+of the alef forms, with a final ya or alef maqsura, with ta marbuta or ha. normalize()
+folds those variants to one spelling. It is applied both to the text stored for search
+(Property.search_text and the full-text index) and to incoming queries, so they match.
+"""
+import re
+
+# Harakat, Quranic annotation marks and the superscript alef
+DIACRITICS_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+TATWEEL = '\u0640'
+FOLDS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي',
+    'ة': 'ه',
+})
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Characters of the description kept in the search text
+SUMMARY_CHARS = 1000
+
+
+def normalize(text):
+    """Fold Arabic spelling variants and case, drop diacritics and collapse whitespace."""
+    if not text:
+        return ''
+    text = DIACRITICS_RE.sub('', text).replace(TATWEEL, '').translate(FOLDS).casefold()
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def search_parts(name, city, description):
+    """Normalized (name, city, description summary) of a property, as indexed for search."""
+    return normalize(name), normalize(city), normalize((description or '')[:SUMMARY_CHARS])
+
+
+def search_text(name, city, description):
+    return ' '.join(part for part in search_parts(name, city, description) if part)
@@ -7,10 +7,17 @@ from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.urls import reverse, reverse_lazy
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum, Exists, OuterRef, Avg
+from django.db.models import Q
+from django.utils import timezone
 import math
+from datetime import datetime
+from urllib.parse import urlencode
 from .models import Property, Amenity, PropertyReview, GalleryImage
+from .search import search_backend
+from .search_cache import cached_search
+from .stats import owner_stats, property_booking_stats, site_stats
 
 
 class OwnerRequiredMixin(LoginRequiredMixin):
@@ -21,7 +28,8 @@ class OwnerRequiredMixin(LoginRequiredMixin):
         messages.error(request, 'لا تملك صلاحية الوصول إلى لوحة المالك.')
         return redirect('portfolio:home')
 from .forms import ContactForm, PropertySearchForm, PropertyReviewForm, OwnerPropertyForm
-from booking.models import Booking, PaymentProvider
+from booking.models import Booking, PaymentProvider, PropertyDayOccupancy
+from booking.services import HALF_DAY_PERIODS
 
 
 class HomePageView(TemplateView):
@@ -33,13 +41,8 @@ class HomePageView(TemplateView):
         # عرض أول 6 عقارات موثقة
         context['featured_properties'] = Property.objects.filter(is_verified_by_platform=True)[:6]
         
-        # إحصائيات الموقع
-        context['stats'] = {
-            'total_properties': Property.objects.count(),
-            'verified_properties': Property.objects.filter(is_verified_by_platform=True).count(),
-            'total_bookings': Booking.objects.filter(status='confirmed').count(),
-            'happy_customers': Booking.objects.filter(status='confirmed').values('customer_phone').distinct().count(),
-        }
+        # إحصائيات الموقع (مخزنة مؤقتاً، portfolio/stats.py)
+        context['stats'] = site_stats()
         return context
 
 
@@ -79,15 +82,8 @@ class OwnerDashboardView(OwnerRequiredMixin, TemplateView):
         user = self.request.user
         props = Property.objects.filter(owner=user)
         bookings = Booking.objects.filter(property__owner=user)
-        stats = {
-            'properties_count': props.count(),
-            'bookings_count': bookings.count(),
-            'pending_count': bookings.filter(status='pending').count(),
-            'confirmed_count': bookings.filter(status='confirmed').count(),
-            'cancelled_count': bookings.filter(status='cancelled').count(),
-            'total_revenue': bookings.filter(status='confirmed').aggregate(total=Sum('total_price'))['total'] or 0,
-        }
-        context['stats'] = stats
+        # Counters and revenue in one cached aggregate (portfolio/stats.py)
+        context['stats'] = owner_stats(user)
         context['recent_bookings'] = bookings.select_related('property').order_by('-created_at')[:10]
         context['properties'] = props.order_by('-created_at')[:10]
         return context
@@ -229,19 +225,20 @@ class OwnerPropertyDetailView(OwnerRequiredMixin, DetailView):
     slug_url_kwarg = 'slug'
 
     def get_queryset(self):
-        return Property.objects.filter(owner=self.request.user).prefetch_related('amenities', 'gallery_images', 'reviews', 'booking_set')
+        return Property.objects.filter(owner=self.request.user).prefetch_related('amenities', 'gallery_images')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         prop = self.object
-        context['total_bookings'] = prop.booking_set.count()
-        context['confirmed_bookings'] = prop.booking_set.filter(status='confirmed').count()
-        context['pending_bookings'] = prop.booking_set.filter(status='pending').count()
+        booking_stats = property_booking_stats(prop.pk)
+        context['total_bookings'] = booking_stats['bookings_count']
+        context['confirmed_bookings'] = booking_stats['confirmed_count']
+        context['pending_bookings'] = booking_stats['pending_count']
         
-        # Reviews stats
-        approved_reviews = prop.reviews.filter(is_approved=True)
-        context['reviews_count'] = approved_reviews.count()
-        context['avg_rating'] = approved_reviews.aggregate(avg=Avg('rating'))['avg']
+        # Reviews stats (stored on the property)
+        context['reviews_count'] = prop.reviews_count
+        context['avg_rating'] = prop.avg_rating
+        context['rating_histogram'] = prop.rating_histogram
         
         return context
 
@@ -256,8 +253,13 @@ def owner_booking_approve(request, pk):
     booking = get_object_or_404(Booking.objects.select_related('property'), pk=pk, property__owner=request.user)
     if booking.status != 'confirmed':
         booking.status = 'confirmed'
-        booking.save(update_fields=['status', 'updated_at'])
-        messages.success(request, 'تم اعتماد الحجز بنجاح.')
+        try:
+            booking.save(update_fields=['status', 'updated_at'])
+        except ValidationError:
+            # A cancelled booking's window may have been booked by someone else since
+            messages.error(request, 'تعذر اعتماد الحجز: الوقت المحدد لم يعد متاحاً.')
+        else:
+            messages.success(request, 'تم اعتماد الحجز بنجاح.')
     return redirect('portfolio:owner_bookings')
 
 
@@ -364,10 +366,10 @@ class PropertyListView(ListView):
         if form.is_valid():
             cd = form.cleaned_data
 
-            # Search by name/description
+            # Full-text search (portfolio/search.py), ranked by relevance
             search = cd.get('search')
             if search:
-                queryset = queryset.filter(Q(name__icontains=search) | Q(description__icontains=search))
+                queryset = search_backend().search(queryset, search)
 
             # City filter
             city = cd.get('city')
@@ -382,40 +384,61 @@ class PropertyListView(ListView):
             # Date availability filter
             booking_date = cd.get('booking_date')
             if booking_date:
-                from datetime import datetime, time
-                start = timezone.make_aware(datetime.combine(booking_date, time(8, 0)))
-                end = timezone.make_aware(datetime.combine(booking_date, time(20, 0)))
-                overlap = Booking.objects.filter(property=OuterRef('pk'), status__in=['pending', 'confirmed']).filter(
-                    start_datetime__lt=end, end_datetime__gt=start
+                # Busy between 08:00 and 20:00 = morning or evening period taken (PropertyDayOccupancy)
+                busy = PropertyDayOccupancy.objects.filter(date=booking_date).filter(
+                    Q(morning_busy=True) | Q(evening_busy=True)
                 )
-                queryset = queryset.annotate(has_overlap=Exists(overlap)).filter(has_overlap=False)
+                queryset = queryset.exclude(pk__in=busy.values('property_id'))
 
             # Verified only filter
             verified_only = cd.get('verified_only')
             if verified_only:
                 queryset = queryset.filter(is_verified_by_platform=True)
 
-            # Default ordering by newest
-            queryset = queryset.annotate(
-                avg_rating=Avg('reviews__rating', filter=Q(reviews__is_approved=True)),
-                reviews_count=Count('reviews', filter=Q(reviews__is_approved=True))
-            ).order_by('-created_at')
+            # Most relevant first when searching, otherwise newest first
+            ordering = ['-search_rank', '-created_at'] if 'search_rank' in queryset.query.annotations else ['-created_at']
+            queryset = queryset.order_by(*ordering)
+
+            # Ordered ids from the search cache; the page only loads its own rows
+            return cached_search(queryset, 'html', cd, city=city)
         else:
-            queryset = queryset.annotate(
-                avg_rating=Avg('reviews__rating', filter=Q(reviews__is_approved=True)),
-                reviews_count=Count('reviews', filter=Q(reviews__is_approved=True))
-            ).order_by('-created_at')
+            queryset = queryset.order_by('-created_at')
 
+        # avg_rating / reviews_count are stored on Property (portfolio/ratings.py)
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = getattr(self, '_form', PropertySearchForm(self.request.GET))
         context['current_search'] = self.request.GET.dict()
-        context['properties_with_location'] = self.get_queryset().exclude(latitude__isnull=True, longitude__isnull=True)
         context['current_view'] = self.request.GET.get('view', 'list')
+        if context['current_view'] == 'map':
+            # The map loads its points from the API for the visible area, with the same filters
+            context['map_url'] = reverse('property-map')
+            context['map_query'] = urlencode(self.map_filters())
         return context
 
+    def map_filters(self):
+        """فلاتر البحث الحالية بأسماء معاملات واجهة الخريطة (api/properties/map/)"""
+        form = getattr(self, '_form', None)
+        if form is None or not form.is_valid():
+            return {}
+        cd = form.cleaned_data
+        params = {}
+        if cd.get('search'):
+            params['search'] = cd['search']
+        if cd.get('city'):
+            params['city'] = cd['city']
+        if cd.get('guests'):
+            params['guests'] = cd['guests']
+        if cd.get('verified_only'):
+            params['is_verified_by_platform'] = 'true'
+        if cd.get('booking_date'):
+            start, end = HALF_DAY_PERIODS[0][1], HALF_DAY_PERIODS[-1][2]
+            params['available_from'] = timezone.make_aware(datetime.combine(cd['booking_date'], start)).isoformat()
+            params['available_to'] = timezone.make_aware(datetime.combine(cd['booking_date'], end)).isoformat()
+        return params
+
 
 class PropertyDetailView(DetailView):
     model = Property
@@ -430,10 +453,10 @@ class PropertyDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         prop = self.object
-        approved = prop.reviews.filter(is_approved=True)
-        context['reviews'] = approved.order_by('-created_at')[:20]
-        context['avg_rating'] = approved.aggregate(avg=Avg('rating'))['avg']
-        context['reviews_count'] = approved.count()
+        context['reviews'] = prop.reviews.filter(is_approved=True).order_by('-created_at')[:20]
+        context['avg_rating'] = prop.avg_rating
+        context['reviews_count'] = prop.reviews_count
+        context['rating_histogram'] = prop.rating_histogram
         user_review = None
         if self.request.user.is_authenticated:
             user_review = PropertyReview.objects.filter(property=prop, user=self.request.user).first()